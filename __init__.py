@@ -1 +1,10 @@
-from . import agent
\ No newline at end of file
+# `agent` is loaded on first access rather than on package import: CPU-pool workers
+# import `<package>.renderers`, and must not build the whole agent graph to do so. ADK's
+# loader falls back to importing `<package>.agent` for `root_agent`.
+import importlib
+
+
+def __getattr__(name):
+    if name == "agent":
+        return importlib.import_module(f"{__name__}.agent")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,12 +1,39 @@
+import time
+_MODULE_LOAD_STARTED = time.perf_counter()
+
 import asyncio
+import atexit
+import base64
+import functools
+import hashlib
+import importlib
+import inspect
+import io
 import os
-import uuid
+import queue
+import sys
 import json
+import multiprocessing
 import re
+import resource
+import shutil
+import sqlite3
+import statistics
+import struct
+import subprocess
+import threading
 import traceback
+import unicodedata
+import wave
+import zipfile
+from array import array
+from collections import Counter, OrderedDict
+from concurrent.futures import FIRST_COMPLETED, CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures import wait as futures_wait
+from datetime import timedelta
+from types import SimpleNamespace
 # For Deploy
-import vertexai
-from vertexai import agent_engines
 from dotenv import load_dotenv
 
 # For Agents
@@ -15,18 +42,48 @@ from google.adk.tools import FunctionTool
 from google.adk.agents import SequentialAgent
 from google.genai import types
 from google.adk.tools import VertexAiSearchTool
-from vertexai.preview.vision_models import ImageGenerationModel
+
+# CPU-pool work lives in a side-effect-free module, so pool workers do not import this one.
+try:
+    from .renderers import VisualAidProcessor, WorksheetRenderer, process_visual_aid, render_pdf
+except ImportError:  # agent.py loaded as a top-level module (tests, benchmarks, app/)
+    from renderers import VisualAidProcessor, WorksheetRenderer, process_visual_aid, render_pdf
+
+# Heavy SDKs (vertexai, google.cloud.speech / texttospeech / storage, reportlab) are
+# NOT imported here. They are loaded by `_lazy_import()` the first time a tool needs
+# them, so a replica that scales up from zero only pays for what its sessions use.
+
+_STARTUP_TIMINGS = {"agent_module_imports": time.perf_counter() - _MODULE_LOAD_STARTED}
+_LAZY_IMPORT_TIMINGS = {}
+_LAZY_IMPORT_LOCK = threading.Lock()
 
 
-from difflib import SequenceMatcher
-from google.cloud import speech
+def _lazy_import(module_name):
+    """Imports `module_name` on first use and records how long the first load took."""
+    if module_name in _LAZY_IMPORT_TIMINGS:
+        return sys.modules[module_name]
+    with _LAZY_IMPORT_LOCK:
+        if module_name in _LAZY_IMPORT_TIMINGS:
+            return sys.modules[module_name]
+        started = time.perf_counter()
+        module = importlib.import_module(module_name)
+        _LAZY_IMPORT_TIMINGS[module_name] = time.perf_counter() - started
+        if os.getenv("SAHAYAK_STARTUP_TIMING"):
+            print(f"Lazy import: {module_name} took {_LAZY_IMPORT_TIMINGS[module_name] * 1000:.1f} ms")
+    return module
+
+
+def startup_report():
+    """
+    Returns the cold-start budget in milliseconds: time spent loading this module
+    (split into phases) and the first-use cost of every lazily imported SDK.
+    For a per-module breakdown of the eager imports run `python -X importtime -c "import agent"`.
+    """
+    return {
+        "module_phases_ms": {k: round(v * 1000, 1) for k, v in _STARTUP_TIMINGS.items()},
+        "lazy_imports_ms": {k: round(v * 1000, 1) for k, v in _LAZY_IMPORT_TIMINGS.items()},
+    }
 
-from google.cloud import texttospeech, storage
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
 
 # --- Configuration Constants ---
 PROJECT_ID = "###################" 
@@ -37,79 +94,1396 @@ GEMINI_2_PRO = "gemini-2.5-pro"
 AUDIO_BUCKET_NAME = "###################"
 OUTPUT_BUCKET_NAME = "###################"
 APP_NAME="Agent App"
+IMAGEN_MODEL = "imagen-4.0-ultra-generate-preview-06-06"
+# "gcs" (default) or "local"; the local backend writes artifacts under LOCAL_ARTIFACT_DIR for tests.
+ARTIFACT_BACKEND = os.getenv("SAHAYAK_ARTIFACT_BACKEND", "gcs")
+LOCAL_ARTIFACT_DIR = os.getenv("SAHAYAK_LOCAL_ARTIFACT_DIR", "/tmp/sahayak-artifacts")
+# Local directory for persistent cache indexes (SQLite). Set to "" to keep caches in memory only.
+CACHE_DIR = os.getenv("SAHAYAK_CACHE_DIR", "/tmp/sahayak-cache")
+# SQLite file holding the reading-assessment history (see FluencyStore). It must be on
+# durable storage (e.g. a mounted volume): Agent Engine replicas scale to zero and /tmp
+# goes with them. Unset or "" turns the history off; assessments still work.
+FLUENCY_DB_PATH = os.getenv("SAHAYAK_FLUENCY_DB", "")
 
 # For Deploy-----------------------------------------------------
 load_dotenv()
 
-vertexai.init(
-    project=os.getenv("GOOGLE_CLOUD_PROJECT"),
-    location=os.getenv("GOOGLE_CLOUD_LOCATION"),
-    staging_bucket="###################",
-)
+_VERTEXAI_INIT_LOCK = threading.Lock()
+_vertexai_initialized = False
+
+
+def ensure_vertexai_initialized():
+    """Runs `vertexai.init(...)` once, the first time something actually needs Vertex AI."""
+    global _vertexai_initialized
+    if _vertexai_initialized:
+        return
+    with _VERTEXAI_INIT_LOCK:
+        if _vertexai_initialized:
+            return
+        vertexai = _lazy_import("vertexai")
+        started = time.perf_counter()
+        vertexai.init(
+            project=os.getenv("GOOGLE_CLOUD_PROJECT"),
+            location=os.getenv("GOOGLE_CLOUD_LOCATION"),
+            staging_bucket="###################",
+        )
+        _STARTUP_TIMINGS["vertexai_init"] = time.perf_counter() - started
+        _vertexai_initialized = True
 # --------------------------------------------------------------
+
+# --- Shared Client Pool ---
+# Google clients hold a gRPC channel / HTTP session plus credentials, so they are
+# expensive to build and safe to share. Every tool asks the pool for its client
+# instead of constructing a new one per call.
+
+class ClientPool:
+    """
+    Process-wide registry that creates each client once, on first use, and hands the
+    same instance to every caller afterwards. Factories are registered by name; tests
+    can swap in local fakes with `override()`.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._clients = {}
+        self._locks = {}
+        self._registry_lock = threading.Lock()
+        self._stats = {}
+
+    def register(self, name, factory):
+        """Registers (or replaces) the factory used to build the client called `name`."""
+        with self._registry_lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._stats.setdefault(name, {"created": 0, "reused": 0})
+
+    def get(self, name):
+        """Returns the shared client for `name`, building it on the first call."""
+        client = self._clients.get(name)
+        if client is not None:
+            self._count(name, "reused")
+            return client
+        if name not in self._factories:
+            raise KeyError(f"No client factory registered for '{name}'")
+        # One lock per client so a slow Imagen load never blocks a storage lookup.
+        with self._locks[name]:
+            client = self._clients.get(name)
+            if client is not None:
+                self._count(name, "reused")
+                return client
+            print(f"ClientPool: creating shared '{name}' client.")
+            client = self._factories[name]()
+            self._clients[name] = client
+            self._count(name, "created")
+            return client
+
+    def override(self, name, client):
+        """Installs a ready-made client (e.g. a local fake) in place of the real one."""
+        with self._registry_lock:
+            self._locks.setdefault(name, threading.Lock())
+            self._stats.setdefault(name, {"created": 0, "reused": 0})
+            self._clients[name] = client
+
+    def reset(self, name=None):
+        """Drops cached clients so the next `get()` rebuilds them from their factory."""
+        with self._registry_lock:
+            if name is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(name, None)
+
+    def stats(self):
+        """Returns a snapshot of how often each client was created versus reused."""
+        with self._registry_lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+    def _count(self, name, field):
+        with self._registry_lock:
+            self._stats[name][field] += 1
+
+
+def _create_imagen_client():
+    # google-genai returns each image's bytes as a public field (Image.image_bytes), and
+    # reads the same project/location settings as vertexai.init.
+    genai = _lazy_import("google.genai")
+    return genai.Client(vertexai=True, project=os.getenv("GOOGLE_CLOUD_PROJECT"), location=os.getenv("GOOGLE_CLOUD_LOCATION"))
+
+
+CLIENTS = ClientPool()
+CLIENTS.register("storage", lambda: _lazy_import("google.cloud.storage").Client(project=PROJECT_ID))
+CLIENTS.register("speech", lambda: _lazy_import("google.cloud.speech").SpeechClient())
+CLIENTS.register("tts", lambda: _lazy_import("google.cloud.texttospeech").TextToSpeechClient())
+CLIENTS.register("tts_long", lambda: _lazy_import("google.cloud.texttospeech").TextToSpeechLongAudioSynthesizeClient())
+CLIENTS.register("imagen", _create_imagen_client)
+CLIENTS.register("discoveryengine", lambda: _lazy_import("google.cloud.discoveryengine_v1").SearchServiceClient())
+
+
+# --- Worker Pools ---
+# CPU-bound work (PDF layout, image processing) is GIL-limited, so it goes to a process
+# pool; network I/O (uploads, polling) goes to a shared, bounded thread pool. Blocking
+# tool bodies run on their own bounded pool (see async_tool), so a tool that fans out
+# onto the I/O pool can never wait on itself. Work a tool hands off and does not wait
+# for to the end (the rest of a chunked story) runs on the background pool, which in
+# turn only waits on the I/O pool: tool -> background -> I/O, never back up the chain.
+
+CPU_WORKERS = int(os.getenv("SAHAYAK_CPU_WORKERS", os.cpu_count() or 2))
+IO_WORKERS = int(os.getenv("SAHAYAK_IO_WORKERS", 16))
+TOOL_WORKERS = int(os.getenv("SAHAYAK_TOOL_WORKERS", 32))
+BACKGROUND_WORKERS = int(os.getenv("SAHAYAK_BACKGROUND_WORKERS", 8))
+_POOL_LOCK = threading.Lock()
+_cpu_pool = None
+_io_pool = None
+_tool_pool = None
+_background_pool = None
+
+
+def get_cpu_pool():
+    """Returns the shared process pool, starting it on first use."""
+    global _cpu_pool
+    with _POOL_LOCK:
+        if _cpu_pool is None:
+            # forkserver avoids forking a parent that already holds gRPC threads.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            _cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context(method))
+        return _cpu_pool
+
+
+def get_io_pool():
+    """Returns the shared thread pool used for concurrent network calls."""
+    global _io_pool
+    with _POOL_LOCK:
+        if _io_pool is None:
+            _io_pool = ThreadPoolExecutor(max_workers=IO_WORKERS, thread_name_prefix="sahayak-io")
+        return _io_pool
+
+
+def get_tool_pool():
+    """Returns the bounded thread pool that runs blocking tool bodies for async tools."""
+    global _tool_pool
+    with _POOL_LOCK:
+        if _tool_pool is None:
+            _tool_pool = ThreadPoolExecutor(max_workers=TOOL_WORKERS, thread_name_prefix="sahayak-tool")
+        return _tool_pool
+
+
+def get_background_pool():
+    """Returns the thread pool for work that tool bodies start and may return before."""
+    global _background_pool
+    with _POOL_LOCK:
+        if _background_pool is None:
+            _background_pool = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix="sahayak-background")
+        return _background_pool
+
+
+# --- Artifact Storage ---
+# Generated files (PNGs, PDFs) are rendered into memory and streamed straight to the
+# bucket; nothing is written to the container's /tmp on the way.
+
+class GcsArtifactStore:
+    """Uploads in-memory artifacts to Google Cloud Storage buckets with uniform public access."""
+
+    def upload_bytes(self, bucket_name, object_name, data, content_type):
+        blob = CLIENTS.get("storage").bucket(bucket_name).blob(object_name)
+        # upload_from_file switches to a resumable upload for large payloads on its own.
+        blob.upload_from_file(io.BytesIO(data), size=len(data), content_type=content_type, rewind=True)
+        return self.public_url(bucket_name, object_name)
+
+    def exists(self, bucket_name, object_name):
+        return CLIENTS.get("storage").bucket(bucket_name).blob(object_name).exists()
+
+    def public_url(self, bucket_name, object_name):
+        return f"https://storage.googleapis.com/{bucket_name}/{object_name}"
+
+
+class LocalArtifactStore:
+    """Filesystem stand-in for GCS: `<root>/<bucket>/<object>` with file:// URLs. Meant for tests."""
+
+    def __init__(self, root=LOCAL_ARTIFACT_DIR):
+        self.root = root
+
+    def upload_bytes(self, bucket_name, object_name, data, content_type):
+        path = os.path.join(self.root, bucket_name, object_name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write-then-rename so readers never see a half-written artifact.
+        tmp_path = f"{path}.partial"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self.public_url(bucket_name, object_name)
+
+    def exists(self, bucket_name, object_name):
+        return os.path.exists(os.path.join(self.root, bucket_name, object_name))
+
+    def public_url(self, bucket_name, object_name):
+        return "file://" + os.path.abspath(os.path.join(self.root, bucket_name, object_name))
+
+
+CLIENTS.register("artifact_store", lambda: LocalArtifactStore() if ARTIFACT_BACKEND == "local" else GcsArtifactStore())
+
+
+# --- Write-behind artifact uploads ---
+# A tool used to return only after its PNG/PDF finished uploading, so the teacher's reply
+# waited on our egress bandwidth. Now the tool names the object up front (content hash),
+# hands the bytes to ARTIFACT_UPLOADS and returns the final URL at once; bounded worker
+# threads upload with retries while the model writes its answer. Agents that hand out
+# artifact links add `after_model_callback=ARTIFACT_UPLOADS.after_model`, which holds the
+# final answer until every link in it is uploaded, so a link never resolves to a 404.
+
+UPLOAD_WORKERS = int(os.getenv("SAHAYAK_UPLOAD_WORKERS", 8))
+# Pending uploads held in memory; submit() blocks once this many are queued.
+UPLOAD_QUEUE_SIZE = int(os.getenv("SAHAYAK_UPLOAD_QUEUE_SIZE", 64))
+UPLOAD_MAX_ATTEMPTS = int(os.getenv("SAHAYAK_UPLOAD_MAX_ATTEMPTS", 4))
+# Longest the final answer is held back waiting for its links to become readable.
+ARTIFACT_READY_TIMEOUT_SECONDS = float(os.getenv("SAHAYAK_ARTIFACT_READY_TIMEOUT_SECONDS", 30))
+# "0" uploads inline inside the tool, as before.
+WRITE_BEHIND_UPLOADS = os.getenv("SAHAYAK_WRITE_BEHIND_UPLOADS", "1") != "0"
+URL_PATTERN = re.compile(r"(?:https?|file)://[^\s<>()\"'\]]+")
+
+
+def artifact_object_name(prefix, data, extension):
+    """Content-addressed object name, so identical artifacts share one object and one upload."""
+    return f"{prefix}-{hashlib.sha256(data).hexdigest()[:32]}.{extension}"
+
+
+class ArtifactUploadQueue:
+    """
+    Bounded write-behind queue in front of the "artifact_store" client.
+
+    `submit()` returns the object's public URL immediately and queues the upload; worker
+    threads (started on first use) upload with exponential-backoff retries. `expect()`
+    registers a URL whose bytes are still being produced. Readiness is tracked per URL:
+    `status()`, `wait()` and the async `after_model` callback. `stats()` reports queue
+    depth, throughput and failure counters.
+    """
+
+    MAX_TRACKED = 4096
+
+    def __init__(self, workers=UPLOAD_WORKERS, max_pending=UPLOAD_QUEUE_SIZE, max_attempts=UPLOAD_MAX_ATTEMPTS,
+                 write_behind=WRITE_BEHIND_UPLOADS, retry_base_seconds=0.5):
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.write_behind = write_behind
+        self.retry_base_seconds = retry_base_seconds
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._threads = []
+        # url -> upload record; finished records are trimmed oldest-first.
+        self._uploads = OrderedDict()
+        self._counters = Counter()
+        self._busy_since = None
+        self._busy_seconds = 0.0
+
+    def submit(self, bucket_name, object_name, data, content_type, on_success=None):
+        """
+        Queues `data` for upload and returns its public URL. An object that is already
+        queued or uploaded by this process is not uploaded again. `on_success(url)` runs
+        on the worker once the object is readable.
+        """
+        store = CLIENTS.get("artifact_store")
+        url = store.public_url(bucket_name, object_name)
+        with self._lock:
+            record = self._uploads.get(url)
+            expected = record is not None and record.state == "pending" and not record.queued
+            duplicate = record is not None and record.state != "failed" and not expected
+            if duplicate:
+                self._counters["deduplicated"] += 1
+                if on_success is not None and record.state == "pending":
+                    record.callbacks.append(on_success)
+                    on_success = None
+            else:
+                if not expected:
+                    record = self._track(url, bucket_name, object_name)
+                record.data, record.content_type, record.queued = data, content_type, True
+                record.queued_at = time.perf_counter()
+                if on_success is not None:
+                    record.callbacks.append(on_success)
+                self._counters["submitted"] += 1
+        if duplicate:
+            if on_success is not None:
+                on_success(url)
+            return url
+        if not self.write_behind:
+            self._upload(store, record)
+            if record.state == "failed":
+                raise record.error
+            return url
+        self._ensure_workers()
+        # Blocks when the queue is full, so a burst cannot hold unbounded bytes in memory.
+        self._queue.put(record)
+        return url
+
+    def expect(self, bucket_name, object_name):
+        """
+        Returns the public URL of an object that will be submitted later, by work still
+        running after the tool returns. Until then `status()` reports it 'pending', so
+        `after_model` holds an answer that links to it; `fail()` gives up on it.
+        """
+        url = CLIENTS.get("artifact_store").public_url(bucket_name, object_name)
+        with self._lock:
+            record = self._uploads.get(url)
+            if record is None or record.state == "failed":
+                self._track(url, bucket_name, object_name)
+        return url
+
+    def fail(self, url, error):
+        """Marks an expected object that will never be submitted as failed."""
+        with self._lock:
+            record = self._uploads.get(url)
+            if record is None or record.state != "pending" or record.queued:
+                return
+            record.queued = True
+            record.error = error
+        print(f"Upload of {url} abandoned: {error}")
+        self._finish(record, "failed")
+
+    def status(self, url):
+        """'pending', 'uploaded', 'failed', or 'unknown' for URLs this process did not queue."""
+        with self._lock:
+            record = self._uploads.get(url)
+            return record.state if record is not None else "unknown"
+
+    def wait(self, urls, timeout=ARTIFACT_READY_TIMEOUT_SECONDS):
+        """
+        Blocks until every known URL in `urls` has finished uploading (or failed), up to
+        `timeout` seconds. Returns {url: state} for the URLs this queue is tracking.
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            records = [self._uploads[url] for url in dict.fromkeys(urls) if url in self._uploads]
+        for record in records:
+            record.ready.wait(max(0.0, deadline - time.monotonic()))
+        return {record.url: record.state for record in records}
+
+    def drain(self, timeout=ARTIFACT_READY_TIMEOUT_SECONDS):
+        """Waits for every queued upload; called at interpreter exit so queued artifacts are not lost."""
+        with self._lock:
+            urls = [url for url, record in self._uploads.items() if record.state == "pending"]
+        return self.wait(urls, timeout)
+
+    async def after_model(self, callback_context, llm_response):
+        """ADK after_model_callback: holds a response until the artifact links in it are readable."""
+        parts = llm_response.content.parts if llm_response.content and llm_response.content.parts else []
+        urls = [url.rstrip(".,;:!?*") for part in parts if part.text for url in URL_PATTERN.findall(part.text)]
+        pending = [url for url in urls if self.status(url) == "pending"]
+        if pending:
+            started = time.perf_counter()
+            await run_in_tool_pool(self.wait, pending)
+            print(f"Held the response {(time.perf_counter() - started) * 1000:.0f} ms for {len(pending)} upload(s).")
+        states = {url: self.status(url) for url in urls}
+        failed = [url for url, state in states.items() if state == "failed"]
+        slow = [url for url, state in states.items() if state == "pending"]
+        if not failed and not slow:
+            return None
+        notes = []
+        if failed:
+            notes.append("Sorry, this file could not be saved: " + ", ".join(failed) + ". Please ask me to create it again.")
+        if slow:
+            notes.append("This file is still uploading: " + ", ".join(slow) + ". If the link does not open yet, try again in a minute.")
+        content = llm_response.content.model_copy(deep=True)
+        content.parts.append(types.Part(text="\n\n(" + " ".join(notes) + ")"))
+        return llm_response.model_copy(update={"content": content})
+
+    def stats(self):
+        """Queue depth, in-flight uploads, counters, throughput and mean latencies."""
+        with self._lock:
+            counters = dict(self._counters)
+            busy = self._busy_seconds + (time.perf_counter() - self._busy_since if self._busy_since else 0.0)
+            pending = sum(1 for record in self._uploads.values() if record.state == "pending")
+        uploaded = counters.get("uploaded", 0)
+        return {
+            "queue_depth": self._queue.qsize(),
+            "pending": pending,
+            "workers": len(self._threads),
+            **{name: counters.get(name, 0) for name in ("in_flight", "submitted", "deduplicated", "uploaded", "failed", "retries", "bytes_uploaded")},
+            "throughput_mb_per_s": round(counters.get("bytes_uploaded", 0) / busy / 1e6, 2) if busy else 0.0,
+            "mean_upload_ms": round(counters.get("upload_ms", 0) / uploaded, 1) if uploaded else 0.0,
+            "mean_ready_ms": round(counters.get("ready_ms", 0) / uploaded, 1) if uploaded else 0.0,
+        }
+
+    def _track(self, url, bucket_name, object_name):
+        # Caller holds self._lock.
+        record = SimpleNamespace(url=url, bucket_name=bucket_name, object_name=object_name, data=None,
+                                 content_type=None, state="pending", queued=False, attempts=0, error=None,
+                                 queued_at=time.perf_counter(), ready=threading.Event(), callbacks=[])
+        self._uploads[url] = record
+        self._uploads.move_to_end(url)
+        return record
+
+    def _ensure_workers(self):
+        if len(self._threads) >= self.workers:
+            return
+        with self._lock:
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"sahayak-upload-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _work(self):
+        while True:
+            record = self._queue.get()
+            with self._lock:
+                self._counters["in_flight"] += 1
+                if self._busy_since is None:
+                    self._busy_since = time.perf_counter()
+            try:
+                self._upload(CLIENTS.get("artifact_store"), record)
+            finally:
+                with self._lock:
+                    self._counters["in_flight"] -= 1
+                    if not self._counters["in_flight"] and self._busy_since is not None:
+                        self._busy_seconds += time.perf_counter() - self._busy_since
+                        self._busy_since = None
+                self._queue.task_done()
+
+    def _upload(self, store, record):
+        while True:
+            record.attempts += 1
+            started = time.perf_counter()
+            try:
+                store.upload_bytes(record.bucket_name, record.object_name, record.data, record.content_type)
+                break
+            except Exception as e:
+                record.error = e
+                if record.attempts >= self.max_attempts:
+                    print(f"Upload of {record.url} failed after {record.attempts} attempts: {e}")
+                    self._finish(record, "failed")
+                    return
+                with self._lock:
+                    self._counters["retries"] += 1
+                delay = self.retry_base_seconds * 2 ** (record.attempts - 1)
+                print(f"Upload of {record.url} failed ({e}); retrying in {delay:.1f}s.")
+                time.sleep(delay)
+        finished = time.perf_counter()
+        with self._lock:
+            self._counters["bytes_uploaded"] += len(record.data)
+            self._counters["upload_ms"] += (finished - started) * 1000
+            self._counters["ready_ms"] += (finished - record.queued_at) * 1000
+        self._finish(record, "uploaded")
+
+    def _finish(self, record, state):
+        with self._lock:
+            record.state = state
+            record.data = None
+            self._counters[state] += 1
+            callbacks, record.callbacks = record.callbacks, []
+            # Forget the oldest finished uploads; pending ones are always kept.
+            excess = len(self._uploads) - self.MAX_TRACKED
+            for url in [url for url, r in self._uploads.items() if r.state != "pending"][:max(0, excess)]:
+                del self._uploads[url]
+        if state == "uploaded":
+            for callback in callbacks:
+                try:
+                    callback(record.url)
+                except Exception:
+                    traceback.print_exc()
+        record.ready.set()
+
+
+ARTIFACT_UPLOADS = ArtifactUploadQueue()
+atexit.register(ARTIFACT_UPLOADS.drain)
+
+
+# --- Result Cache ---
+
+def cache_key(*parts):
+    """Builds a stable content hash from any JSON-serializable parts."""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """
+    Two-tier cache for JSON-serializable results: an in-memory LRU in front of an
+    optional SQLite index on local disk, so entries survive a process restart.
+    Both tiers honour the same TTL; each tier has its own size limit.
+    """
+
+    def __init__(self, name, ttl_seconds=7 * 24 * 3600, max_entries=512, max_persisted_entries=20000, persist_dir=CACHE_DIR):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_persisted_entries = max_persisted_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"memory_hits": 0, "persistent_hits": 0, "misses": 0, "evictions": 0}
+        self._db = None
+        if persist_dir:
+            try:
+                os.makedirs(persist_dir, exist_ok=True)
+                self._db = sqlite3.connect(os.path.join(persist_dir, f"{name}.sqlite3"), check_same_thread=False)
+                self._db.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, last_used REAL NOT NULL)")
+                self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+                self._db.commit()
+            except sqlite3.Error as e:
+                print(f"ResultCache[{name}]: persistent tier disabled ({e}).")
+                self._db = None
+
+    def get(self, key):
+        """Returns the cached value for `key`, or None on a miss or an expired entry."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, value = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    return value
+                del self._memory[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT value, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    if now - row[1] <= self.ttl_seconds:
+                        self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (now, key))
+                        self._db.commit()
+                        value = json.loads(row[0])
+                        self._remember(key, row[1], value)
+                        self._counters["persistent_hits"] += 1
+                        return value
+                    self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self._counters["misses"] += 1
+            return None
+
+    def put(self, key, value):
+        """Stores `value` in both tiers, evicting least-recently-used entries past the limits."""
+        now = time.time()
+        with self._lock:
+            self._remember(key, now, value)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO entries (key, value, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), now, now),
+                )
+                overflow = self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - self.max_persisted_entries
+                if overflow > 0:
+                    self._db.execute(
+                        "DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY last_used LIMIT ?)", (overflow,)
+                    )
+                    self._counters["evictions"] += overflow
+                self._db.commit()
+
+    def delete(self, key):
+        """Removes `key` from both tiers (e.g. when the underlying object has disappeared)."""
+        with self._lock:
+            self._memory.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._db.commit()
+
+    def stats(self):
+        """Returns hit/miss counters plus the hit rate and current in-memory size."""
+        with self._lock:
+            counters = dict(self._counters)
+            counters["memory_entries"] = len(self._memory)
+        lookups = counters["memory_hits"] + counters["persistent_hits"] + counters["misses"]
+        counters["hit_rate"] = round((lookups - counters["misses"]) / lookups, 3) if lookups else 0.0
+        return counters
+
+    def _remember(self, key, created_at, value):
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counters["evictions"] += 1
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller runs the work and
+    everyone who arrives while it is in flight waits for (and shares) its result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._in_flight[key] = future
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+        return future.result()
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter for a quota-bound API: at most `max_in_flight` calls at once and
+    a token bucket refilled at `per_minute` calls per minute (bursting to `burst`). Use
+    `with limiter:` around each call; callers block until both allow it.
+    """
+
+    def __init__(self, per_minute, max_in_flight, burst=None):
+        self.rate = per_minute / 60.0
+        self.capacity = float(burst or max_in_flight)
+        self._tokens = self.capacity
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._counters = Counter()
+
+    def __enter__(self):
+        started = time.monotonic()
+        self._slots.acquire()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._refilled_at) * self.rate)
+                self._refilled_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    waited = now - started
+                    self._counters["calls"] += 1
+                    self._counters["throttled"] += waited > 0.01
+                    self._counters["waited_ms"] += round(waited * 1000)
+                    return self
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+
+    def __exit__(self, *exc):
+        self._slots.release()
+        return False
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+# --- Async tool execution ---
+# ADK awaits `async def` tools on the serving event loop, so a tool that blocks (a 300 s
+# long-running operation, an Imagen call, an upload) stalls every other session in the
+# process. Tools are therefore registered through `async_tool()`: blocking bodies run on
+# a bounded thread pool, long-running operations are polled with asyncio.sleep between
+# polls, and each running tool is tracked by session so it can be cancelled when the
+# session ends (`cancel_session_tools`). The sync functions stay available for scripts
+# and batch code.
+
+async def run_in_tool_pool(fn, *args):
+    """Runs a blocking callable on the tool pool without blocking the event loop."""
+    return await asyncio.get_running_loop().run_in_executor(get_tool_pool(), fn, *args)
+
+
+async def await_operation(operation, timeout, initial_poll_seconds=0.5, max_poll_seconds=5.0):
+    """
+    Polls a google.api_core long-running operation until it finishes and returns its
+    result. Each done() refresh runs on the tool pool; the wait between polls is an
+    asyncio.sleep. Cancelling the awaiting task also cancels the operation (best effort).
+    """
+    deadline = time.monotonic() + timeout
+    poll = initial_poll_seconds
+    try:
+        while not await run_in_tool_pool(operation.done):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Operation did not finish within {timeout}s.")
+            await asyncio.sleep(poll)
+            poll = min(poll * 1.5, max_poll_seconds)
+        return await run_in_tool_pool(operation.result)
+    except asyncio.CancelledError:
+        get_tool_pool().submit(_cancel_operation, operation)
+        raise
+
+
+def _cancel_operation(operation):
+    try:
+        operation.cancel()
+        print("Cancelled a long-running operation whose session went away.")
+    except Exception as e:
+        print(f"Could not cancel a long-running operation: {e}")
+
+
+class AsyncSingleFlight:
+    """
+    SingleFlight for coroutines on one event loop: concurrent callers with the same key
+    await one shared task. A caller that is cancelled stops waiting without cancelling
+    the shared work, unless it was the last one waiting for it.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.coalesced = 0
+
+    async def do(self, key, coro_fn):
+        entry = self._tasks.get(key)
+        if entry is None:
+            entry = [asyncio.ensure_future(coro_fn()), 0]
+            self._tasks[key] = entry
+            entry[0].add_done_callback(lambda _: self._tasks.pop(key, None))
+        else:
+            self.coalesced += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if entry[1] == 1 and not task.done():
+                task.cancel()
+            raise
+        finally:
+            entry[1] -= 1
+
+
+class SessionTaskRegistry:
+    """Running tool tasks per ADK session, so a finished or abandoned session can cancel them."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def add(self, session_id, task):
+        with self._lock:
+            self._tasks.setdefault(session_id, set()).add(task)
+
+    def discard(self, session_id, task):
+        with self._lock:
+            tasks = self._tasks.get(session_id)
+            if tasks is not None:
+                tasks.discard(task)
+                if not tasks:
+                    del self._tasks[session_id]
+
+    def cancel(self, session_id):
+        """Cancels the session's running tools (thread-safe). Returns how many were cancelled."""
+        with self._lock:
+            tasks = list(self._tasks.pop(session_id, ()))
+        for task in tasks:
+            task.get_loop().call_soon_threadsafe(task.cancel)
+        return len(tasks)
+
+    def running(self):
+        with self._lock:
+            return {session_id: len(tasks) for session_id, tasks in self._tasks.items()}
+
+
+SESSION_TASKS = SessionTaskRegistry()
+
+
+def cancel_session_tools(session_id):
+    """
+    Stops a session's running tools. The deployed app calls it when a session is deleted
+    (see SahayakApp at the bottom of this file); a client disconnect needs no call, since
+    cancelling the run cancels the tool tasks it is awaiting.
+    """
+    cancelled = SESSION_TASKS.cancel(session_id)
+    if cancelled:
+        print(f"Cancelled {cancelled} running tool(s) for session {session_id}.")
+    return cancelled
+
+
+def async_tool(fn, implementation=None):
+    """
+    Wraps tool `fn` for FunctionTool as a coroutine with the same name, docstring and
+    parameters (plus ADK's injected `tool_context`). The call runs `implementation`
+    (an async function taking the same arguments) if given, otherwise `fn` on the tool
+    pool, and is tracked under the session id for cancel_session_tools().
+    """
+    signature = inspect.signature(fn)
+
+    @functools.wraps(fn)
+    async def wrapper(*args, tool_context=None, **kwargs):
+        bound = signature.bind(*args, **kwargs)
+        task = asyncio.current_task()
+        session_id = tool_context.session.id if tool_context is not None else None
+        if session_id is not None:
+            SESSION_TASKS.add(session_id, task)
+        try:
+            if implementation is not None:
+                return await implementation(*bound.args, **bound.kwargs)
+            return await run_in_tool_pool(functools.partial(fn, *bound.args, **bound.kwargs))
+        finally:
+            if session_id is not None:
+                SESSION_TASKS.discard(session_id, task)
+
+    wrapper.__signature__ = signature.replace(parameters=[
+        *signature.parameters.values(),
+        inspect.Parameter("tool_context", inspect.Parameter.KEYWORD_ONLY, default=None),
+    ])
+    return wrapper
+
+
+# --- Agent graph ---
+# Each specialist is declared as an AgentRoute: the name and description the root agent
+# routes on plus the agent that does the work. build_agent_graph() turns the routes into
+# the root's sub-agents. A route with a single agent used to be a SequentialAgent
+# wrapper, which only adds an orchestration layer, an extra event and a transfer hop;
+# with flattening on, the specialist itself is placed under the root (as a copy that
+# carries the route's name and description), so routing targets and the root instruction
+# are unchanged. Set SAHAYAK_FLATTEN_AGENT_GRAPH=0 to build the wrappers.
+
+FLATTEN_AGENT_GRAPH = os.getenv("SAHAYAK_FLATTEN_AGENT_GRAPH", "1") != "0"
+
+
+class AgentRoute:
+    """A routing entry under the root agent (see build_agent_graph)."""
+
+    def __init__(self, name, description, sub_agents):
+        self.name = name
+        self.description = description
+        self.sub_agents = list(sub_agents)
+
+
+def build_agent_graph(routes, flatten=FLATTEN_AGENT_GRAPH):
+    """
+    Returns the root agent's sub-agents for `routes`. Pass-through routes (one agent) are
+    collapsed when `flatten` is set; routes with several agents stay SequentialAgents.
+    """
+    nodes = []
+    collapsed = 0
+    for route in routes:
+        if flatten and len(route.sub_agents) == 1:
+            specialist = route.sub_agents[0]
+            nodes.append(specialist.model_copy(update={"name": route.name, "description": route.description}))
+            collapsed += 1
+        else:
+            nodes.append(SequentialAgent(name=route.name, description=route.description, sub_agents=route.sub_agents))
+    print(f"Agent graph: {len(routes)} routes, {collapsed} pass-through wrappers collapsed.")
+    return nodes
+
+
+# --- Response cache for text-only specialists ---
+# InstantKnowledge, LessonPlanner and GameGenerator have no tools and answer from the
+# request alone, and teachers in different schools ask nearly the same things. An agent
+# opts in with `**RESPONSE_CACHE.callbacks("<AgentName>")`: before the model call the
+# first-turn request is reduced to (agent, topic, grade, language) and looked up exactly
+# and, failing that, by embedding similarity among cached topics with the same agent,
+# grade and language; a hit is returned as the model response without calling Gemini.
+
+RESPONSE_CACHE_AGENTS = [a.strip() for a in os.getenv("SAHAYAK_RESPONSE_CACHE_AGENTS", "InstantKnowledgeAgent,LessonPlannerAgent,GameGeneratorAgent").split(",") if a.strip()]
+RESPONSE_CACHE_TTL_SECONDS = int(os.getenv("SAHAYAK_RESPONSE_CACHE_TTL_SECONDS", 30 * 24 * 3600))
+# Cosine similarity for a semantic hit; set above 1 to use exact keys only. Below ~0.9,
+# trigram similarity starts to match different topics ("adding" vs "subtracting fractions").
+RESPONSE_CACHE_MIN_SIMILARITY = float(os.getenv("SAHAYAK_RESPONSE_CACHE_MIN_SIMILARITY", 0.9))
+# A printable copy needs a tool call, so such requests always reach the model.
+PRINTABLE_REQUEST = re.compile(r"\b(?:pdf|print|printable|printout)\b", re.IGNORECASE)
+
+LANGUAGE_NAMES = (
+    "english hindi marathi bengali bangla tamil telugu kannada malayalam gujarati punjabi odia oriya "
+    "assamese urdu sanskrit konkani maithili nepali"
+).split()
+GRADE_PATTERN = re.compile(r"\b(?:class|grade|std|standard)\s*[-:]?\s*(\d{1,2})\b|कक्षा\s*(\d{1,2})|इयत्ता\s*(\d{1,2})", re.IGNORECASE)
+REQUEST_STOPWORDS = set(
+    "a an the of on for to in about and or with me my our us please can could would you i we is are be "
+    "create make give write generate prepare design explain tell show simple simply students student "
+    "kids children class grade std standard language using some what why how do does so very really kindly lesson "
+    "their its his her them this that these those "
+    "का के की को में से पर और है हैं लिए एक क्या क्यों कैसे बताइए बताओ समझाइए समझाओ बनाइए बनाओ".split()
+)
+
+
+# Words that give a request its direction ("celsius to fahrenheit", "the moon around the
+# earth"); each is kept in the scope together with the word it governs. English
+# prepositions come before that word, Hindi postpositions after it.
+DIRECTION_WORDS = set("to from into onto around toward towards before after above below under over versus vs than".split())
+DIRECTION_POSTPOSITIONS = set("से तक".split())
+NUMBER_WORDS = set("zero one two three four five six seven eight nine ten eleven twelve twenty hundred thousand".split())
+
+
+class InvocationMap:
+    """
+    Values a before_model callback leaves for the matching after_model, keyed by
+    invocation id. A model call that raises or is cancelled never reaches after_model,
+    so entries also expire after `ttl_seconds`, and the oldest are dropped past `max_entries`.
+    """
+
+    def __init__(self, max_entries=1024, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, invocation_id, value):
+        now = time.monotonic()
+        with self._lock:
+            self._entries.pop(invocation_id, None)
+            self._entries[invocation_id] = (now, value)
+            while self._entries:
+                oldest_id, (created_at, _) = next(iter(self._entries.items()))
+                if len(self._entries) <= self.max_entries and now - created_at <= self.ttl_seconds:
+                    break
+                del self._entries[oldest_id]
+
+    def pop(self, invocation_id):
+        """The value left for `invocation_id`, or None if there is none or it has expired."""
+        with self._lock:
+            created_at, value = self._entries.pop(invocation_id, (None, None))
+        if created_at is None or time.monotonic() - created_at > self.ttl_seconds:
+            return None
+        return value
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+def user_turn_count(callback_context):
+    """Messages the teacher has sent in this session, including the current one."""
+    session = callback_context.session
+    return sum(1 for e in session.events if e.author == "user" and e.content
+               and any(p.text or p.file_data or p.inline_data for p in e.content.parts or []))
+
+
+class ResponseCache:
+    """
+    Exact + semantic cache of final text answers, used as ADK model callbacks. Answers
+    that call a tool are not stored, and requests for a printable copy are not looked up.
+
+    Exact entries live in a ResultCache (TTL, LRU, SQLite tier, counters), keyed by the
+    topic words in order. The semantic tier keeps, per (agent, grade, language, numbers,
+    directions), a matrix of L2-normalized hashed character-trigram
+    embeddings of the cached topics; a lookup is one matrix-vector product. It is rebuilt
+    as answers are stored, so after a restart only exact keys hit until entries are re-added.
+    """
+
+    EMBEDDING_DIM = 1024
+    MAX_SEMANTIC_ENTRIES = 2000
+
+    def __init__(self, enabled_agents, ttl_seconds, min_similarity):
+        self.enabled_agents = set(enabled_agents)
+        self.min_similarity = min_similarity
+        self.entries = ResultCache("responses", ttl_seconds=ttl_seconds, max_entries=1024)
+        self._lock = threading.Lock()
+        self._pending = InvocationMap()
+        self._semantic = {}
+        self._counters = Counter()
+
+    def callbacks(self, agent_name, after_model=None):
+        """
+        before/after model callbacks for `agent_name`, or {} if it has not opted in. An
+        agent's own `after_model` callback is chained after the cache's.
+        """
+        own = {"after_model_callback": after_model} if after_model is not None else {}
+        if agent_name not in self.enabled_agents:
+            return own
+        store = lambda callback_context, llm_response: self._after_model(agent_name, callback_context, llm_response)
+        return {
+            "before_model_callback": lambda callback_context, llm_request: self._before_model(agent_name, callback_context, llm_request),
+            # ADK runs a list in order until one returns a response; the cache's returns None.
+            "after_model_callback": [store, after_model] if after_model is not None else store,
+        }
+
+    def request_key(self, agent_name, model, instruction, text):
+        """Normalizes a request to its (agent, topic, grade, language) parts."""
+        lowered = text.lower()
+        grade_match = GRADE_PATTERN.search(lowered)
+        grade = next((g for g in grade_match.groups() if g), "") if grade_match else ""
+        words = normalize_words(GRADE_PATTERN.sub(" ", lowered).replace("-", " "))
+        language = next((w for w in words if w in LANGUAGE_NAMES), "") or self._script(text)
+        # Numbers ("3-day" vs "5-day") and directions are scope, not topic: requests that
+        # differ in them never match, not even by similarity.
+        numbers = [w for w in words if w.isdigit() or w in NUMBER_WORDS]
+        directions = self._directions(words)
+        # Word order is kept: "celsius to fahrenheit" is not "fahrenheit to celsius".
+        topic = " ".join(self._stem(w) for w in words
+                         if w not in REQUEST_STOPWORDS and w not in LANGUAGE_NAMES and w not in numbers and w not in DIRECTION_WORDS)
+        # The model and instruction are part of the scope, so editing a prompt invalidates its answers.
+        scope = cache_key(agent_name, model, instruction, grade, language, numbers, directions)
+        return scope, topic
+
+    def stats(self):
+        """Hit/miss counters per agent and overall hit rate, plus the exact tier's stats."""
+        with self._lock:
+            counters = dict(self._counters)
+        lookups = counters.get("exact_hits", 0) + counters.get("semantic_hits", 0) + counters.get("misses", 0)
+        hits = lookups - counters.get("misses", 0)
+        counters["hit_rate"] = round(hits / lookups, 3) if lookups else 0.0
+        counters["exact_tier"] = self.entries.stats()
+        return counters
+
+    def _before_model(self, agent_name, callback_context, llm_request):
+        text = self._first_turn_text(callback_context)
+        if not text or PRINTABLE_REQUEST.search(text):
+            return None
+        instruction = str(llm_request.config.system_instruction) if llm_request.config else ""
+        scope, topic = self.request_key(agent_name, llm_request.model, instruction, text)
+        if not topic:
+            return None
+        started = time.perf_counter()
+        answer, kind = self._lookup(scope, topic)
+        with self._lock:
+            if answer is None:
+                self._counters["misses"] += 1
+                self._counters[f"{agent_name}.misses"] += 1
+                self._pending.put(callback_context.invocation_id, (scope, topic))
+                return None
+            self._counters[f"{kind}_hits"] += 1
+            self._counters[f"{agent_name}.hits"] += 1
+        print(f"ResponseCache: {kind} hit for {agent_name} '{topic}' in {(time.perf_counter() - started) * 1000:.1f} ms")
+        llm_response = _lazy_import("google.adk.models.llm_response")
+        return llm_response.LlmResponse(content=types.Content(role="model", parts=[types.Part(text=answer)]))
+
+    def _after_model(self, agent_name, callback_context, llm_response):
+        if getattr(llm_response, "partial", False):
+            return None
+        pending = self._pending.pop(callback_context.invocation_id)
+        content = llm_response.content
+        if pending is None or content is None or llm_response.error_code:
+            return None
+        parts = content.parts or []
+        if any(p.function_call for p in parts):
+            return None
+        answer = "".join(p.text for p in parts if p.text and not p.thought)
+        if answer.strip():
+            self._store(*pending, answer)
+            with self._lock:
+                self._counters["stores"] += 1
+        return None
+
+    def _lookup(self, scope, topic):
+        cached = self.entries.get(cache_key(scope, topic))
+        if cached is not None:
+            return cached, "exact"
+        if self.min_similarity > 1:
+            return None, None
+        np = _lazy_import("numpy")
+        with self._lock:
+            index = self._semantic.get(scope)
+            if not index or not index[0]:
+                return None, None
+            topics, matrix = index[0], index[1][:len(index[0])]
+            scores = matrix @ self._embed(topic)
+        best = int(np.argmax(scores))
+        if scores[best] < self.min_similarity:
+            return None, None
+        cached = self.entries.get(cache_key(scope, topics[best]))
+        return (cached, "semantic") if cached is not None else (None, None)
+
+    def _store(self, scope, topic, answer):
+        np = _lazy_import("numpy")
+        self.entries.put(cache_key(scope, topic), answer)
+        vector = self._embed(topic)
+        with self._lock:
+            topics, matrix = self._semantic.get(scope) or ([], np.zeros((0, self.EMBEDDING_DIM), dtype=np.float32))
+            if topic in topics:
+                return
+            if len(topics) >= self.MAX_SEMANTIC_ENTRIES:
+                topics, matrix = topics[1:], matrix[1:]
+            if len(topics) == len(matrix):
+                # Grow the matrix geometrically instead of reallocating on every insert.
+                matrix = np.concatenate([matrix, np.zeros((max(16, len(matrix)), self.EMBEDDING_DIM), dtype=np.float32)])
+            matrix[len(topics)] = vector
+            self._semantic[scope] = (topics + [topic], matrix)
+
+    def _embed(self, topic):
+        """L2-normalized hashed character-trigram counts of the topic words."""
+        np = _lazy_import("numpy")
+        vector = np.zeros(self.EMBEDDING_DIM, dtype=np.float32)
+        for word in topic.split():
+            padded = f" {word} "
+            for k in range(len(padded) - 2):
+                digest = hashlib.md5(padded[k:k + 3].encode("utf-8")).digest()
+                vector[int.from_bytes(digest[:4], "little") % self.EMBEDDING_DIM] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    @staticmethod
+    def _first_turn_text(callback_context):
+        """The user's text if this is the first message of the session (follow-ups depend on history)."""
+        if user_turn_count(callback_context) > 1 or callback_context.user_content is None:
+            return ""
+        parts = callback_context.user_content.parts or []
+        if any(p.file_data or p.inline_data for p in parts):
+            return ""
+        return " ".join(p.text for p in parts if p.text).strip()
+
+    @classmethod
+    def _directions(cls, words):
+        """(direction word, governed word) pairs in order, skipping articles."""
+        content = [w for w in words if w not in ("a", "an", "the")]
+        pairs = []
+        for i, word in enumerate(content):
+            if word in DIRECTION_WORDS and i + 1 < len(content):
+                pairs.append(f"{word} {cls._stem(content[i + 1])}")
+            elif word in DIRECTION_POSTPOSITIONS and i > 0:
+                pairs.append(f"{cls._stem(content[i - 1])} {word}")
+        return pairs
+
+    @staticmethod
+    def _stem(word):
+        """Folds simple English plurals ("magnets", "stories") so they share a key."""
+        if word.isascii() and len(word) > 3:
+            if word.endswith("ies"):
+                return word[:-3] + "y"
+            if word.endswith("s") and not word.endswith(("ss", "us", "is")):  # not "celsius", "photosynthesis"
+                return word[:-1]
+        return word
+
+    @staticmethod
+    def _script(text):
+        """Unicode script of the first letter (e.g. 'devanagari'), used when no language is named."""
+        for ch in text:
+            if ch.isalpha():
+                return unicodedata.name(ch, "unknown").split()[0].lower()
+        return ""
+
+
+RESPONSE_CACHE = ResponseCache(RESPONSE_CACHE_AGENTS, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_MIN_SIMILARITY)
+
+
 # VisualAidAgent Tool Function
+
+VISUAL_AID_PROMPT_TEMPLATE = (
+    "simple black and white line drawing, "
+    "minimalist, clear outlines, no shading, "
+    "suitable for a classroom blackboard, easily reproducible by hand. "
+    "Subject: {prompt}"
+)
+
+# Same diagram requests ("water cycle", "parts of a plant") come from many schools, so
+# generated images are cached by (model, template, variants, normalized prompt) -> public URLs.
+VISUAL_AID_CACHE = ResultCache(
+    "visual_aids",
+    ttl_seconds=int(os.getenv("VISUAL_AID_CACHE_TTL_SECONDS", 30 * 24 * 3600)),
+    max_entries=int(os.getenv("VISUAL_AID_CACHE_MAX_ENTRIES", 256)),
+    max_persisted_entries=int(os.getenv("VISUAL_AID_CACHE_MAX_PERSISTED", 20000)),
+)
+
+
+def _normalize_prompt(prompt):
+    return re.sub(r"\s+", " ", prompt.lower()).strip(" .!?\t\n")
+
+
+# Imagen returns a full-colour PNG (with generation parameters in text chunks) even for
+# a two-tone drawing, which is slow to open on a 2G/3G school connection. Each image is
+# therefore reduced to a 1-bit PNG plus a small grayscale preview (and, optionally, a
+# traced SVG) in the CPU pool before upload; the tool returns both links.
+VISUAL_AID_PREVIEW_PX = int(os.getenv("SAHAYAK_VISUAL_AID_PREVIEW_PX", 320))
+VISUAL_AID_SVG = os.getenv("SAHAYAK_VISUAL_AID_SVG", "0") == "1"
+# Bump when the processing changes so cached links to older renditions are not reused.
+VISUAL_AID_PIPELINE = "bitonal-v1"
+# Imagen quota: requests per minute and concurrent requests across all sessions, shared by
+# the single and batch tools. Each request returns up to IMAGEN_MAX_VARIANTS images.
+IMAGEN_REQUESTS_PER_MINUTE = float(os.getenv("SAHAYAK_IMAGEN_REQUESTS_PER_MINUTE", 20))
+IMAGEN_MAX_IN_FLIGHT = int(os.getenv("SAHAYAK_IMAGEN_MAX_IN_FLIGHT", 6))
+IMAGEN_MAX_ATTEMPTS = int(os.getenv("SAHAYAK_IMAGEN_MAX_ATTEMPTS", 3))
+IMAGEN_MAX_VARIANTS = 4
+VISUAL_AID_BATCH_MAX_IMAGES = int(os.getenv("SAHAYAK_VISUAL_AID_BATCH_MAX_IMAGES", 24))
+IMAGEN_LIMITER = RateLimiter(IMAGEN_REQUESTS_PER_MINUTE, IMAGEN_MAX_IN_FLIGHT)
+
+
+VISUAL_AID_PROCESSOR = VisualAidProcessor(VISUAL_AID_PREVIEW_PX)
+
+
+def _generate_images(prompt, number_of_images):
+    """
+    One Imagen request under IMAGEN_LIMITER, retried with backoff when the quota is
+    exhausted. Returns the encoded images; ones the safety filter removed are left out.
+    """
+    errors = _lazy_import("google.genai.errors")
+    client = CLIENTS.get("imagen")
+    for attempt in range(IMAGEN_MAX_ATTEMPTS):
+        try:
+            with IMAGEN_LIMITER:
+                # Using the exact model name you tested successfully (see IMAGEN_MODEL)
+                response = client.models.generate_images(
+                    model=IMAGEN_MODEL,
+                    prompt=VISUAL_AID_PROMPT_TEMPLATE.format(prompt=prompt),
+                    config=types.GenerateImagesConfig(number_of_images=number_of_images),
+                )
+            return [generated.image.image_bytes for generated in response.generated_images or []
+                    if generated.image is not None and generated.image.image_bytes]
+        except errors.APIError as e:
+            # 429: quota exhausted, 503: unavailable; anything else is not worth retrying.
+            if e.code not in (429, 503) or attempt + 1 == IMAGEN_MAX_ATTEMPTS:
+                raise
+            delay = 2.0 * 2 ** attempt
+            print(f"Imagen quota/availability error ({e}); retrying in {delay:.0f}s.")
+            time.sleep(delay)
+
+
+def _visual_aid_files(image_bytes, processing):
+    """Waits for one image's post-processing and returns {url field: (prefix, bytes, extension, content type)}."""
+    try:
+        processed = processing.result()
+        print(f"Visual aid post-processed: {processed['stats']}")
+    except Exception as e:
+        # Never lose a generated image to a post-processing bug; send the original instead.
+        print(f"Visual aid post-processing failed ({e}); uploading the original image.")
+        processed = {"full": image_bytes, "preview": None, "svg": None}
+
+    files = {"public_url": ("visual-aid", processed["full"], "png", "image/png")}
+    if processed["preview"] is not None:
+        files["preview_url"] = ("visual-aid-preview", processed["preview"], "png", "image/png")
+    if processed["svg"] is not None and len(processed["svg"]) < len(processed["full"]):
+        files["svg_url"] = ("visual-aid", processed["svg"], "svg", "image/svg+xml")
+    return files
+
+
+def _create_visual_aids(prompt, variants):
+    """
+    Returns the URLs of `variants` drawings for `prompt` (one Imagen request), from the
+    cache if possible. Uploads are queued; the cache entry is written once all are readable.
+    """
+    key = cache_key(IMAGEN_MODEL, VISUAL_AID_PROMPT_TEMPLATE, VISUAL_AID_PIPELINE, VISUAL_AID_PREVIEW_PX, VISUAL_AID_SVG,
+                    variants, _normalize_prompt(prompt))
+    cached = VISUAL_AID_CACHE.get(key)
+    if cached is not None:
+        print(f"Visual aid cache hit: {cached['images'][0]['public_url']}")
+        return cached["images"]
+
+    images = _generate_images(prompt, variants)
+    if not images:
+        raise RuntimeError("The image model returned no images (the prompt may have been filtered).")
+    print(f"{len(images)} image(s) generated successfully by the model.")
+
+    cpu_pool = get_cpu_pool()
+    processing = [cpu_pool.submit(process_visual_aid, image, VISUAL_AID_PREVIEW_PX, VISUAL_AID_SVG) for image in images]
+    files = [_visual_aid_files(image, job) for image, job in zip(images, processing)]
+
+    entry = {"images": [{} for _ in images]}
+    # One count per upload plus one released below, so the entry is complete when cached.
+    remaining = [sum(len(f) for f in files) + 1]
+    lock = threading.Lock()
+
+    def on_uploaded(url):
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            VISUAL_AID_CACHE.put(key, entry)
+
+    for urls, image_files in zip(entry["images"], files):
+        for field, (prefix, data, extension, content_type) in image_files.items():
+            urls[field] = ARTIFACT_UPLOADS.submit(
+                OUTPUT_BUCKET_NAME, artifact_object_name(prefix, data, extension), data, content_type, on_success=on_uploaded
+            )
+    on_uploaded(None)
+    print(f"Queued visual aid uploads to bucket '{OUTPUT_BUCKET_NAME}': {entry['images']}")
+    return entry["images"]
+
+
 def generate_visual_aid(prompt: str) -> str:
     """
     Generates a simple line drawing or chart based on a teacher's description,
-    saves it to Google Cloud Storage, and returns its public URL.
+    saves a compact black-and-white version and a small preview to Google Cloud
+    Storage, and returns their public URLs.
 
     Args:
         prompt: A description of the visual aid to generate.
 
     Returns:
-        A string containing the success message and the public URL of the generated image.
+        A string containing the success message, the preview URL and the full-size URL of the generated image.
     """
     print(f"Tool called: Generating visual aid for prompt: '{prompt}'")
     try:
-        # Using the exact model name you tested successfully
-        model = ImageGenerationModel.from_pretrained("imagen-4.0-ultra-generate-preview-06-06")
-
-        # Using the prompt structure from your successful test
-        images = model.generate_images(
-            prompt=(
-                "simple black and white line drawing, "
-                "minimalist, clear outlines, no shading, "
-                "suitable for a classroom blackboard, easily reproducible by hand. "
-                f"Subject: {prompt}"
-            ),
-            number_of_images=1,
-        )
-        image = images[0]
-        print("Image generated successfully by the model.")
+        return _visual_aid_message(_create_visual_aids(prompt, 1)[0])
+
+    except Exception as e:
+        print(f"\n--- ERROR IN generate_visual_aid ---")
+        traceback.print_exc()
+        return f"I'm sorry, I encountered an error while creating the visual aid: {e}"
+
 
-        image_filename = f"visual-aid-{uuid.uuid4()}.png"
-        local_image_path = f"/tmp/{image_filename}"
-        
-        image.save(location=local_image_path, include_generation_parameters=True)
-        print(f"Image saved locally to: {local_image_path}")
+def _visual_aid_message(urls):
+    if not urls.get("preview_url"):
+        return f"I have created a visual aid for you. You can view it here: {urls['public_url']}"
+    message = (
+        "I have created a visual aid for you. "
+        f"Quick preview (small download): {urls['preview_url']} "
+        f"Full-size image for printing or projecting: {urls['public_url']}"
+    )
+    if urls.get("svg_url"):
+        message += f" Scalable vector version: {urls['svg_url']}"
+    return message
+
+
+def generate_visual_aid_batch(prompts: list[str], variants: int) -> str:
+    """
+    Generates several visual aids at once (e.g. every diagram for a week's lessons),
+    optionally with several variants per prompt to choose from, and returns one gallery.
 
-        storage_client = storage.Client(project=PROJECT_ID)
-        bucket = storage_client.bucket(OUTPUT_BUCKET_NAME)
-        blob = bucket.blob(image_filename)
-        
-        blob.upload_from_filename(local_image_path)
-        print(f"Successfully uploaded image to GCS bucket '{OUTPUT_BUCKET_NAME}'.")
+    Args:
+        prompts: One description per visual aid to generate.
+        variants: How many alternative drawings to make for each prompt (1 to 4). Pass 1 for a single drawing each.
 
-        os.remove(local_image_path)
-        print(f"Removed temporary local file: {local_image_path}")
+    Returns:
+        A JSON gallery manifest: for each prompt its preview and full-size URLs (or an error), plus a gallery page URL.
+    """
+    print(f"Tool called: generate_visual_aid_batch for {len(prompts)} prompts x {variants} variants.")
+    try:
+        prompts = [p for p in (prompts or []) if p and p.strip()]
+        if not prompts:
+            return json.dumps({"error": "No prompts were provided."})
+        variants = max(1, min(int(variants or 1), IMAGEN_MAX_VARIANTS))
+        if len(prompts) * variants > VISUAL_AID_BATCH_MAX_IMAGES:
+            return json.dumps({"error": f"At most {VISUAL_AID_BATCH_MAX_IMAGES} images per batch; "
+                                        f"{len(prompts)} prompts x {variants} variants is too many."})
 
-        public_url = f"https://storage.googleapis.com/{OUTPUT_BUCKET_NAME}/{image_filename}"
-        print(f"Image is publicly accessible at: {public_url}")
+        started = time.perf_counter()
+        # One Imagen request per distinct prompt, all in flight at once (IMAGEN_LIMITER decides
+        # how many actually run), so the batch takes about as long as its slowest image.
+        # Jobs are keyed by the normalized prompt, but Imagen gets the teacher's own wording
+        # (the first spelling seen); the cache key inside is normalized either way.
+        originals = {}
+        for p in prompts:
+            originals.setdefault(_normalize_prompt(p), p)
+        io_pool = get_io_pool()
+        jobs = {key: io_pool.submit(_create_visual_aids, original, variants) for key, original in originals.items()}
+        gallery = []
+        for prompt in prompts:
+            item = {"prompt": prompt, "images": [], "error": None}
+            try:
+                item["images"] = jobs[_normalize_prompt(prompt)].result()
+            except Exception as e:
+                print(f"Visual aid for '{prompt}' failed: {e}")
+                item["error"] = str(e)
+            gallery.append(item)
 
-        return f"I have created a visual aid for you. You can view it here: {public_url}"
+        manifest = {"gallery": gallery, "gallery_url": None}
+        if any(item["images"] for item in gallery):
+            page = _gallery_html(gallery).encode("utf-8")
+            manifest["gallery_url"] = ARTIFACT_UPLOADS.submit(
+                OUTPUT_BUCKET_NAME, artifact_object_name("visual-aid-gallery", page, "html"), page, "text/html; charset=utf-8")
+        print(f"Visual aid batch of {len(prompts)} prompts ready in {time.perf_counter() - started:.2f}s.")
+        return json.dumps(manifest, ensure_ascii=False)
 
     except Exception as e:
-        print(f"\n--- ERROR IN generate_visual_aid ---")
+        print(f"\n--- ERROR IN generate_visual_aid_batch ---")
         traceback.print_exc()
-        return f"I'm sorry, I encountered an error while creating the visual aid: {e}"
+        return json.dumps({"error": f"I'm sorry, I encountered an error while creating the visual aids: {e}"})
+
+
+def _gallery_html(gallery):
+    # One small page with every preview linking to its full-size image.
+    escape = _lazy_import("html").escape
+    sections = []
+    for item in gallery:
+        if not item["images"]:
+            continue
+        figures = "".join(
+            f'<a href="{escape(urls["public_url"])}"><img src="{escape(urls.get("preview_url") or urls["public_url"])}" '
+            f'alt="{escape(item["prompt"])}" loading="lazy"></a>'
+            for urls in item["images"]
+        )
+        sections.append(f"<section><h2>{escape(item['prompt'])}</h2>{figures}</section>")
+    return (
+        '<!doctype html><html><head><meta charset="utf-8"><meta name="viewport" content="width=device-width">'
+        "<title>Visual aids</title><style>img{max-width:45%;margin:4px;border:1px solid #ccc}</style></head>"
+        f"<body>{''.join(sections)}</body></html>"
+    )
 
 
-VisualAidTool = FunctionTool(func=generate_visual_aid)
+VisualAidTool = FunctionTool(func=async_tool(generate_visual_aid))
+VisualAidBatchTool = FunctionTool(func=async_tool(generate_visual_aid_batch))
 
 VisualAidAgent = Agent(
     name="VisualAidAgent",
     model="gemini-2.5-pro",
-    tools=[VisualAidTool],
+    tools=[VisualAidTool, VisualAidBatchTool],
     instruction="""
     **YOUR ROLE:**
     You are a helpful assistant who creates simple visual aids for teachers. You specialize in generating clear, black and white line drawings that are easy to copy onto a blackboard.
@@ -118,14 +1492,16 @@ VisualAidAgent = Agent(
     1.  Take the teacher's description of the desired visual aid (e.g., "a simple diagram of the water cycle," "a chart showing the parts of a plant").
     2.  You MUST IMMEDIATELY call the `generate_visual_aid` tool.
     3.  Pass the teacher's description directly to the `prompt` parameter of the tool.
-    4.  Your ONLY output should be the final response from the tool, which contains the link to the generated image.
+    4.  Your ONLY output should be the final response from the tool, which contains the preview link and the full-size link to the generated image.
+    5.  **SEVERAL VISUAL AIDS AT ONCE:** If the teacher asks for more than one visual aid (e.g. all the diagrams for a week's lessons) or for options to choose from, call the `generate_visual_aid_batch` tool ONCE instead, with one description per visual aid in `prompts` and `variants` set to the number of options wanted per visual aid (1 if they did not ask for options). The tool returns JSON; present the `gallery_url` first, then each prompt with its preview and full-size links, and mention any prompt that has an `error`.
     """,
     description="A specialist agent that generates simple line drawings or charts for a blackboard based on a teacher's description.",
+    after_model_callback=ARTIFACT_UPLOADS.after_model,
 )
 
-VisualAidAgentRouter = SequentialAgent(
+VisualAidAgentRouter = AgentRoute(
     name="VisualAidAgentRouter",
-    description="Routes requests for creating visual aids, simple drawings, or charts.",
+    description="Routes requests for creating visual aids, simple drawings, or charts, including several diagrams at once.",
     sub_agents=[
         VisualAidAgent
     ],
@@ -133,13 +1509,42 @@ VisualAidAgentRouter = SequentialAgent(
 
 
 
-LessonPlannerAgent = Agent(
-    name="LessonPlannerAgent",
-    model="gemini-2.5-pro", # Using Pro for higher quality, structured, and pedagogically sound plans
-    tools=[], # This agent generates text content and does not require external tools
-    instruction="""
-    **YOUR ROLE:**
-    You are an expert curriculum planner and veteran teacher. You specialize in creating practical, well-structured weekly lesson plans for multi-grade, low-resource classrooms.
+def generate_plan_pdf(plan_text: str, kind: str) -> str:
+    """
+    Renders a lesson plan or game plan as a printable PDF, saves it to Google Cloud
+    Storage and returns its public URL.
+
+    Args:
+        plan_text: The complete plan, exactly as it was presented to the teacher.
+        kind: 'lesson_plan' or 'game_plan'.
+
+    Returns:
+        A string containing the success message and the public URL of the PDF.
+    """
+    print(f"Tool called: Generating {kind} PDF.")
+    if kind not in ("lesson_plan", "game_plan"):
+        return f"Unsupported plan kind '{kind}'. Use 'lesson_plan' or 'game_plan'."
+    try:
+        pdf_bytes = WORKSHEET_RENDERER.render(plan_text, kind=kind)
+        public_url = ARTIFACT_UPLOADS.submit(OUTPUT_BUCKET_NAME, artifact_object_name(kind.replace("_", "-"), pdf_bytes, "pdf"), pdf_bytes, "application/pdf")
+        print(f"PDF is public at: {public_url}")
+        return f"The {kind.replace('_', ' ')} PDF has been successfully created. You can download it here: {public_url}"
+    except Exception:
+        print(f"\n--- ERROR IN generate_plan_pdf ---")
+        traceback.print_exc()
+        return "I'm sorry, I encountered an error creating the PDF."
+
+
+PlanToPdfTool = FunctionTool(func=async_tool(generate_plan_pdf))
+
+
+LessonPlannerAgent = Agent(
+    name="LessonPlannerAgent",
+    model="gemini-2.5-pro", # Using Pro for higher quality, structured, and pedagogically sound plans
+    tools=[PlanToPdfTool], # Only for a printable copy; the plan itself is plain text
+    instruction="""
+    **YOUR ROLE:**
+    You are an expert curriculum planner and veteran teacher. You specialize in creating practical, well-structured weekly lesson plans for multi-grade, low-resource classrooms.
 
     **YOUR GOAL:**
     To take a topic, grade level, and subject from the teacher and create a comprehensive 5-day lesson plan that is easy to follow and implement.
@@ -156,11 +1561,13 @@ LessonPlannerAgent = Agent(
         *   **Homework (Optional):** If appropriate, suggest a simple, short task.
     5.  Make reasonable assumptions if the user's request is brief. Focus on creating a practical, actionable plan.
     6.  You MUST generate the entire 5-day plan in a single, complete response. Do not ask clarifying questions.
+    7.  **PRINTABLE COPY:** Only if the teacher asks for a PDF or printable version (now or about a plan you already wrote), call `generate_plan_pdf` with the complete plan text and `kind='lesson_plan'`, then give them the link.
     """,
-    description="A specialist agent that creates a complete, 5-day, low-resource lesson plan for any given subject and topic.",
+    description="A specialist agent that creates a complete, 5-day, low-resource lesson plan for any given subject and topic, and a printable PDF of it on request.",
+    **RESPONSE_CACHE.callbacks("LessonPlannerAgent", after_model=ARTIFACT_UPLOADS.after_model),
 )
 
-LessonPlannerAgentRouter = SequentialAgent(
+LessonPlannerAgentRouter = AgentRoute(
     name="LessonPlannerAgentRouter",
     description="Routes requests for creating weekly lesson plans, structuring a week of activities, or planning a curriculum for a topic.",
     sub_agents=[
@@ -173,7 +1580,7 @@ LessonPlannerAgentRouter = SequentialAgent(
 GameGeneratorAgent = Agent(
     name="GameGeneratorAgent",
     model=GEMINI_2_PRO, # Using Pro for more creative and structured game design
-    tools=[], # No special tools are needed to generate text-based game rules
+    tools=[PlanToPdfTool], # Only for a printable copy; the game plan itself is plain text
     instruction="""
     **YOUR ROLE:**
     You are an expert in educational game design, specializing in creating simple, engaging, and fun classroom games that require minimal resources (like a blackboard, chalk, or just student participation).
@@ -191,11 +1598,13 @@ GameGeneratorAgent = Agent(
         *   **How to Play:** Provide clear, step-by-step instructions for the teacher on how to run the game from start to finish.
         *   **Game Content (if applicable):** Provide a list of 10-15 words, questions, or problems that the teacher can use immediately for the game (e.g., a list of vocabulary words for Pictionary, simple math problems, etc.).
     4.  You MUST provide the complete game plan in a single, final response. Do not ask for more information. Make reasonable assumptions based on the topic.
+    5.  **PRINTABLE COPY:** Only if the teacher asks for a PDF or printable version (now or about a game you already wrote), call `generate_plan_pdf` with the complete game plan text and `kind='game_plan'`, then give them the link.
     """,
-    description="A specialist agent that designs simple, fun, and low-resource educational games for the classroom based on a given topic.",
+    description="A specialist agent that designs simple, fun, and low-resource educational games for the classroom based on a given topic, and a printable PDF of the game plan on request.",
+    **RESPONSE_CACHE.callbacks("GameGeneratorAgent", after_model=ARTIFACT_UPLOADS.after_model),
 )
 
-GameGeneratorAgentRouter = SequentialAgent(
+GameGeneratorAgentRouter = AgentRoute(
     name="GameGeneratorAgentRouter",
     description="Routes requests for creating educational classroom games, activities, or fun learning exercises.",
     sub_agents=[
@@ -224,9 +1633,10 @@ InstantKnowledgeAgent = Agent(
     7.  You must provide ONLY the final explanation. Do not ask follow-up questions. Do not offer to create audio. Just provide the text explanation.
     """,
     description="An expert at explaining complex topics (like 'Why is the sky blue?') simply, with analogies, in a specified local language.",
+    **RESPONSE_CACHE.callbacks("InstantKnowledgeAgent"),
 )
 
-InstantKnowledgeAgentRouter = SequentialAgent(
+InstantKnowledgeAgentRouter = AgentRoute(
     name="InstantKnowledgeAgentRouter",
     description="Routes requests for simple explanations of complex student questions (e.g., 'why is the sky blue?', 'how do magnets work?').",
     sub_agents=[
@@ -235,94 +1645,1362 @@ InstantKnowledgeAgentRouter = SequentialAgent(
 )
 
 
-# In your main agent file, replace the old tool function with this one.
+# ReadingAssessorAgent
+
+def normalize_words(text):
+    """
+    Lower-cases `text`, drops punctuation and symbols, and splits it into words.
+    Combining marks are kept, so Indic vowel signs (e.g. the matras in "किताब") survive.
+    """
+    cleaned = "".join(ch for ch in text.lower() if unicodedata.category(ch)[0] not in "PS")
+    return cleaned.split()
+
+
+class WordAligner:
+    """
+    Word-level edit-distance aligner for reading assessment.
+
+    Tokens are integer-encoded and the DP is computed one row at a time with NumPy
+    (insertions are resolved with a running minimum instead of a per-cell loop). Long
+    passages are restricted to a diagonal band, so cost is O(N * band) rather than
+    O(N * M). With `fuzzy=True` a substitution between similar-looking words (character
+    bigram Dice similarity) is cheaper than one between unrelated words, which keeps
+    near-misses paired up as mispronunciations instead of a skip plus an insertion.
+
+    `align()` returns SequenceMatcher-style opcodes: (tag, i1, i2, j1, j2) with tag in
+    'equal', 'replace', 'delete', 'insert'. With `open_end=True` the reference may stop
+    early (unread trailing words are free), which is what incremental alignment needs.
+    """
+
+    FULL_DP_MAX_CELLS = 4_000_000
+    # Half-width (in words) of the diagonal band used above FULL_DP_MAX_CELLS. The band
+    # follows the i * M / N diagonal, so it only has to absorb local drift.
+    DEFAULT_BAND = 250
+
+    def __init__(self, fuzzy=True, fuzzy_weight=1.0, band=None):
+        self.fuzzy = fuzzy
+        self.fuzzy_weight = fuzzy_weight
+        self.band = band
+
+    def align(self, reference, hypothesis, open_end=False):
+        n, m = len(reference), len(hypothesis)
+        if open_end and m == 0:
+            return []
+        if n == 0 or m == 0:
+            return ([("delete", 0, n, 0, 0)] if n else []) + ([("insert", n, n, 0, m)] if m else [])
+
+        np = _lazy_import("numpy")
+        ref_codes, hyp_codes, sub_costs = self._encode(reference, hypothesis)
+
+        band = self.band
+        if band is None and (n + 1) * (m + 1) > self.FULL_DP_MAX_CELLS:
+            band = self.DEFAULT_BAND
+
+        all_cols = np.arange(m + 1, dtype=np.float64)
+
+        # rows[i] holds D[i, lo_i:hi_i + 1]; cells outside the band are +inf.
+        lo, hi = 0, self._band_hi(0, n, m, band)
+        rows, offsets = [all_cols[lo:hi + 1].copy()], [lo]
+        for i in range(1, n + 1):
+            prev, plo = rows[-1], offsets[-1]
+            phi = plo + len(prev) - 1
+            lo, hi = self._band_lo(i, n, m, band), self._band_hi(i, n, m, band)
+            width = hi - lo + 1
+
+            # Deletion: D[i-1, j] + 1 (the band only moves right, so lo >= plo).
+            best = np.full(width, np.inf)
+            end = min(hi, phi)
+            if end >= lo:
+                best[:end - lo + 1] = prev[lo - plo:end - plo + 1] + 1.0
+            # Match / substitution: D[i-1, j-1] + cost(ref[i-1], hyp[j-1]).
+            j_start, j_end = max(lo, plo + 1, 1), min(hi, phi + 1)
+            if j_end >= j_start:
+                diag = prev[j_start - 1 - plo:j_end - plo] + sub_costs[ref_codes[i - 1]][hyp_codes[j_start - 1:j_end]]
+                np.minimum(best[j_start - lo:j_end - lo + 1], diag, out=best[j_start - lo:j_end - lo + 1])
+            # Insertion: D[i, j] = min_k<=j(best[k] + (j - k)) = j + running_min(best[k] - k)
+            cols = all_cols[lo:hi + 1]
+            rows.append(np.minimum.accumulate(best - cols) + cols)
+            offsets.append(lo)
+
+        end = n
+        if open_end:
+            # Cheapest (and, on ties, shortest) reference prefix that explains the whole hypothesis.
+            last_col = np.array([r[m - o] if 0 <= m - o < len(r) else np.inf for r, o in zip(rows, offsets)])
+            end = int(np.argmin(last_col))
+        return self._backtrace(rows, offsets, ref_codes, hyp_codes, sub_costs, end, m)
+
+    def _encode(self, reference, hypothesis):
+        """Maps words to integer codes and builds the (ref vocab x hyp vocab) substitution cost table."""
+        np = _lazy_import("numpy")
+        ref_vocab, ref_codes = np.unique(np.asarray(reference, dtype=object).astype(str), return_inverse=True)
+        hyp_vocab, hyp_codes = np.unique(np.asarray(hypothesis, dtype=object).astype(str), return_inverse=True)
+
+        same = ref_vocab[:, None] == hyp_vocab[None, :]
+        # An unrelated substitution costs the same as a skip plus an insertion (2), so the
+        # alignment maximises correctly read words; similar words are discounted below that.
+        if self.fuzzy:
+            sub_costs = 2.0 - self.fuzzy_weight * self._similarity(ref_vocab, hyp_vocab)
+        else:
+            sub_costs = np.full(same.shape, 2.0)
+        sub_costs = np.where(same, 0.0, sub_costs)
+        return ref_codes, hyp_codes, sub_costs
+
+    @staticmethod
+    def _similarity(ref_vocab, hyp_vocab):
+        """Character-bigram Dice similarity between every ref and hyp vocabulary word."""
+        np = _lazy_import("numpy")
+
+        def bigrams(word):
+            padded = f"^{word}$"
+            return {padded[k:k + 2] for k in range(len(padded) - 1)}
+
+        ref_grams = [bigrams(w) for w in ref_vocab]
+        hyp_grams = [bigrams(w) for w in hyp_vocab]
+        index = {g: k for k, g in enumerate(set().union(*ref_grams, *hyp_grams))}
+
+        def incidence(grams_list):
+            matrix = np.zeros((len(grams_list), len(index)), dtype=np.float32)
+            for r, grams in enumerate(grams_list):
+                matrix[r, [index[g] for g in grams]] = 1.0
+            return matrix
+
+        ref_matrix, hyp_matrix = incidence(ref_grams), incidence(hyp_grams)
+        overlap = ref_matrix @ hyp_matrix.T
+        sizes = ref_matrix.sum(axis=1)[:, None] + hyp_matrix.sum(axis=1)[None, :]
+        return 2.0 * overlap / sizes
+
+    @staticmethod
+    def _band_lo(i, n, m, band):
+        return 0 if band is None else max(0, int(i * m / n) - band)
+
+    @staticmethod
+    def _band_hi(i, n, m, band):
+        return m if band is None else min(m, int(i * m / n) + band)
+
+    @staticmethod
+    def _backtrace(rows, offsets, ref_codes, hyp_codes, sub_costs, n, m):
+        def cell(i, j):
+            k = j - offsets[i]
+            return float(rows[i][k]) if 0 <= k < len(rows[i]) else float("inf")
+
+        steps = []
+        i, j = n, m
+        tolerance = 1e-6
+        while i > 0 or j > 0:
+            here = cell(i, j)
+            if i > 0 and j > 0:
+                cost = float(sub_costs[ref_codes[i - 1], hyp_codes[j - 1]])
+                if abs(cell(i - 1, j - 1) + cost - here) < tolerance:
+                    steps.append("equal" if cost == 0.0 else "replace")
+                    i, j = i - 1, j - 1
+                    continue
+            if i > 0 and (j == 0 or abs(cell(i - 1, j) + 1.0 - here) < tolerance):
+                steps.append("delete")
+                i -= 1
+            else:
+                steps.append("insert")
+                j -= 1
+        steps.reverse()
+
+        # Merge consecutive steps of the same kind into opcodes.
+        opcodes = []
+        i = j = 0
+        for tag in steps:
+            di, dj = (0, 1) if tag == "insert" else (1, 0) if tag == "delete" else (1, 1)
+            if opcodes and opcodes[-1][0] == tag:
+                _, i1, _, j1, _ = opcodes[-1]
+                opcodes[-1] = (tag, i1, i + di, j1, j + dj)
+            else:
+                opcodes.append((tag, i, i + di, j, j + dj))
+            i, j = i + di, j + dj
+        return opcodes
+
+
+WORD_ALIGNER = WordAligner()
+
+
+class AssessmentError(Exception):
+    """A problem with a recording that should be shown to the teacher as-is."""
+
+
+# --- Audio probing ---
+# The recording's header is read with a small ranged GET before anything is sent to
+# Speech, so format problems are caught locally instead of after a server round trip.
+
+AUDIO_PROBE_BYTES = 64 * 1024
+# Synchronous recognize() accepts up to one minute of audio; keep a safety margin.
+SYNC_RECOGNIZE_MAX_SECONDS = float(os.getenv("SYNC_RECOGNIZE_MAX_SECONDS", 55))
+SPEECH_MIN_SAMPLE_RATE, SPEECH_MAX_SAMPLE_RATE = 8000, 48000
+SPEECH_RESAMPLE_RATE = 16000
+AUDIO_CONVERT_CHUNK_FRAMES = 64 * 1024
+
+_WAV_FORMAT_PCM, _WAV_FORMAT_FLOAT, _WAV_FORMAT_EXTENSIBLE = 1, 3, 0xFFFE
+
+
+def split_gcs_uri(gcs_uri):
+    """'gs://bucket/path/to/object' -> ('bucket', 'path/to/object')."""
+    if not gcs_uri.startswith("gs://") or "/" not in gcs_uri[5:]:
+        raise AssessmentError(f"'{gcs_uri}' is not a valid GCS URI (expected gs://bucket/object).")
+    bucket_name, object_name = gcs_uri[5:].split("/", 1)
+    return bucket_name, object_name
+
+
+def wav_header(sample_rate, channels, bits_per_sample, data_size):
+    """Builds a canonical 44-byte PCM WAV header."""
+    block_align = channels * bits_per_sample // 8
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE", b"fmt ", 16, _WAV_FORMAT_PCM, channels,
+        sample_rate, sample_rate * block_align, block_align, bits_per_sample, b"data", data_size,
+    )
+
+
+def parse_audio_header(header, total_size):
+    """
+    Reads encoding, sample rate, channels, sample width and duration from the first
+    bytes of a WAV or FLAC file. Returns None if the format is not recognised.
+    """
+    if header[:4] == b"RIFF" and header[8:12] == b"WAVE":
+        info = {"container": "wav"}
+        offset = 12
+        while offset + 8 <= len(header):
+            chunk_id, chunk_size = struct.unpack_from("<4sI", header, offset)
+            body = offset + 8
+            if chunk_id == b"fmt ":
+                fmt, channels, rate, _, _, bits = struct.unpack_from("<HHIIHH", header, body)
+                if fmt == _WAV_FORMAT_EXTENSIBLE and chunk_size >= 40:
+                    fmt = struct.unpack_from("<H", header, body + 24)[0]
+                info.update(wav_format=fmt, channels=channels, sample_rate_hertz=rate, bits_per_sample=bits)
+            elif chunk_id == b"data":
+                # Streamed WAVs may leave the size as 0 / 0xFFFFFFFF; fall back to the object size.
+                available = total_size - body
+                info.update(data_offset=body, data_size=chunk_size if 0 < chunk_size <= available else available)
+                break
+            offset = body + chunk_size + (chunk_size & 1)
+        if "wav_format" not in info or "data_offset" not in info:
+            return None
+        frame_bytes = info["channels"] * info["bits_per_sample"] // 8
+        info["encoding"] = "LINEAR16" if info["wav_format"] == _WAV_FORMAT_PCM and info["bits_per_sample"] == 16 else "WAV_OTHER"
+        info["duration_seconds"] = info["data_size"] / (info["sample_rate_hertz"] * frame_bytes) if frame_bytes else 0.0
+        return info
+
+    if header[:4] == b"fLaC" and len(header) >= 42:
+        # The first metadata block is always STREAMINFO (34 bytes, starting at offset 8).
+        packed = int.from_bytes(header[18:26], "big")
+        rate = packed >> 44
+        channels = ((packed >> 41) & 0x7) + 1
+        bits = ((packed >> 36) & 0x1F) + 1
+        total_samples = packed & 0xFFFFFFFFF
+        return {
+            "container": "flac", "encoding": "FLAC", "channels": channels, "sample_rate_hertz": rate,
+            "bits_per_sample": bits, "duration_seconds": total_samples / rate if rate else 0.0,
+        }
+    return None
+
+
+class PcmConverter:
+    """
+    Streaming WAV PCM -> 16-bit mono converter. Each `feed()` takes whole input frames
+    and returns converted bytes; channels are averaged and the rate is changed with
+    linear interpolation, carrying one sample across chunk boundaries.
+    """
+
+    def __init__(self, in_rate, out_rate, channels, bits_per_sample, wav_format):
+        self.ratio = in_rate / out_rate
+        self.channels = channels
+        self.bits = bits_per_sample
+        self.is_float = wav_format == _WAV_FORMAT_FLOAT
+        self.consumed = 0
+        self.next_out = 0
+        self.tail = None
+
+    @staticmethod
+    def output_frames(in_frames, in_rate, out_rate):
+        return int((in_frames - 1) * out_rate // in_rate) + 1 if in_frames > 0 else 0
+
+    def feed(self, raw):
+        np = _lazy_import("numpy")
+        mono = self._decode(np, raw).reshape(-1, self.channels).mean(axis=1)
+        if self.tail is not None:
+            buf, base = np.concatenate([self.tail, mono]), self.consumed - 1
+        else:
+            buf, base = mono, self.consumed
+        self.consumed += len(mono)
+        if not len(buf):
+            return b""
+        k_end = int((self.consumed - 1) // self.ratio) + 1
+        positions = np.arange(self.next_out, k_end) * self.ratio - base
+        left = np.floor(positions).astype(np.int64)
+        frac = positions - left
+        right = np.minimum(left + 1, len(buf) - 1)
+        out = buf[left] * (1.0 - frac) + buf[right] * frac
+        self.next_out = k_end
+        self.tail = buf[-1:]
+        return np.clip(np.rint(out), -32768, 32767).astype("<i2").tobytes()
+
+    def _decode(self, np, raw):
+        """Decodes raw little-endian samples to floats on the int16 scale."""
+        if self.is_float:
+            return np.frombuffer(raw, dtype="<f4" if self.bits == 32 else "<f8").astype(np.float64) * 32767.0
+        if self.bits == 8:
+            return (np.frombuffer(raw, dtype=np.uint8).astype(np.float64) - 128.0) * 256.0
+        if self.bits == 16:
+            return np.frombuffer(raw, dtype="<i2").astype(np.float64)
+        if self.bits == 24:
+            b = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+            values = b[:, 0] | (b[:, 1] << 8) | (b[:, 2] << 16)
+            return np.where(values >= 1 << 23, values - (1 << 24), values).astype(np.float64) / 256.0
+        if self.bits == 32:
+            return np.frombuffer(raw, dtype="<i4").astype(np.float64) / 65536.0
+        raise AssessmentError(f"{self.bits}-bit WAV audio is not supported.")
+
+
+def probe_audio(gcs_uri):
+    """Fetches object metadata plus the first AUDIO_PROBE_BYTES and parses the audio header."""
+    bucket_name, object_name = split_gcs_uri(gcs_uri)
+    blob = CLIENTS.get("storage").bucket(bucket_name).get_blob(object_name)
+    if blob is None:
+        raise AssessmentError(f"The recording {gcs_uri} could not be found.")
+    if not blob.size:
+        raise AssessmentError("The recording is empty. Please record the student reading again and upload it.")
+    header = blob.download_as_bytes(start=0, end=min(AUDIO_PROBE_BYTES, blob.size) - 1)
+    info = parse_audio_header(header, blob.size)
+    if info is None:
+        raise AssessmentError("The recording is not a WAV or FLAC file. Please record or upload WAV audio.")
+    info.update(gcs_uri=gcs_uri, size_bytes=blob.size, generation=blob.generation, md5_hash=blob.md5_hash)
+    return info
+
+
+def _needs_conversion(info):
+    if info["container"] != "wav":
+        return False
+    rate_ok = SPEECH_MIN_SAMPLE_RATE <= info["sample_rate_hertz"] <= SPEECH_MAX_SAMPLE_RATE
+    return info["encoding"] != "LINEAR16" or info["channels"] != 1 or not rate_ok
+
+
+def _convert_wav(info):
+    """
+    Streams a WAV that Speech cannot take as-is (multi-channel, non-16-bit, or an
+    unsupported rate) into a 16-bit mono copy next to the original and returns its probe
+    info. Audio is read and written in chunks; the file is never fully held in memory.
+    """
+    bucket_name, object_name = split_gcs_uri(info["gcs_uri"])
+    in_rate = info["sample_rate_hertz"]
+    out_rate = in_rate if SPEECH_MIN_SAMPLE_RATE <= in_rate <= SPEECH_MAX_SAMPLE_RATE else SPEECH_RESAMPLE_RATE
+    target_name = f"{object_name}.{info['generation']}.mono{out_rate}.wav"
+    bucket = CLIENTS.get("storage").bucket(bucket_name)
+    frame_bytes = info["channels"] * info["bits_per_sample"] // 8
+    in_frames = info["data_size"] // frame_bytes
+    out_frames = PcmConverter.output_frames(in_frames, in_rate, out_rate)
+    converted = dict(info, gcs_uri=f"gs://{bucket_name}/{target_name}", encoding="LINEAR16", channels=1,
+                     bits_per_sample=16, sample_rate_hertz=out_rate, wav_format=_WAV_FORMAT_PCM)
+
+    target = bucket.blob(target_name)
+    if target.exists():
+        return converted
+
+    print(f"Converting {info['gcs_uri']} ({info['channels']} ch, {info['bits_per_sample']}-bit, {in_rate} Hz) to 16-bit mono {out_rate} Hz.")
+    converter = PcmConverter(in_rate, out_rate, info["channels"], info["bits_per_sample"], info["wav_format"])
+    with bucket.blob(object_name).open("rb") as reader, target.open("wb", content_type="audio/wav") as writer:
+        writer.write(wav_header(out_rate, 1, 16, out_frames * 2))
+        reader.seek(info["data_offset"])
+        remaining = in_frames * frame_bytes
+        while remaining > 0:
+            raw = reader.read(min(remaining, AUDIO_CONVERT_CHUNK_FRAMES * frame_bytes))
+            if not raw:
+                break
+            raw = raw[:len(raw) - len(raw) % frame_bytes]
+            remaining -= len(raw)
+            writer.write(converter.feed(raw))
+    return converted
+
+
+# --- Transcript cache ---
+# Re-running an assessment on the same recording (fixed passage text, follow-up
+# question) reuses the transcript; only the local alignment and metrics are redone.
+
+# Recognition settings that affect the transcript; bump RECOGNITION_VERSION when changing them.
+RECOGNITION_VERSION = 1
+TRANSCRIPT_CACHE = ResultCache(
+    "transcripts",
+    ttl_seconds=int(os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", 90 * 24 * 3600)),
+    max_entries=int(os.getenv("TRANSCRIPT_CACHE_MAX_ENTRIES", 256)),
+    max_persisted_entries=int(os.getenv("TRANSCRIPT_CACHE_MAX_PERSISTED", 50000)),
+)
+
+
+class WordTimings:
+    """Recognized words with their start/end offsets (seconds) as parallel float32 arrays."""
+
+    __slots__ = ("words", "starts", "ends")
+
+    def __init__(self, words, starts, ends):
+        self.words = list(words)
+        self.starts = array("f", starts)
+        self.ends = array("f", ends)
+
+    @classmethod
+    def from_words_info(cls, words_info):
+        return cls(
+            [w.word for w in words_info],
+            [w.start_time.total_seconds() for w in words_info],
+            [w.end_time.total_seconds() for w in words_info],
+        )
+
+    @property
+    def duration_seconds(self):
+        return float(self.ends[-1]) if self.ends else 0.0
+
+    def to_dict(self):
+        return {
+            "words": self.words,
+            "starts": base64.b64encode(self.starts.tobytes()).decode("ascii"),
+            "ends": base64.b64encode(self.ends.tobytes()).decode("ascii"),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        starts, ends = array("f"), array("f")
+        starts.frombytes(base64.b64decode(data["starts"]))
+        ends.frombytes(base64.b64decode(data["ends"]))
+        return cls(data["words"], starts, ends)
+
+
+class RecognitionJob:
+    """
+    A started, finished or cached recognition with an operation-like done()/result().
+    `result()` returns (transcript, WordTimings) and stores new transcripts in the cache.
+    """
+
+    def __init__(self, key, operation=None, response=None, cached=None):
+        self.key = key
+        self._operation = operation
+        self._response = response
+        self._cached = cached
+
+    def done(self):
+        return self._cached is not None or self._response is not None or self._operation.done()
+
+    async def result_async(self, timeout=300):
+        """result() for async callers: the operation is polled instead of blocked on."""
+        if self._cached is None and self._response is None:
+            self._response = await await_operation(self._operation, timeout)
+        return await run_in_tool_pool(self.result)
+
+    def result(self, timeout=300):
+        if self._cached is None:
+            response = self._response if self._response is not None else self._operation.result(timeout=timeout)
+            transcript, timings = _transcript_from_response(response)
+            self._cached = {"transcript": transcript, "timings": timings.to_dict()}
+            TRANSCRIPT_CACHE.put(self.key, self._cached)
+        return self._cached["transcript"], WordTimings.from_dict(self._cached["timings"])
+
+
+def _start_recognition(student_audio_gcs_uri, language_code):
+    """
+    Probes the recording and returns a RecognitionJob. Cached transcripts (same object
+    generation, language and settings) are returned without calling Speech; otherwise
+    the audio is converted locally if needed and recognized with synchronous recognize()
+    for short clips or long_running_recognize() for longer ones.
+    """
+    info = probe_audio(student_audio_gcs_uri)
+    key = cache_key(
+        info["gcs_uri"], info["generation"], info["md5_hash"], language_code, RECOGNITION_VERSION,
+        info["encoding"], info["sample_rate_hertz"], info["channels"], info["bits_per_sample"],
+    )
+    cached = TRANSCRIPT_CACHE.get(key)
+    if cached is not None:
+        print(f"Transcript cache hit for {student_audio_gcs_uri} (generation {info['generation']}).")
+        return RecognitionJob(key, cached=cached)
+
+    speech = _lazy_import("google.cloud.speech")
+    client = CLIENTS.get("speech")
+    if _needs_conversion(info):
+        info = _convert_wav(info)
+    audio = speech.RecognitionAudio(uri=info["gcs_uri"])
+
+    # Encoding and sample rate come from the file header instead of being assumed.
+    config = speech.RecognitionConfig(
+        encoding=speech.RecognitionConfig.AudioEncoding[info["encoding"]],
+        sample_rate_hertz=info["sample_rate_hertz"],
+        audio_channel_count=info["channels"],
+        language_code=language_code,
+        enable_word_time_offsets=True,
+        enable_automatic_punctuation=True,
+    )
+
+    if info["duration_seconds"] <= SYNC_RECOGNIZE_MAX_SECONDS:
+        print(f"Short clip ({info['duration_seconds']:.1f}s, {info['sample_rate_hertz']} Hz): using synchronous recognize.")
+        return RecognitionJob(key, response=client.recognize(config=config, audio=audio))
+    print(f"Requesting long-running transcription ({info['duration_seconds']:.1f}s, {info['sample_rate_hertz']} Hz)...")
+    return RecognitionJob(key, operation=client.long_running_recognize(config=config, audio=audio))
+
+
+def _transcript_from_response(response):
+    """Joins the top alternative of every result into (transcript, WordTimings)."""
+    if not response.results:
+        raise AssessmentError("Could not understand any speech. The audio file might be silent.")
+
+    transcript = ""
+    words_info = []
+    for result in response.results:
+        if result.alternatives:
+            transcript += result.alternatives[0].transcript + " "
+            words_info.extend(result.alternatives[0].words)
+
+    transcript = transcript.strip()
+    if not transcript:
+        raise AssessmentError("Transcription was empty. The audio might be silent.")
+    return transcript, WordTimings.from_words_info(words_info)
+
+
+class ProsodyAnalyzer:
+    """
+    Objective fluency features computed from the recognized word time offsets.
+
+    The timings are loaded into NumPy arrays once and every feature is a vectorized pass
+    over them: the inter-word pause distribution, long hesitations, WPM over sliding
+    windows, repetitions and self-corrections (found among the words the alignment marks
+    as extra) and words-correct-per-minute. The qualitative step of the agent reads these
+    instead of making a second multimodal pass over the recording.
+    """
+
+    PAUSE_SECONDS = 0.3
+    LONG_HESITATION_SECONDS = 1.0
+    WINDOW_SECONDS = 10.0
+    STEP_SECONDS = 2.0
+    # An extra word this similar to (or a prefix of) the next word is an abandoned attempt.
+    SELF_CORRECTION_SIMILARITY = 0.5
+    MAX_LISTED = 10
+    # Longer window series are subsampled evenly so the report stays small.
+    MAX_SERIES_POINTS = 30
+
+    def analyze(self, timings, reference_words, transcript_words, opcodes, correct_words):
+        np = _lazy_import("numpy")
+        words, starts, ends = self._tokens(timings)
+        if not words:
+            return {}
+        if words != transcript_words:
+            # The word list and the joined transcript normally agree; realign if they don't.
+            opcodes = WORD_ALIGNER.align(reference_words, words)
+
+        reading_seconds = float(ends[-1] - starts[0])
+        gaps = np.clip(starts[1:] - ends[:-1], 0.0, None)
+        pauses = gaps[gaps >= self.PAUSE_SECONDS]
+        long_idx = np.flatnonzero(gaps >= self.LONG_HESITATION_SECONDS)
+
+        tokens = np.asarray(words, dtype=object)
+        extra = self._extra_mask(opcodes, len(words))
+        repeated = extra & self._neighbour_equal(tokens)
+        corrected = extra & ~repeated & self._attempt_mask(tokens, extra)
+
+        return {
+            "reading_time_seconds": round(reading_seconds, 2),
+            "words_correct_per_minute": int(correct_words * 60.0 / reading_seconds) if reading_seconds > 0 else 0,
+            "pauses": {
+                "count": int(pauses.size),
+                "total_seconds": round(float(pauses.sum()), 2),
+                "mean_seconds": round(float(pauses.mean()), 2) if pauses.size else 0.0,
+                "median_seconds": round(float(np.median(pauses)), 2) if pauses.size else 0.0,
+                "p90_seconds": round(float(np.percentile(pauses, 90)), 2) if pauses.size else 0.0,
+                "max_seconds": round(float(gaps.max()), 2) if gaps.size else 0.0,
+            },
+            "long_hesitations": [
+                {"after_word": words[i], "before_word": words[i + 1], "at_seconds": round(float(ends[i]), 2), "pause_seconds": round(float(gaps[i]), 2)}
+                for i in long_idx[:self.MAX_LISTED]
+            ],
+            "long_hesitation_count": int(long_idx.size),
+            "words_per_minute_windows": self._window_wpm(starts, ends, reading_seconds),
+            "repetitions": [
+                {"words": " ".join(words[a:b]), "at_seconds": round(float(starts[a]), 2)}
+                for a, b in self._spans(repeated)[:self.MAX_LISTED]
+            ],
+            "self_corrections": [
+                {"attempt": " ".join(words[a:b]), "corrected_to": words[b], "at_seconds": round(float(starts[a]), 2)}
+                for a, b in self._spans(corrected)[:self.MAX_LISTED]
+            ],
+        }
+
+    @staticmethod
+    def _tokens(timings):
+        """Normalized words with their offsets; a recognized word may normalize to 0 or several tokens."""
+        np = _lazy_import("numpy")
+        per_word = [normalize_words(w) for w in timings.words]
+        counts = [len(p) for p in per_word]
+        words = [t for p in per_word for t in p]
+        starts = np.repeat(np.asarray(timings.starts, dtype=np.float64), counts)
+        ends = np.repeat(np.asarray(timings.ends, dtype=np.float64), counts)
+        return words, starts, ends
+
+    @staticmethod
+    def _extra_mask(opcodes, size):
+        """Transcript positions not paired with a reference word (inserts, and the surplus of a replace)."""
+        np = _lazy_import("numpy")
+        extra = np.zeros(size, dtype=bool)
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "insert":
+                extra[j1:j2] = True
+            elif tag == "replace" and j2 - j1 > i2 - i1:
+                extra[j1:j2 - (i2 - i1)] = True
+        return extra
+
+    @staticmethod
+    def _neighbour_equal(tokens):
+        """True where a token repeats a word (or word pair) directly before or after it."""
+        np = _lazy_import("numpy")
+        equal = np.zeros(len(tokens), dtype=bool)
+        for lag in (1, 2):
+            if len(tokens) > lag:
+                same = tokens[lag:] == tokens[:-lag]
+                equal[lag:] |= same
+                equal[:-lag] |= same
+        return equal
+
+    def _attempt_mask(self, tokens, extra):
+        """True where an extra token is a near-miss of the following, paired word."""
+        np = _lazy_import("numpy")
+        mask = np.zeros(len(tokens), dtype=bool)
+        candidates = np.flatnonzero(extra[:-1] & ~extra[1:] & (tokens[:-1] != tokens[1:]))
+        if candidates.size:
+            attempts, targets = tokens[candidates].astype(str), tokens[candidates + 1].astype(str)
+            similarity = np.diagonal(WordAligner._similarity(attempts, targets))
+            prefix = np.char.startswith(targets, attempts)
+            mask[candidates] = prefix | (similarity >= self.SELF_CORRECTION_SIMILARITY)
+            # An attempt can span several extra words ("ki ki- kitab"): extend each hit leftwards.
+            for i in np.flatnonzero(mask):
+                while i > 0 and extra[i - 1] and not mask[i - 1]:
+                    i -= 1
+                    mask[i] = True
+        return mask
+
+    def _window_wpm(self, starts, ends, reading_seconds):
+        """WPM in WINDOW_SECONDS windows every STEP_SECONDS (one window for short readings)."""
+        np = _lazy_import("numpy")
+        if reading_seconds <= self.WINDOW_SECONDS:
+            series = np.array([len(starts) * 60.0 / reading_seconds if reading_seconds > 0 else 0.0])
+        else:
+            window_starts = np.arange(starts[0], ends[-1] - self.WINDOW_SECONDS + 1e-9, self.STEP_SECONDS)
+            counts = np.searchsorted(starts, window_starts + self.WINDOW_SECONDS) - np.searchsorted(starts, window_starts)
+            series = counts * 60.0 / self.WINDOW_SECONDS
+        return {
+            "window_seconds": self.WINDOW_SECONDS,
+            "step_seconds": self.STEP_SECONDS,
+            "min": int(series.min()),
+            "max": int(series.max()),
+            "std": round(float(series.std()), 1),
+            "series": [int(v) for v in series[np.linspace(0, len(series) - 1, min(len(series), self.MAX_SERIES_POINTS)).astype(int)]],
+        }
+
+    @staticmethod
+    def _spans(mask):
+        """[start, end) runs of True in a boolean array."""
+        np = _lazy_import("numpy")
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.astype(np.int8), [0]))))
+        return [(int(a), int(b)) for a, b in edges.reshape(-1, 2)]
+
+
+PROSODY_ANALYZER = ProsodyAnalyzer()
+
+
+def _fluency_report(original_text, transcript, timings):
+    """Aligns the transcript against the passage and computes the objective metrics."""
+    original_words = normalize_words(original_text)
+    transcript_words = normalize_words(transcript)
+    opcodes = WORD_ALIGNER.align(original_words, transcript_words)
+    correct_count=0; skipped_words=[]; added_words=[]; mispronounced_details=[]
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == 'equal': correct_count += (i2 - i1)
+        elif tag == 'replace': mispronounced_details.append({"expected": " ".join(original_words[i1:i2]), "heard": " ".join(transcript_words[j1:j2])})
+        elif tag == 'delete': skipped_words.extend(original_words[i1:i2])
+        elif tag == 'insert': added_words.extend(transcript_words[j1:j2])
+    total_original_words = len(original_words)
+    accuracy = (correct_count / total_original_words) * 100 if total_original_words > 0 else 0
+    audio_duration_seconds = timings.duration_seconds
+    audio_duration_minutes = audio_duration_seconds / 60.0
+    wpm = (len(transcript_words) / audio_duration_minutes) if audio_duration_minutes > 0 else 0
+    prosody = PROSODY_ANALYZER.analyze(timings, original_words, transcript_words, opcodes, correct_count)
+    return {"objective_metrics": {"accuracy_percent": round(accuracy, 1), "words_per_minute": int(wpm), "correct_words": correct_count, "total_words": total_original_words, "audio_duration_seconds": round(audio_duration_seconds, 2)}, "error_analysis": {"mispronounced": mispronounced_details, "skipped": skipped_words, "added": added_words}, "prosody": prosody, "full_transcript": transcript}
+
+
+def _assessment_error_message(e):
+    # Make the error message helpful for the teacher
+    if isinstance(e, AssessmentError):
+        return str(e)
+    if "sample rate" in str(e):
+        return "The audio assessment failed because the audio format could not be read. Please upload a WAV or FLAC recording."
+    return f"An unexpected error occurred during the assessment: {str(e)}"
+
+
+def assess_reading_fluency(original_text: str, student_audio_gcs_uri: str, language_code: str, student_id: str = "", class_id: str = "") -> str:
+    """
+    Analyzes a student's reading audio against an original text to assess fluency.
+    Accepts WAV or FLAC audio; encoding, sample rate and channel count are read from the file.
+
+    Args:
+        original_text: The correct text passage the student was supposed to read.
+        student_audio_gcs_uri: The GCS URI of the student's audio file (e.g., 'gs://bucket_name/audio.wav').
+        language_code: The BCP-47 language code of the reading passage (e.g., 'en-IN', 'hi-IN').
+        student_id: Optional. The student's name or roll number, used to save the result to their reading history. Empty (the default) means the result is not saved.
+        class_id: Optional. The student's class or section (e.g., '3B'). Empty by default.
+
+    Returns:
+        A JSON string containing the structured reading assessment report.
+    """
+    print(f"Tool called: assess_reading_fluency for audio at {student_audio_gcs_uri}")
+    try:
+        job = _start_recognition(student_audio_gcs_uri, language_code)
+        transcript, timings = job.result(timeout=300)
+        return _assessment_result(original_text, language_code, student_id, class_id, transcript, timings)
+    except Exception as e:
+        return _assessment_failure(e)
+
+
+async def _assess_reading_fluency_async(original_text, student_audio_gcs_uri, language_code, student_id="", class_id=""):
+    """Async body of assess_reading_fluency: the transcription is polled, never blocked on."""
+    print(f"Tool called: assess_reading_fluency for audio at {student_audio_gcs_uri}")
+    try:
+        job = await run_in_tool_pool(_start_recognition, student_audio_gcs_uri, language_code)
+        transcript, timings = await job.result_async(timeout=300)
+        return await run_in_tool_pool(_assessment_result, original_text, language_code, student_id, class_id, transcript, timings)
+    except Exception as e:
+        return _assessment_failure(e)
+
+
+def _assessment_result(original_text, language_code, student_id, class_id, transcript, timings):
+    """Shared by the sync and async tool bodies once the transcript is in: report, history, JSON."""
+    print(f"Transcription successful: '{transcript}'")
+    report = _fluency_report(original_text, transcript, timings)
+    _record_assessment(report, student_id, class_id, original_text, language_code)
+    return json.dumps(report)
+
+
+def _assessment_failure(e):
+    print(f"\n--- ERROR IN assess_reading_fluency ---")
+    return json.dumps({"error": _assessment_error_message(e)})
+
+
+# --- Whole-class assessment ---
+
+# A typical class (30-40 recordings) fits in one wave; lower this if the Speech quota is tight.
+ASR_MAX_IN_FLIGHT = int(os.getenv("ASR_MAX_IN_FLIGHT", 40))
+ASR_BATCH_TIMEOUT_SECONDS = int(os.getenv("ASR_BATCH_TIMEOUT_SECONDS", 600))
+
+
+def _recognize_all(gcs_uris, language_code, max_in_flight=ASR_MAX_IN_FLIGHT, timeout=ASR_BATCH_TIMEOUT_SECONDS):
+    """
+    Runs long-running recognition for every URI with at most `max_in_flight` jobs open at
+    once. A single loop polls all open operations, so total latency tracks the slowest
+    recording rather than the sum. Returns one ((transcript, timings), error) pair per URI.
+    """
+    outcomes = [(None, None)] * len(gcs_uris)
+    waiting = list(range(len(gcs_uris)))
+    waiting.reverse()
+    starting = {}
+    running = {}
+    io_pool = get_io_pool()
+    deadline = time.monotonic() + timeout
+    poll_interval = 0.5
+
+    while waiting or starting or running:
+        while waiting and len(starting) + len(running) < max_in_flight:
+            poll_interval = 0.5
+            idx = waiting.pop()
+            starting[io_pool.submit(_start_recognition, gcs_uris[idx], language_code)] = idx
+
+        for future in [f for f in starting if f.done()]:
+            idx = starting.pop(future)
+            try:
+                running[idx] = future.result()
+            except Exception as e:
+                outcomes[idx] = (None, e)
+
+        # Each done() call refreshes the operation; run them side by side.
+        finished = [idx for idx, done in zip(list(running), io_pool.map(lambda op: op.done(), list(running.values()))) if done]
+        for idx in finished:
+            operation = running.pop(idx)
+            try:
+                outcomes[idx] = (operation.result(), None)
+            except Exception as e:
+                outcomes[idx] = (None, e)
+
+        if time.monotonic() > deadline:
+            for idx in list(running) + list(starting.values()) + waiting:
+                outcomes[idx] = (None, TimeoutError("Transcription did not finish in time."))
+            break
+        if waiting or starting or running:
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 1.5, 2.0)
+    return outcomes
+
+
+async def _recognize_all_async(gcs_uris, language_code, max_in_flight=ASR_MAX_IN_FLIGHT, timeout=ASR_BATCH_TIMEOUT_SECONDS):
+    """
+    _recognize_all for async callers: each recording is started on the tool pool and its
+    operation awaited with await_operation, so no thread is held while Speech works.
+    """
+    slots = asyncio.Semaphore(max_in_flight)
+
+    async def recognize(gcs_uri):
+        async with slots:
+            job = await run_in_tool_pool(_start_recognition, gcs_uri, language_code)
+            return await job.result_async(timeout=timeout)
+
+    async def outcome(gcs_uri):
+        try:
+            return await asyncio.wait_for(recognize(gcs_uri), timeout), None
+        except asyncio.TimeoutError:
+            return None, TimeoutError("Transcription did not finish in time.")
+        except Exception as e:
+            return None, e
+
+    return await asyncio.gather(*(outcome(uri) for uri in gcs_uris))
+
+
+def _class_summary(reports):
+    """Aggregates per-student reports into class-level figures."""
+    metrics = [r["objective_metrics"] for r in reports]
+    if not metrics:
+        return {"students_assessed": 0}
+    accuracies = [m["accuracy_percent"] for m in metrics]
+    speeds = [m["words_per_minute"] for m in metrics]
+    # Count each word once per student: three skips of "the" by one reader is one student.
+    skipped = Counter(w for r in reports for w in set(r["error_analysis"]["skipped"]))
+    mispronounced = Counter(w for r in reports for w in {d["expected"] for d in r["error_analysis"]["mispronounced"]})
+    return {
+        "students_assessed": len(metrics),
+        "mean_accuracy_percent": round(statistics.fmean(accuracies), 1),
+        "median_accuracy_percent": round(statistics.median(accuracies), 1),
+        "mean_words_per_minute": round(statistics.fmean(speeds), 1),
+        "median_words_per_minute": round(statistics.median(speeds), 1),
+        "most_skipped_words": [{"word": w, "students": c} for w, c in skipped.most_common(10)],
+        "most_mispronounced_words": [{"word": w, "students": c} for w, c in mispronounced.most_common(10)],
+    }
+
+
+def assess_class_reading_fluency(original_text: str, student_ids: list[str], student_audio_gcs_uris: list[str], language_code: str, class_id: str) -> str:
+    """
+    Assesses a whole class reading the same passage. All recordings are transcribed
+    concurrently and the result contains a report per student plus class-level aggregates.
+
+    Args:
+        original_text: The correct text passage every student was supposed to read.
+        student_ids: The name or roll number of each student, in the same order as the recordings.
+        student_audio_gcs_uris: The GCS URI of each student's recording (e.g., 'gs://bucket_name/audio.wav').
+        language_code: The BCP-47 language code of the reading passage (e.g., 'en-IN', 'hi-IN').
+        class_id: The class or section being assessed (e.g., '3B'), used to save the results. Pass an empty string if unknown.
+
+    Returns:
+        A JSON string with per-student reports and a class summary.
+    """
+    print(f"Tool called: assess_class_reading_fluency for {len(student_audio_gcs_uris)} recordings")
+    try:
+        if len(student_ids) != len(student_audio_gcs_uris):
+            return json.dumps({"error": "Please provide exactly one student name for each recording."})
+
+        started = time.perf_counter()
+        outcomes = _recognize_all(student_audio_gcs_uris, language_code)
+        return _class_assessment_result(original_text, student_ids, language_code, class_id, outcomes, started)
+    except Exception as e:
+        return _class_assessment_failure(e)
+
+
+async def _assess_class_reading_fluency_async(original_text, student_ids, student_audio_gcs_uris, language_code, class_id):
+    """Async body of assess_class_reading_fluency: every transcription is polled, never blocked on."""
+    print(f"Tool called: assess_class_reading_fluency for {len(student_audio_gcs_uris)} recordings")
+    try:
+        if len(student_ids) != len(student_audio_gcs_uris):
+            return json.dumps({"error": "Please provide exactly one student name for each recording."})
+
+        started = time.perf_counter()
+        outcomes = await _recognize_all_async(student_audio_gcs_uris, language_code)
+        return await run_in_tool_pool(_class_assessment_result, original_text, student_ids, language_code, class_id, outcomes, started)
+    except Exception as e:
+        return _class_assessment_failure(e)
+
+
+def _class_assessment_result(original_text, student_ids, language_code, class_id, outcomes, started):
+    """Shared by the sync and async tool bodies once the transcripts are in: reports, history, summary, JSON."""
+
+    def build(student_id, outcome):
+        result, error = outcome
+        try:
+            if error is not None:
+                raise error
+            transcript, timings = result
+            report = _fluency_report(original_text, transcript, timings)
+            _record_assessment(report, student_id, class_id, original_text, language_code)
+            return {"student_id": student_id, **report}
+        except Exception as e:
+            return {"student_id": student_id, "error": _assessment_error_message(e)}
+
+    students = list(get_io_pool().map(build, student_ids, outcomes))
+    summary = _class_summary([s for s in students if "error" not in s])
+    summary["students_failed"] = sum(1 for s in students if "error" in s)
+    print(f"Class assessment finished in {time.perf_counter() - started:.1f}s.")
+    return json.dumps({"class_summary": summary, "students": students}, ensure_ascii=False)
+
+
+def _class_assessment_failure(e):
+    print(f"\n--- ERROR IN assess_class_reading_fluency ---")
+    traceback.print_exc()
+    return json.dumps({"error": f"An unexpected error occurred during the class assessment: {str(e)}"})
+
+
+# --- Fluency history ---
+# Every assessment that names a student is appended to a local SQLite store so progress
+# can be tracked without re-running assessments. Words are dictionary-encoded and the
+# error lists are stored as packed int32 word ids; queries pull only the indexed rows
+# they need and aggregate them with NumPy.
+
+class FluencyStore:
+    """
+    Persistent store of reading-assessment results with a small query API.
+
+    Rows are indexed on (student, date), (class, date), (passage, date) and date, so
+    each query is a single range scan; aggregation (trends, percentiles, word counts)
+    happens on NumPy arrays built from the scanned columns.
+    """
+
+    SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS words (word_id INTEGER PRIMARY KEY, word TEXT NOT NULL UNIQUE)",
+        "CREATE TABLE IF NOT EXISTS passages (passage_id INTEGER PRIMARY KEY, digest TEXT NOT NULL UNIQUE, language_code TEXT, total_words INTEGER, text TEXT)",
+        """CREATE TABLE IF NOT EXISTS assessments (
+            id INTEGER PRIMARY KEY, student_id TEXT NOT NULL, class_id TEXT, passage_id INTEGER NOT NULL,
+            assessed_at REAL NOT NULL, accuracy REAL, wpm INTEGER, wcpm INTEGER, correct_words INTEGER,
+            total_words INTEGER, duration_seconds REAL, skipped BLOB, mispronounced BLOB, added BLOB)""",
+        "CREATE INDEX IF NOT EXISTS assessments_student ON assessments (student_id, assessed_at)",
+        "CREATE INDEX IF NOT EXISTS assessments_class ON assessments (class_id, assessed_at)",
+        "CREATE INDEX IF NOT EXISTS assessments_passage ON assessments (passage_id, assessed_at)",
+        "CREATE INDEX IF NOT EXISTS assessments_date ON assessments (assessed_at)",
+    )
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._word_ids = {}
+        self._db = None
+
+    def _connect(self):
+        if self._db is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            db = sqlite3.connect(self.path, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.SCHEMA:
+                db.execute(statement)
+            db.commit()
+            self._db = db
+        return self._db
+
+    def record(self, report, student_id, class_id, passage_text, language_code, assessed_at=None):
+        """Stores one fluency report (as built by _fluency_report). Returns the row id."""
+        metrics = report["objective_metrics"]
+        errors = report["error_analysis"]
+        prosody = report.get("prosody") or {}
+        with self._lock:
+            db = self._connect()
+            passage_id = self._passage_id(db, passage_text, language_code, metrics["total_words"])
+            row = (
+                student_id, class_id or None, passage_id, assessed_at or time.time(),
+                metrics["accuracy_percent"], metrics["words_per_minute"], prosody.get("words_correct_per_minute"),
+                metrics["correct_words"], metrics["total_words"], metrics["audio_duration_seconds"],
+                self._pack(db, errors["skipped"]),
+                self._pack(db, [d["expected"] for d in errors["mispronounced"]]),
+                self._pack(db, errors["added"]),
+            )
+            cursor = db.execute(
+                "INSERT INTO assessments (student_id, class_id, passage_id, assessed_at, accuracy, wpm, wcpm, correct_words,"
+                " total_words, duration_seconds, skipped, mispronounced, added) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                row,
+            )
+            db.commit()
+            return cursor.lastrowid
+
+    def progress(self, student_id, since=None, until=None):
+        """A student's assessments over time plus per-week trends for accuracy and WCPM."""
+        np = _lazy_import("numpy")
+        rows = self._select(
+            "SELECT assessed_at, accuracy, wpm, COALESCE(wcpm, 0), passage_id FROM assessments WHERE student_id = ?",
+            (student_id,), since, until,
+        )
+        if not rows:
+            return {"student_id": student_id, "assessments": 0}
+        columns = np.array(rows, dtype=np.float64)
+        when, accuracy, wpm, wcpm = columns[:, 0], columns[:, 1], columns[:, 2], columns[:, 3]
+        weeks = (when - when[0]) / (7 * 24 * 3600)
+
+        def trend(values):
+            # Least-squares slope per week; meaningless until the readings span some time.
+            return round(float(np.polyfit(weeks, values, 1)[0]), 2) if weeks[-1] > 0 else 0.0
+
+        return {
+            "student_id": student_id,
+            "assessments": len(rows),
+            "first": self._point(rows[0]),
+            "latest": self._point(rows[-1]),
+            "best_accuracy_percent": round(float(accuracy.max()), 1),
+            "mean_accuracy_percent": round(float(accuracy.mean()), 1),
+            "mean_words_per_minute": round(float(wpm.mean()), 1),
+            "accuracy_change_per_week": trend(accuracy),
+            "wcpm_change_per_week": trend(wcpm),
+            "history": [self._point(r) for r in rows[-20:]],
+        }
+
+    def class_percentiles(self, class_id, since=None, until=None, percentiles=(10, 25, 50, 75, 90)):
+        """Percentiles of each student's most recent accuracy, WPM and WCPM in the class."""
+        np = _lazy_import("numpy")
+        rows = self._select(
+            "SELECT student_id, accuracy, wpm, COALESCE(wcpm, 0) FROM assessments WHERE class_id = ?",
+            (class_id,), since, until,
+        )
+        if not rows:
+            return {"class_id": class_id, "students": 0}
+        students = np.array([r[0] for r in rows], dtype=object)
+        values = np.array([r[1:] for r in rows], dtype=np.float64)
+        # Rows are in date order: keep the last row of every student.
+        _, last = np.unique(students[::-1], return_index=True)
+        latest = values[len(rows) - 1 - last]
+        table = np.percentile(latest, percentiles, axis=0)
+        names = ("accuracy_percent", "words_per_minute", "words_correct_per_minute")
+        return {
+            "class_id": class_id,
+            "students": int(latest.shape[0]),
+            "assessments": len(rows),
+            "percentiles": {
+                name: {f"p{p}": round(float(v), 1) for p, v in zip(percentiles, table[:, k])}
+                for k, name in enumerate(names)
+            },
+        }
+
+    def most_missed_words(self, class_id=None, student_id=None, since=None, until=None, limit=20):
+        """Words most often skipped or mispronounced, optionally within a class or for one student."""
+        np = _lazy_import("numpy")
+        where, params = [], []
+        if class_id:
+            where.append("class_id = ?"); params.append(class_id)
+        if student_id:
+            where.append("student_id = ?"); params.append(student_id)
+        sql = "SELECT skipped, mispronounced FROM assessments" + (" WHERE " + " AND ".join(where) if where else "")
+        rows = self._select(sql, tuple(params), since, until)
+        skipped = np.frombuffer(b"".join(r[0] or b"" for r in rows), dtype="<i4")
+        mispronounced = np.frombuffer(b"".join(r[1] or b"" for r in rows), dtype="<i4")
+        if not skipped.size and not mispronounced.size:
+            return []
+        size = int(max(skipped.max(initial=0), mispronounced.max(initial=0))) + 1
+        skip_counts = np.bincount(skipped, minlength=size)
+        wrong_counts = np.bincount(mispronounced, minlength=size)
+        totals = skip_counts + wrong_counts
+        top = np.argsort(-totals, kind="stable")[:limit]
+        top = top[totals[top] > 0]
+        words = self._words(top.tolist())
+        return [
+            {"word": words[i], "missed": int(totals[i]), "skipped": int(skip_counts[i]), "mispronounced": int(wrong_counts[i])}
+            for i in top.tolist()
+        ]
+
+    def _select(self, sql, params, since, until):
+        if since is not None:
+            sql += (" AND" if " WHERE " in sql else " WHERE") + " assessed_at >= ?"; params += (since,)
+        if until is not None:
+            sql += (" AND" if " WHERE " in sql else " WHERE") + " assessed_at < ?"; params += (until,)
+        with self._lock:
+            return self._connect().execute(sql + " ORDER BY assessed_at", params).fetchall()
+
+    @staticmethod
+    def _point(row):
+        return {
+            "date": time.strftime("%Y-%m-%d", time.gmtime(row[0])),
+            "accuracy_percent": round(row[1], 1),
+            "words_per_minute": int(row[2]),
+            "words_correct_per_minute": int(row[3]),
+        }
+
+    def _passage_id(self, db, text, language_code, total_words):
+        digest = hashlib.sha1(" ".join(normalize_words(text)).encode("utf-8")).hexdigest()
+        db.execute(
+            "INSERT OR IGNORE INTO passages (digest, language_code, total_words, text) VALUES (?, ?, ?, ?)",
+            (digest, language_code, total_words, text),
+        )
+        return db.execute("SELECT passage_id FROM passages WHERE digest = ?", (digest,)).fetchone()[0]
+
+    def _pack(self, db, words):
+        """Dictionary-encodes `words` into a packed little-endian int32 blob."""
+        ids = array("i")
+        for word in words:
+            word_id = self._word_ids.get(word)
+            if word_id is None:
+                db.execute("INSERT OR IGNORE INTO words (word) VALUES (?)", (word,))
+                word_id = db.execute("SELECT word_id FROM words WHERE word = ?", (word,)).fetchone()[0]
+                self._word_ids[word] = word_id
+            ids.append(word_id)
+        if sys.byteorder != "little":
+            ids.byteswap()
+        return ids.tobytes()
+
+    def _words(self, word_ids):
+        if not word_ids:
+            return {}
+        placeholders = ",".join("?" * len(word_ids))
+        with self._lock:
+            rows = self._connect().execute(f"SELECT word_id, word FROM words WHERE word_id IN ({placeholders})", word_ids).fetchall()
+        return dict(rows)
+
+
+FLUENCY_STORE = FluencyStore(FLUENCY_DB_PATH) if FLUENCY_DB_PATH else None
+HISTORY_DISABLED_ERROR = "Reading history is not enabled on this deployment (SAHAYAK_FLUENCY_DB is not set)."
+
+
+def _record_assessment(report, student_id, class_id, original_text, language_code):
+    """Best-effort write to the history store; an assessment never fails because of it."""
+    if FLUENCY_STORE is None or not student_id or "error" in report:
+        return
+    try:
+        FLUENCY_STORE.record(report, student_id, class_id, original_text, language_code)
+    except Exception as e:
+        print(f"Could not save the assessment for {student_id}: {e}")
+
+
+def _history_window(days):
+    return time.time() - days * 24 * 3600 if days and days > 0 else None
+
+
+def get_student_reading_progress(student_id: str, days: int) -> str:
+    """
+    Summarizes a student's saved reading assessments: first and latest results, averages,
+    weekly trends in accuracy and words-correct-per-minute, and the words they miss most.
+
+    Args:
+        student_id: The student's name or roll number, exactly as used when they were assessed.
+        days: How many days of history to include (e.g., 30 for the last month, 0 for everything).
+
+    Returns:
+        A JSON string with the student's progress summary.
+    """
+    print(f"Tool called: get_student_reading_progress for {student_id}")
+    if FLUENCY_STORE is None:
+        return json.dumps({"error": HISTORY_DISABLED_ERROR})
+    try:
+        since = _history_window(days)
+        progress = FLUENCY_STORE.progress(student_id, since=since)
+        if not progress["assessments"]:
+            return json.dumps({"error": f"No saved reading assessments were found for {student_id}."})
+        progress["most_missed_words"] = FLUENCY_STORE.most_missed_words(student_id=student_id, since=since, limit=10)
+        return json.dumps(progress, ensure_ascii=False)
+    except Exception as e:
+        print(f"\n--- ERROR IN get_student_reading_progress ---")
+        traceback.print_exc()
+        return json.dumps({"error": f"Could not load the reading history: {str(e)}"})
+
+
+def get_class_reading_overview(class_id: str, days: int) -> str:
+    """
+    Summarizes a class's saved reading assessments: percentiles of each student's latest
+    accuracy, WPM and words-correct-per-minute, and the words the class misses most.
+
+    Args:
+        class_id: The class or section name, exactly as used when the class was assessed (e.g., '3B').
+        days: How many days of history to include (e.g., 90 for a term, 0 for everything).
+
+    Returns:
+        A JSON string with the class overview.
+    """
+    print(f"Tool called: get_class_reading_overview for {class_id}")
+    if FLUENCY_STORE is None:
+        return json.dumps({"error": HISTORY_DISABLED_ERROR})
+    try:
+        since = _history_window(days)
+        overview = FLUENCY_STORE.class_percentiles(class_id, since=since)
+        if not overview["students"]:
+            return json.dumps({"error": f"No saved reading assessments were found for class {class_id}."})
+        overview["most_missed_words"] = FLUENCY_STORE.most_missed_words(class_id=class_id, since=since, limit=20)
+        return json.dumps(overview, ensure_ascii=False)
+    except Exception as e:
+        print(f"\n--- ERROR IN get_class_reading_overview ---")
+        traceback.print_exc()
+        return json.dumps({"error": f"Could not load the class reading history: {str(e)}"})
+
+
+# --- Live (streaming) assessment ---
+# Library API for the [START_ASSESSMENT_UI] recorder front end, which owns the microphone
+# stream (Agent Engine only serves the agents): audio chunks are streamed to Speech while
+# the student reads, and the alignment advances with every finalized phrase.
+# tests/test_live_reading_session.py replays a WAV through FakeStreamingRecognizer.
+
+class LiveReadingSession:
+    """
+    Streams a student's reading through `streaming_recognize` and keeps an incremental
+    alignment against `original_text`. `stream()` yields partial metrics (current
+    position, running accuracy, live WPM) as results arrive; the last item it yields
+    also carries `final_report`, computed locally as soon as the stream closes.
+
+    `recognizer` defaults to the shared Speech client; pass a `FakeStreamingRecognizer`
+    to run offline. Note that one Speech stream is limited to about five minutes of audio.
+    """
+
+    # How far past the current position a new phrase is allowed to land.
+    LOOKAHEAD_WORDS = 8
+
+    def __init__(self, original_text, language_code, sample_rate_hertz=16000, recognizer=None):
+        self.original_text = original_text
+        self.reference = normalize_words(original_text)
+        self.language_code = language_code
+        self.sample_rate_hertz = sample_rate_hertz
+        self.recognizer = recognizer
+        self.position = 0
+        self.correct = 0
+        self.errors = {"mispronounced": 0, "skipped": 0, "added": 0}
+        self.transcripts = []
+        self.words_info = []
+        self.words_heard = 0
+        self.audio_seconds = 0.0
+
+    def stream(self, audio_chunks):
+        """Consumes an iterable of raw LINEAR16 chunks and yields metric snapshots."""
+        speech = _lazy_import("google.cloud.speech")
+        recognizer = self.recognizer or CLIENTS.get("speech")
+        streaming_config = speech.StreamingRecognitionConfig(
+            config=speech.RecognitionConfig(
+                encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
+                sample_rate_hertz=self.sample_rate_hertz,
+                language_code=self.language_code,
+                enable_word_time_offsets=True,
+                enable_automatic_punctuation=True,
+            ),
+            interim_results=True,
+        )
+        requests = (speech.StreamingRecognizeRequest(audio_content=chunk) for chunk in self._metered(audio_chunks))
+
+        for response in recognizer.streaming_recognize(config=streaming_config, requests=requests):
+            for result in response.results:
+                if not result.alternatives:
+                    continue
+                alternative = result.alternatives[0]
+                if result.is_final:
+                    self._commit(alternative)
+                    yield self.snapshot()
+                else:
+                    yield self.snapshot(interim_words=normalize_words(alternative.transcript))
+
+        snapshot = self.snapshot()
+        snapshot["final_report"] = self.final_report()
+        yield snapshot
+
+    def snapshot(self, interim_words=None):
+        """Current metrics; `interim_words` (not yet final) only move the displayed position."""
+        position = self.position
+        if interim_words:
+            position += self._align_window(interim_words)[0]
+        elapsed_minutes = self._elapsed_seconds() / 60.0
+        return {
+            "position": position,
+            "next_word": self.reference[position] if position < len(self.reference) else None,
+            "total_words": len(self.reference),
+            "running_accuracy_percent": round(self.correct / self.position * 100, 1) if self.position else 0.0,
+            "live_words_per_minute": int(self.words_heard / elapsed_minutes) if elapsed_minutes > 0 else 0,
+            "errors_so_far": dict(self.errors),
+            "audio_seconds": round(self.audio_seconds, 2),
+        }
+
+    def final_report(self):
+        """Full report (same shape as assess_reading_fluency) from the finalized transcript."""
+        transcript = " ".join(self.transcripts).strip()
+        if not transcript:
+            return {"error": "Transcription was empty. The audio might be silent."}
+        return _fluency_report(self.original_text, transcript, WordTimings.from_words_info(self.words_info))
+
+    def _commit(self, alternative):
+        words = normalize_words(alternative.transcript)
+        self.transcripts.append(alternative.transcript)
+        self.words_info.extend(alternative.words)
+        self.words_heard += len(words)
+        consumed, opcodes = self._align_window(words)
+        for tag, i1, i2, j1, j2 in opcodes:
+            if tag == "equal": self.correct += i2 - i1
+            elif tag == "replace": self.errors["mispronounced"] += i2 - i1
+            elif tag == "delete": self.errors["skipped"] += i2 - i1
+            elif tag == "insert": self.errors["added"] += j2 - j1
+        self.position += consumed
+
+    def _align_window(self, words):
+        """Aligns `words` just past the current position; returns (reference words consumed, opcodes)."""
+        window = self.reference[self.position:self.position + len(words) + self.LOOKAHEAD_WORDS]
+        # open_end: reference words after the last one the student reached are not skipped yet.
+        opcodes = WORD_ALIGNER.align(window, words, open_end=True)
+        consumed = opcodes[-1][2] if opcodes else 0
+        return consumed, opcodes
+
+    def _elapsed_seconds(self):
+        if self.words_info:
+            return self.words_info[-1].end_time.total_seconds()
+        return self.audio_seconds
+
+    def _metered(self, audio_chunks):
+        for chunk in audio_chunks:
+            self.audio_seconds += len(chunk) / (2.0 * self.sample_rate_hertz)
+            yield chunk
+
 
-def assess_reading_fluency(original_text: str, student_audio_gcs_uri: str, language_code: str) -> str:
-    """
-    Analyzes a student's reading audio against an original text to assess fluency.
-    Assumes the audio is a WAV file (LINEAR16) with a 16000 Hz sample rate.
+def iter_wav_chunks(path, chunk_ms=100, realtime=False):
+    """Reads a mono 16-bit WAV file as raw PCM chunks; `realtime=True` paces them like a microphone."""
+    with wave.open(path, "rb") as wav:
+        if wav.getsampwidth() != 2 or wav.getnchannels() != 1:
+            raise ValueError("Expected a mono 16-bit (LINEAR16) WAV file.")
+        frames_per_chunk = max(1, wav.getframerate() * chunk_ms // 1000)
+        while True:
+            chunk = wav.readframes(frames_per_chunk)
+            if not chunk:
+                break
+            yield chunk
+            if realtime:
+                time.sleep(chunk_ms / 1000.0)
 
-    Args:
-        original_text: The correct text passage the student was supposed to read.
-        student_audio_gcs_uri: The GCS URI of the student's audio file (e.g., 'gs://bucket_name/audio.wav').
-        language_code: The BCP-47 language code of the reading passage (e.g., 'en-IN', 'hi-IN').
 
-    Returns:
-        A JSON string containing the structured reading assessment report.
+class FakeStreamingRecognizer:
+    """
+    Offline stand-in for `SpeechClient.streaming_recognize`. It replays a scripted reading,
+    a list of (word, start_seconds, end_seconds), against the audio actually fed to it:
+    words become interim results once the audio has reached their end time, and
+    every `final_every` words (and at end of stream) are emitted as a final result.
     """
-    print(f"Tool called: assess_reading_fluency for audio at {student_audio_gcs_uri}")
-    try:
-        client = speech.SpeechClient()
-        audio = speech.RecognitionAudio(uri=student_audio_gcs_uri)
-
-        # Correct, simplified configuration for WAV files.
-        # It explicitly states the required sample rate.
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.LINEAR16,
-            sample_rate_hertz=16000,  # CRITICAL: Assuming 16kHz sample rate.
-            language_code=language_code,
-            enable_word_time_offsets=True,
-            enable_automatic_punctuation=True,
-        )
 
-        print("Requesting transcription with explicit sample rate: 16000 Hz...")
-        operation = client.long_running_recognize(config=config, audio=audio)
-        response = operation.result(timeout=300)
-
-        if not response.results:
-             return json.dumps({"error": "Could not understand any speech. The audio file might be silent or have an incorrect sample rate (must be 16000 Hz)."})
-
-        transcript = ""
-        words_info = []
-        for result in response.results:
-            if result.alternatives:
-                transcript += result.alternatives[0].transcript + " "
-                words_info.extend(result.alternatives[0].words)
-        
-        transcript = transcript.strip()
-        if not transcript:
-             return json.dumps({"error": "Transcription was empty. The audio might be silent."})
-        print(f"Transcription successful: '{transcript}'")
-
-        # The rest of the function (parsing, metrics, etc.) remains the same.
-        def normalize_text(text):
-            return re.sub(r'[^\w\s]', '', text.lower())
-        original_words = normalize_text(original_text).split()
-        transcript_words = normalize_text(transcript).split()
-        matcher = SequenceMatcher(None, original_words, transcript_words)
-        opcodes = matcher.get_opcodes()
-        correct_count=0; skipped_words=[]; added_words=[]; mispronounced_details=[]
-        for tag, i1, i2, j1, j2 in opcodes:
-            if tag == 'equal': correct_count += (i2 - i1)
-            elif tag == 'replace': mispronounced_details.append({"expected": " ".join(original_words[i1:i2]), "heard": " ".join(transcript_words[j1:j2])})
-            elif tag == 'delete': skipped_words.extend(original_words[i1:i2])
-            elif tag == 'insert': added_words.extend(transcript_words[j1:j2])
-        total_original_words = len(original_words)
-        accuracy = (correct_count / total_original_words) * 100 if total_original_words > 0 else 0
-        audio_duration_seconds=0
-        if words_info: audio_duration_seconds = words_info[-1].end_time.total_seconds()
-        audio_duration_minutes = audio_duration_seconds / 60.0
-        wpm = (len(transcript_words) / audio_duration_minutes) if audio_duration_minutes > 0 else 0
-        report = {"objective_metrics": {"accuracy_percent": round(accuracy, 1), "words_per_minute": int(wpm), "correct_words": correct_count, "total_words": total_original_words, "audio_duration_seconds": round(audio_duration_seconds, 2)}, "error_analysis": {"mispronounced": mispronounced_details, "skipped": skipped_words, "added": added_words}, "full_transcript": transcript}
-        return json.dumps(report)
+    def __init__(self, script, final_every=5):
+        self.script = script
+        self.final_every = final_every
+
+    def streaming_recognize(self, config, requests):
+        bytes_per_second = 2.0 * config.config.sample_rate_hertz
+        consumed = 0
+        finalized = 0
+        for request in requests:
+            consumed += len(request.audio_content)
+            heard = sum(1 for _, _, end in self.script if end <= consumed / bytes_per_second)
+            while heard - finalized >= self.final_every:
+                yield self._response(self.script[finalized:finalized + self.final_every], is_final=True)
+                finalized += self.final_every
+            if heard > finalized:
+                yield self._response(self.script[finalized:heard], is_final=False)
+        if finalized < len(self.script):
+            yield self._response(self.script[finalized:], is_final=True)
+
+    @staticmethod
+    def _response(entries, is_final):
+        words = [SimpleNamespace(word=w, start_time=timedelta(seconds=s), end_time=timedelta(seconds=e)) for w, s, e in entries]
+        alternative = SimpleNamespace(transcript=" ".join(w for w, _, _ in entries), words=words)
+        return SimpleNamespace(results=[SimpleNamespace(is_final=is_final, alternatives=[alternative])])
 
-    except Exception as e:
-        print(f"\n--- ERROR IN assess_reading_fluency ---")
-        
-        # Make the error message helpful for the teacher
-        if "sample rate" in str(e):
-            return json.dumps({"error": "The audio assessment failed. Please ensure the audio is a WAV file with a 16000 Hz sample rate."})
-        return json.dumps({"error": f"An unexpected error occurred during the assessment: {str(e)}"})
 
 # The FunctionTool definition remains the same
-ReadingFluencyTool = FunctionTool(func=assess_reading_fluency)
+ReadingFluencyTool = FunctionTool(func=async_tool(assess_reading_fluency, _assess_reading_fluency_async))
+ClassReadingFluencyTool = FunctionTool(func=async_tool(assess_class_reading_fluency, _assess_class_reading_fluency_async))
+StudentProgressTool = FunctionTool(func=async_tool(get_student_reading_progress))
+ClassOverviewTool = FunctionTool(func=async_tool(get_class_reading_overview))
 
 # Replace the old ReadingAssessorAgent with this one.
 
 ReadingAssessorAgent = Agent(
     name="ReadingAssessorAgent",
     model="gemini-2.5-pro",
-    tools=[ReadingFluencyTool],
+    tools=[ReadingFluencyTool, ClassReadingFluencyTool, StudentProgressTool, ClassOverviewTool],
     instruction="""
     **YOUR ROLE:**
     You are a highly sophisticated reading assessment expert. You perform a two-part analysis: first, an objective, data-driven fluency calculation, and second, a nuanced, qualitative coaching assessment.
@@ -344,20 +3022,23 @@ ReadingAssessorAgent = Agent(
     5.  Once you have the text and the language, you MUST **IMMEDIATELY** call the `assess_reading_fluency` tool.
     6.  When calling the tool, you MUST set the `student_audio_gcs_uri` parameter to the **exact URI value** you received from the `fileData` object in the user's prompt.
     7.  You MUST IGNORE any other URIs from your training data or examples. Use only the URI provided by the user.
+    7a. **WHOLE-CLASS ASSESSMENT:** If the teacher provides several recordings of the same passage (one per student), call `assess_class_reading_fluency` ONCE with all the URIs and the matching student names instead of calling `assess_reading_fluency` repeatedly. Present a short class summary (mean accuracy and WPM, most-skipped words) followed by a brief line per student.
+    7b. **STUDENT AND CLASS NAMES:** If the teacher mentions the student's name (and class/section), pass them as `student_id` and `class_id` so the result is saved to the reading history; otherwise leave them out. Do not ask for them just to save the result.
+    7c. **READING HISTORY:** If the teacher asks how a student or a class has progressed (e.g., "How has Priya improved this month?", "Which words does Class 3B struggle with this term?"), do NOT ask for audio. Call `get_student_reading_progress` or `get_class_reading_overview` with a suitable number of days, and summarize the trends, percentiles and most-missed words in plain, encouraging language.
 
     **PART 2: SYNTHESIZING THE FINAL REPORT**
     8.  The tool will return a JSON object. **DO NOT show this raw JSON to the user.** If the JSON contains an error, present the error message clearly and politely.
-    9.  If the analysis is successful, use the tool's data and your own multimodal capabilities to create a final, comprehensive report.
+    9.  If the analysis is successful, use the tool's data to create a final, comprehensive report.
     10. **Format the Objective Results:** Create a section titled "**Objective Fluency Report**" and list the key metrics like Accuracy, Words Per Minute, and the error breakdown.
-    11. **Perform Qualitative Analysis:** Listen to the audio again (using the same GCS URI). Create a section titled "**Qualitative Coaching Feedback**". Analyze prosody, intonation, and confidence, and provide 2-3 encouraging, constructive sentences.
+    11. **Perform Qualitative Analysis:** Do NOT listen to the audio again. Base this on the `prosody` section of the tool output: `words_correct_per_minute`, the pause statistics and `long_hesitations` (which words the student stopped before), `words_per_minute_windows` (steady pace or slowing down), `repetitions` and `self_corrections` (a self-correction is a good reading habit, mention it positively). Create a section titled "**Qualitative Coaching Feedback**" covering pacing, phrasing, and confidence, and provide 2-3 encouraging, constructive sentences.
     12. Combine both parts into a single, final message to the user.
     """,
-    description="A hybrid agent that first uses a tool for objective reading metrics (WPM, accuracy) and then adds its own qualitative analysis of the student's prosody, intonation, and confidence from the audio.",
+    description="A hybrid agent that first uses a tool for objective reading metrics (WPM, accuracy) and then adds qualitative coaching on the student's pacing, hesitations, and confidence from the tool's prosody features.",
 )
 
 # The ReadingAssessorAgentRouter remains the same.
 
-ReadingAssessorAgentRouter = SequentialAgent(
+ReadingAssessorAgentRouter = AgentRoute(
     name="ReadingAssessorAgentRouter",
     description="Routes requests for assessing student reading fluency from an audio file to the hybrid analysis agent.",
     sub_agents=[
@@ -373,6 +3054,9 @@ ReadingAssessorAgentRouter = SequentialAgent(
 
 # WorksheetGeneratorAgent
 
+WORKSHEET_RENDERER = WorksheetRenderer()
+
+
 def generate_pdf_from_text(worksheet_text: str) -> str:
     """
     Generates a beautifully formatted PDF from provided text, saves it to
@@ -380,77 +3064,14 @@ def generate_pdf_from_text(worksheet_text: str) -> str:
     """
     print("Tool called: Generating enhanced PDF from worksheet text.")
     try:
-        storage_client = storage.Client(project=PROJECT_ID)
-
-        pdf_filename = f"{uuid.uuid4()}.pdf"
-        # Use the /tmp/ directory for temporary storage, which is standard for cloud environments
-        local_pdf_path = f"/tmp/{pdf_filename}"
-
-        print(f"Preparing to create PDF at: {local_pdf_path}")
-
-        doc = SimpleDocTemplate(local_pdf_path, pagesize=letter,
-                                rightMargin=0.75*inch, leftMargin=0.75*inch,
-                                topMargin=0.75*inch, bottomMargin=0.75*inch)
-
-        # Define Custom Styles
-        styles = getSampleStyleSheet()
-        # (All your custom style definitions go here)
-        styles.add(ParagraphStyle(name='TitleStyle', fontName='Helvetica-Bold', fontSize=18, leading=22, spaceAfter=14, textColor=colors.HexColor("#4A90E2"), alignment=1))
-        styles.add(ParagraphStyle(name='ActivityTitle', fontName='Helvetica-Bold', fontSize=14, leading=18, spaceBefore=12, spaceAfter=6, textColor=colors.HexColor("#333333")))
-        styles.add(ParagraphStyle(name='InstructionStyle', fontName='Helvetica-Oblique', fontSize=10, leading=12, spaceAfter=6, textColor=colors.darkgray))
-        styles.add(ParagraphStyle(name='BodyStyle', fontName='Helvetica', fontSize=11, leading=14, spaceAfter=6, wordWrap='CJK'))
-        styles.add(ParagraphStyle(name='HeaderStyle', fontName='Helvetica', fontSize=11, leading=14, spaceAfter=0))
-        styles.add(ParagraphStyle(name='MonospaceStyle', fontName='Courier', fontSize=10, leading=12, spaceAfter=6, textColor=colors.darkgrey))
-
-
-        story = []
-        lines = worksheet_text.strip().split('\n')
-        
-        # Helper to process inline bolding (**)
-        def format_bold(text):
-            parts = text.split('**')
-            result = []
-            for i, part in enumerate(parts):
-                result.append(f"<b>{part}</b>" if i % 2 == 1 else part)
-            return "".join(result)
-
-        # Intelligent Line-by-Line Parsing
-        for line in lines:
-            line_content = format_bold(line)
-            if line.strip().startswith('+--'):
-                 story.append(Paragraph(line_content, styles['MonospaceStyle']))
-            elif line.strip().startswith('**Activity'):
-                story.append(HRFlowable(width="100%", thickness=1, color=colors.lightgrey, spaceAfter=5))
-                story.append(Paragraph(line_content, styles['ActivityTitle']))
-            elif line.strip().startswith('**'):
-                 story.append(Paragraph(line_content, styles['TitleStyle']))
-            elif "Name:" in line or "Date:" in line:
-                story.append(Paragraph(line_content, styles['HeaderStyle']))
-                if "Date:" in line: story.append(Spacer(1, 0.25*inch))
-            elif line.strip().startswith('*'):
-                 story.append(Paragraph(line_content.replace('*','<i>',1).replace('*','</i>',1), styles['InstructionStyle']))
-            elif "Draw it in the box below!" in line:
-                story.append(Paragraph(line_content, styles['InstructionStyle']))
-                story.append(Spacer(1, 0.2*inch))
-                story.append(HRFlowable(width="80%", thickness=1, color=colors.black, hAlign='CENTER'))
-                story.append(Spacer(1, 2.5*inch))
-                story.append(HRFlowable(width="80%", thickness=1, color=colors.black, hAlign='CENTER'))
-            elif not line.strip():
-                story.append(Spacer(1, 0.1*inch))
-            else:
-                story.append(Paragraph(line_content, styles['BodyStyle']))
+        pdf_bytes = WORKSHEET_RENDERER.render(worksheet_text, kind="worksheet")
+        pdf_filename = artifact_object_name("worksheet", pdf_bytes, "pdf")
+        print(f"PDF rendered in memory ({len(pdf_bytes)} bytes).")
 
-        doc.build(story)
-        print(f"PDF successfully created locally at: {local_pdf_path}")
+        # Upload to GCS in the background
+        public_url = ARTIFACT_UPLOADS.submit(OUTPUT_BUCKET_NAME, pdf_filename, pdf_bytes, "application/pdf")
+        print(f"Queued upload to GCS.")
 
-        # Upload to GCS
-        bucket = storage_client.bucket(OUTPUT_BUCKET_NAME)
-        blob = bucket.blob(pdf_filename)
-        blob.upload_from_filename(local_pdf_path)
-        print(f"Successfully uploaded to GCS.")
-
-        os.remove(local_pdf_path)
-        public_url = f"https://storage.googleapis.com/{OUTPUT_BUCKET_NAME}/{pdf_filename}"
         print(f"PDF is public at: {public_url}")
 
         return f"The worksheet PDF has been successfully created. You can download it here: {public_url}"
@@ -461,13 +3082,84 @@ def generate_pdf_from_text(worksheet_text: str) -> str:
         return "I'm sorry, I encountered an error creating the PDF."
 
 
-WorksheetToPdfTool = FunctionTool(func=generate_pdf_from_text)
+def merge_pdfs(pdfs):
+    """Concatenates already-rendered PDFs (bytes) into one document without re-rendering them."""
+    pypdf = _lazy_import("pypdf")
+    writer = pypdf.PdfWriter()
+    for pdf_bytes in pdfs:
+        writer.append(pypdf.PdfReader(io.BytesIO(pdf_bytes)))
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return buffer.getvalue()
+
+
+def generate_worksheet_batch(worksheet_texts: list[str], labels: list[str], combined_format: str) -> str:
+    """
+    Generates one PDF per worksheet text (e.g. one per learning level or grade), rendering
+    them in parallel, queues their uploads and returns a manifest of URLs.
+
+    Args:
+        worksheet_texts: The formatted worksheet texts, one per level or grade.
+        labels: A short label for each worksheet (e.g. ['Class 2 - Beginner', 'Class 2 - Advanced']). Pass [] to number them.
+        combined_format: 'none', 'pdf' for one combined PDF of all worksheets, or 'zip' for a ZIP of the individual PDFs.
+
+    Returns:
+        A JSON string with the URL of every worksheet and, if requested, of the combined file.
+    """
+    print(f"Tool called: generate_worksheet_batch for {len(worksheet_texts)} worksheets.")
+    try:
+        if not worksheet_texts:
+            return json.dumps({"error": "No worksheet texts were provided."})
+        combined_format = (combined_format or "none").lower()
+        if combined_format not in ("none", "pdf", "zip"):
+            return json.dumps({"error": f"Unsupported combined_format '{combined_format}'. Use 'none', 'pdf' or 'zip'."})
+        labels = list(labels or [])
+        labels += [f"Worksheet {i + 1}" for i in range(len(labels), len(worksheet_texts))]
+
+        started = time.perf_counter()
+        cpu_pool = get_cpu_pool()
+        render_jobs = [cpu_pool.submit(render_pdf, text) for text in worksheet_texts]
+
+        # Each upload is queued as soon as its own PDF is ready.
+        manifest = {"worksheets": [], "combined_url": None}
+        pdfs = []
+        for label, job in zip(labels, render_jobs):
+            pdf_bytes = job.result()
+            pdfs.append(pdf_bytes)
+            url = ARTIFACT_UPLOADS.submit(OUTPUT_BUCKET_NAME, artifact_object_name("worksheet", pdf_bytes, "pdf"), pdf_bytes, "application/pdf")
+            manifest["worksheets"].append({"label": label, "url": url})
+
+        if combined_format == "pdf":
+            # Merge the per-level PDFs rendered in parallel above instead of rendering again.
+            combined_pdf = merge_pdfs(pdfs)
+            manifest["combined_url"] = ARTIFACT_UPLOADS.submit(
+                OUTPUT_BUCKET_NAME, artifact_object_name("worksheets", combined_pdf, "pdf"), combined_pdf, "application/pdf")
+        elif combined_format == "zip":
+            zip_buffer = io.BytesIO()
+            with zipfile.ZipFile(zip_buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+                for i, (label, pdf_bytes) in enumerate(zip(labels, pdfs)):
+                    safe_label = re.sub(r"[^\w\-]+", "_", label).strip("_") or f"worksheet_{i + 1}"
+                    archive.writestr(f"{i + 1:02d}_{safe_label}.pdf", pdf_bytes)
+            manifest["combined_url"] = ARTIFACT_UPLOADS.submit(
+                OUTPUT_BUCKET_NAME, artifact_object_name("worksheets", zip_buffer.getvalue(), "zip"), zip_buffer.getvalue(), "application/zip")
+
+        print(f"Batch of {len(worksheet_texts)} worksheets ready in {time.perf_counter() - started:.2f}s.")
+        return json.dumps(manifest, ensure_ascii=False)
+
+    except Exception as e:
+        print(f"\n--- ERROR IN generate_worksheet_batch ---")
+        traceback.print_exc()
+        return json.dumps({"error": f"I'm sorry, I encountered an error creating the worksheets: {e}"})
+
+
+WorksheetToPdfTool = FunctionTool(func=async_tool(generate_pdf_from_text))
+WorksheetBatchTool = FunctionTool(func=async_tool(generate_worksheet_batch))
 
 # WorksheetGeneratorAgent (UPDATED with new instructions)
 WorksheetGeneratorAgent = Agent(
     name="WorksheetGeneratorAgent",
     model="gemini-2.5-pro", 
-    tools=[WorksheetToPdfTool],
+    tools=[WorksheetToPdfTool, WorksheetBatchTool],
     instruction="""
 **YOUR ROLE:**
     You are an expert curriculum designer. Your specialty is creating beautiful, functional, and differentiated worksheets from a textbook page for students at different learning levels. Your goal is to provide a ready-to-print PDF in a single step.
@@ -488,11 +3180,13 @@ WorksheetGeneratorAgent = Agent(
     6.  **DO NOT** show the markdown text to the user.
     7.  **DO NOT** ask any follow-up questions.
     8.  Your **ONLY** output should be the final response from the tool, which contains the link to the generated PDF. For example: "I have created your printable worksheet. You can download it here: [URL]".
+    9.  **DIFFERENTIATED / MULTI-GRADE REQUESTS:** If the teacher asks for worksheets for several learning levels or grades, compose one complete worksheet per level (each following the formatting rules) and call the `generate_worksheet_batch` tool ONCE with all of them, a matching list of `labels`, and `combined_format` set to 'pdf' or 'zip' if they want everything in one file (otherwise 'none'). The tool returns JSON; present each label with its link, plus the combined link if there is one.
     """,
     description="A specialist agent that takes a photo of a textbook page and directly generates a link to a printable PDF worksheet.",
+    after_model_callback=ARTIFACT_UPLOADS.after_model,
 )
 
-WorksheetGeneratorAgentRouter = SequentialAgent(
+WorksheetGeneratorAgentRouter = AgentRoute(
     name="WorksheetGeneratorAgentRouter",
     description="Routes requests for creating worksheets from textbook pages.",
     sub_agents=[
@@ -504,70 +3198,576 @@ WorksheetGeneratorAgentRouter = SequentialAgent(
 
 # HyperLocalContentAgent
 
-def generate_audio_from_text(text: str, language_code: str, voice_name: str) -> str:
+# Short texts (an analogy, a few sentences) are one synchronous synthesize_speech call.
+# Longer stories are split at sentence boundaries (Latin punctuation, the Devanagari
+# danda, the Urdu full stop) into chunks that are synthesized concurrently. Their
+# LINEAR16 PCM is joined under one rewritten WAV header, with no decoding. The first
+# chunk is kept short and published on its own as soon as it is ready, so a teacher can
+# start playing it while the rest finishes. Texts over TTS_CHUNKED_MAX_BYTES (or
+# SAHAYAK_TTS_MODE=long_audio) still go through Long Audio Synthesis.
+TTS_MODE = os.getenv("SAHAYAK_TTS_MODE", "auto")
+TTS_SAMPLE_RATE_HERTZ = 24000
+# Every path produces LINEAR16 at one rate, so chunks can be joined; this is part of the dedup key.
+TTS_AUDIO_CONFIG = {"audio_encoding": "LINEAR16", "sample_rate_hertz": TTS_SAMPLE_RATE_HERTZ}
+# UTF-8 bytes (the API's unit; Indic scripts take 3 bytes per character).
+TTS_SHORT_TEXT_BYTES = int(os.getenv("SAHAYAK_TTS_SHORT_TEXT_BYTES", 1200))
+TTS_FIRST_CHUNK_BYTES = int(os.getenv("SAHAYAK_TTS_FIRST_CHUNK_BYTES", 600))
+# synthesize_speech accepts at most 5000 bytes per request.
+TTS_CHUNK_BYTES = min(int(os.getenv("SAHAYAK_TTS_CHUNK_BYTES", 1500)), 4800)
+TTS_CHUNKED_MAX_BYTES = int(os.getenv("SAHAYAK_TTS_CHUNKED_MAX_BYTES", 100_000))
+# Silence inserted between joined chunks, as at a sentence break.
+TTS_CHUNK_GAP_MS = int(os.getenv("SAHAYAK_TTS_CHUNK_GAP_MS", 150))
+TTS_MAX_IN_FLIGHT = int(os.getenv("SAHAYAK_TTS_MAX_IN_FLIGHT", 8))
+TTS_LIMITER = RateLimiter(float(os.getenv("SAHAYAK_TTS_REQUESTS_PER_MINUTE", 300)), TTS_MAX_IN_FLIGHT)
+# "0" waits for the whole story instead of returning once the first chunk is ready.
+TTS_EARLY_FIRST_CHUNK = os.getenv("SAHAYAK_TTS_EARLY_FIRST_CHUNK", "1") != "0"
+TTS_FIRST_CHUNK_TIMEOUT_SECONDS = 60
+
+# Output formats. WAV is what Long Audio Synthesis writes, but a five-minute story is
+# tens of MB; MP3 and Ogg Opus are 10-20x smaller. The synchronous API encodes them
+# natively (MP3 chunks are joined by concatenating frames). Long-audio WAVs, and Opus
+# stories built from several chunks (chained Ogg streams play badly), are streamed
+# through ffmpeg instead (see AudioTranscoder). libopus runs at complexity 5: about a
+# quarter of the default's CPU for ~10% more bytes on speech. WAV stays the default, so
+# existing deployments keep their file type and .wav links; SAHAYAK_TTS_AUDIO_FORMAT=MP3
+# (or OGG_OPUS) opts a deployment in.
+TTS_AUDIO_FORMAT = os.getenv("SAHAYAK_TTS_AUDIO_FORMAT", "LINEAR16").upper()
+AUDIO_FORMATS = {
+    "LINEAR16": {"extension": "wav", "content_type": "audio/wav", "ffmpeg_args": None},
+    "MP3": {"extension": "mp3", "content_type": "audio/mpeg", "ffmpeg_args": ["-c:a", "libmp3lame", "-b:a", "48k", "-f", "mp3"]},
+    "OGG_OPUS": {"extension": "ogg", "content_type": "audio/ogg", "ffmpeg_args": ["-c:a", "libopus", "-b:a", "32k", "-compression_level", "5", "-f", "ogg"]},
+}
+AUDIO_FORMAT_ALIASES = {"WAV": "LINEAR16", "OPUS": "OGG_OPUS", "OGG": "OGG_OPUS"}
+
+_TERMINATORS = ".!?…।॥۔؟"
+SENTENCE_BOUNDARY = re.compile(
+    rf"(?:(?<=[{_TERMINATORS}])|(?<=[{_TERMINATORS}][\"'”’»)]))\s+"  # terminator (+ closing quote) then space
+    r"|(?<=[।॥۔؟])(?=[^\s\"'”’»)])"  # the danda / Urdu stop need no following space
+    r"|\s*\n\s*"  # line and paragraph breaks
+)
+# A "." after these is not a sentence end ("Dr. Rao", "e.g. rice", "डॉ. शर्मा").
+ABBREVIATION_END = re.compile(r"(?:\b(?:[A-Z]|Mr|Mrs|Ms|Dr|Prof|Sr|Jr|St|Mt|No|vs|etc|e\.g|i\.e)|डॉ|श्री|श्रीमती)\.$")
+CLAUSE_BOUNDARY = re.compile(r"(?<=[,;:،—])\s+")
+
+# Regenerated or shared stories hit the same (text, language, voice) again, so the
+# WAV is stored under a content-hash name and indexed locally.
+TTS_AUDIO_CACHE = ResultCache(
+    "tts_audio",
+    ttl_seconds=int(os.getenv("TTS_AUDIO_CACHE_TTL_SECONDS", 30 * 24 * 3600)),
+    max_entries=int(os.getenv("TTS_AUDIO_CACHE_MAX_ENTRIES", 512)),
+    max_persisted_entries=int(os.getenv("TTS_AUDIO_CACHE_MAX_PERSISTED", 20000)),
+)
+_TTS_IN_FLIGHT = SingleFlight()
+
+
+_TTS_IN_FLIGHT_ASYNC = AsyncSingleFlight()
+
+
+def split_sentences(text):
+    """Splits text into sentences at Latin and Indic terminators and line breaks."""
+    sentences = []
+    for piece in SENTENCE_BOUNDARY.split(text.strip()):
+        piece = piece.strip()
+        if not piece:
+            continue
+        if sentences and ABBREVIATION_END.search(sentences[-1]):
+            sentences[-1] += " " + piece
+        else:
+            sentences.append(piece)
+    return sentences
+
+
+def _pack(pieces, max_bytes, first_max_bytes=None):
+    """Greedily joins pieces with spaces into parts of at most `max_bytes` UTF-8 bytes (the first: `first_max_bytes`)."""
+    parts = []
+    current = ""
+    for piece in pieces:
+        limit = max_bytes if parts or first_max_bytes is None else first_max_bytes
+        candidate = f"{current} {piece}" if current else piece
+        if current and len(candidate.encode("utf-8")) > limit:
+            parts.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        parts.append(current)
+    return parts
+
+
+def _split_to_fit(text, max_bytes):
+    """Splits one over-long sentence at clause punctuation, else at spaces, so every part fits."""
+    fits = lambda piece: len(piece.encode("utf-8")) <= max_bytes  # noqa: E731
+    if fits(text):
+        return [text]
+    clauses = CLAUSE_BOUNDARY.split(text)
+    if len(clauses) > 1 and all(fits(clause) for clause in clauses):
+        return _pack(clauses, max_bytes)
+    # A "word" longer than the limit (no spaces at all) is cut by characters (<= 4 bytes each).
+    words = [word[i:i + max_bytes // 4] for word in text.split() for i in range(0, len(word), max_bytes // 4)]
+    return _pack(words, max_bytes)
+
+
+def chunk_for_tts(text, first_chunk_bytes=TTS_FIRST_CHUNK_BYTES, chunk_bytes=TTS_CHUNK_BYTES):
+    """
+    Packs whole sentences into chunks of at most `chunk_bytes` UTF-8 bytes. The first
+    chunk is capped at `first_chunk_bytes` (but always holds at least one sentence) so
+    it comes back quickly.
+    """
+    pieces = [piece for sentence in split_sentences(text) for piece in _split_to_fit(sentence, chunk_bytes)]
+    return _pack(pieces, chunk_bytes, first_chunk_bytes)
+
+
+def join_wav(wavs, gap_ms=0):
+    """
+    Joins LINEAR16 WAVs that share one format by concatenating their PCM data under a
+    single new header (plus `gap_ms` of silence between parts). Nothing is decoded.
+    Parts without a WAV header are taken as raw PCM in TTS_AUDIO_CONFIG's format.
+    """
+    infos = []
+    for wav in wavs:
+        info = parse_audio_header(wav, len(wav))
+        if info is None:
+            info = {"encoding": "LINEAR16", "sample_rate_hertz": TTS_SAMPLE_RATE_HERTZ, "channels": 1,
+                    "bits_per_sample": 16, "data_offset": 0, "data_size": len(wav)}
+        infos.append(info)
+    audio_format = {(i["encoding"], i["sample_rate_hertz"], i["channels"], i["bits_per_sample"]) for i in infos}
+    if len(audio_format) != 1 or infos[0]["encoding"] != "LINEAR16":
+        raise ValueError(f"Cannot join audio parts in different or non-PCM formats: {sorted(audio_format)}")
+    first = infos[0]
+    frame_bytes = first["channels"] * first["bits_per_sample"] // 8
+    gap = bytes(first["sample_rate_hertz"] * gap_ms // 1000 * frame_bytes)
+    pcm = gap.join(memoryview(wav)[i["data_offset"]:i["data_offset"] + i["data_size"]] for wav, i in zip(wavs, infos))
+    return wav_header(first["sample_rate_hertz"], first["channels"], first["bits_per_sample"], len(pcm)) + pcm
+
+
+# Layer III bitrates (kbit/s) by header bitrate index, for MPEG-1 and for MPEG-2/2.5.
+_MP3_BITRATES = {
+    "mpeg1": (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    "mpeg2": (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates by header version bits (3: MPEG-1, 2: MPEG-2, 0: MPEG-2.5) and rate index.
+_MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+
+def _strip_id3(part):
+    if part[:3] == b"ID3" and len(part) >= 10:
+        size = int.from_bytes(bytes(b & 0x7F for b in part[6:10]), "big")  # syncsafe integer
+        return part[10 + size:]
+    return part
+
+
+def mp3_silence(part, gap_ms):
+    """
+    About `gap_ms` of silent frames in the format of the MP3 `part`: its first frame header
+    (CRC off, no padding) over all-zero side info and main data, which decodes to silence.
+    Returns b"" if the part does not start with a Layer III frame of a fixed bitrate.
+    """
+    header = _strip_id3(part)[:4]
+    if len(header) < 4 or header[0] != 0xFF or header[1] & 0xE6 != 0xE2:  # sync, Layer III
+        return b""
+    version, bitrate_index, rate_index = header[1] >> 3 & 0x3, header[2] >> 4, header[2] >> 2 & 0x3
+    bitrate = _MP3_BITRATES["mpeg1" if version == 3 else "mpeg2"][bitrate_index] if bitrate_index < 15 else 0
+    if version not in _MP3_SAMPLE_RATES or not bitrate or rate_index == 3:
+        return b""
+    sample_rate = _MP3_SAMPLE_RATES[version][rate_index]
+    samples_per_frame = 1152 if version == 3 else 576
+    frame_bytes = (144 if version == 3 else 72) * bitrate * 1000 // sample_rate
+    frame = bytes([header[0], header[1] | 0x01, header[2] & 0xFD, header[3]]) + bytes(frame_bytes - 4)
+    return frame * round(sample_rate * gap_ms / 1000 / samples_per_frame)
+
+
+def join_mp3(parts, gap_ms=0):
+    """
+    Joins MP3 files by concatenating their frames, with `gap_ms` of silent frames between
+    parts; ID3 tags after the first part are dropped. Nothing is decoded.
+    """
+    gap = mp3_silence(parts[0], gap_ms) if gap_ms else b""
+    return gap.join([parts[0], *(_strip_id3(part) for part in parts[1:])])
+
+
+class AudioTranscoder:
+    """
+    Streams audio through an ffmpeg subprocess: input is read from a file-like object in
+    blocks by a feeder thread (so a long WAV never sits in memory) while the encoded
+    output is collected. The binary is SAHAYAK_FFMPEG, ffmpeg on PATH, or the static
+    build shipped with the imageio-ffmpeg package.
+    """
+
+    BLOCK_BYTES = 256 * 1024
+    # RUSAGE_CHILDREN is per process, so every transcoder reaps under one lock.
+    _REAP_LOCK = threading.Lock()
+
+    def __init__(self):
+        self._binary = None
+        self.cpu_seconds = 0.0
+
+    def binary(self):
+        if self._binary is None:
+            binary = os.getenv("SAHAYAK_FFMPEG") or shutil.which("ffmpeg")
+            if binary is None:
+                try:
+                    binary = _lazy_import("imageio_ffmpeg").get_ffmpeg_exe()
+                except ImportError:
+                    raise RuntimeError("No ffmpeg binary found; install ffmpeg or imageio-ffmpeg, or set SAHAYAK_FFMPEG.")
+            self._binary = binary
+        return self._binary
+
+    def transcode(self, reader, audio_format):
+        """Encodes the WAV stream `reader` to `audio_format`; returns (bytes, ffmpeg CPU seconds)."""
+        command = [self.binary(), "-hide_banner", "-loglevel", "error", "-f", "wav", "-i", "pipe:0",
+                   *AUDIO_FORMATS[audio_format]["ffmpeg_args"], "pipe:1"]
+        process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        errors = []
+
+        def feed():
+            try:
+                for block in iter(lambda: reader.read(self.BLOCK_BYTES), b""):
+                    process.stdin.write(block)
+            except BrokenPipeError:
+                pass  # ffmpeg exited early; its stderr says why
+            finally:
+                process.stdin.close()
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        drainer = threading.Thread(target=lambda: errors.append(process.stderr.read()), daemon=True)
+        feeder.start()
+        drainer.start()
+        output = process.stdout.read()
+        feeder.join()
+        drainer.join()
+        # ffmpeg has closed stdout, so it is exiting. Reaping under the lock makes the
+        # RUSAGE_CHILDREN delta this child's CPU time, even with concurrent transcodes.
+        with self._REAP_LOCK:
+            before = resource.getrusage(resource.RUSAGE_CHILDREN)
+            process.wait()
+            after = resource.getrusage(resource.RUSAGE_CHILDREN)
+            cpu_seconds = after.ru_utime - before.ru_utime + after.ru_stime - before.ru_stime
+            self.cpu_seconds += cpu_seconds
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg failed ({process.returncode}): {errors[0].decode(errors='replace').strip()}")
+        return output, cpu_seconds
+
+
+AUDIO_TRANSCODER = AudioTranscoder()
+
+
+def _tts_audio_config(encoding="LINEAR16"):
+    texttospeech = _lazy_import("google.cloud.texttospeech")
+    return texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding[encoding],
+        sample_rate_hertz=TTS_AUDIO_CONFIG["sample_rate_hertz"],
+    )
+
+
+def _synthesize_speech(text, language_code, voice_name, encoding="LINEAR16"):
+    """One synchronous synthesize_speech request (at most 5000 bytes of text); returns the encoded audio."""
+    texttospeech = _lazy_import("google.cloud.texttospeech")
+    with TTS_LIMITER:
+        response = CLIENTS.get("tts").synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text),
+            voice=texttospeech.VoiceSelectionParams(language_code=language_code, name=voice_name),
+            audio_config=_tts_audio_config(encoding),
+        )
+    return response.audio_content
+
+
+def _encode_parts(parts, audio_format):
+    """Joins synthesized chunks into one file: MP3 by frame concatenation, WAV by join_wav, Opus via ffmpeg."""
+    if audio_format == "MP3":
+        return join_mp3(parts, TTS_CHUNK_GAP_MS)
+    wav = join_wav(parts, TTS_CHUNK_GAP_MS)
+    if audio_format == "LINEAR16":
+        return wav
+    encoded, cpu_seconds = AUDIO_TRANSCODER.transcode(io.BytesIO(wav), audio_format)
+    print(f"Transcoded {len(wav)} bytes of WAV to {len(encoded)} bytes of {audio_format} ({cpu_seconds * 1000:.0f} ms CPU).")
+    return encoded
+
+
+def _synthesize_chunks(chunks, language_code, voice_name, first_ready=None, encoding="LINEAR16"):
+    """
+    Synthesizes `chunks` on the I/O pool with at most TTS_MAX_IN_FLIGHT requests open and
+    returns their audio in order. `first_ready` (a Future) gets the first chunk's audio as
+    soon as it arrives, or the error if the synthesis fails before that.
+    """
+    io_pool = get_io_pool()
+    wavs = [None] * len(chunks)
+    pending = {}
+    next_index = 0
+    try:
+        while next_index < len(chunks) or pending:
+            while next_index < len(chunks) and len(pending) < TTS_MAX_IN_FLIGHT:
+                pending[io_pool.submit(_synthesize_speech, chunks[next_index], language_code, voice_name, encoding)] = next_index
+                next_index += 1
+            done, _ = futures_wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                wavs[index] = future.result()
+                if index == 0 and first_ready is not None:
+                    first_ready.set_result(wavs[0])
+        return wavs
+    except BaseException as e:
+        for future in pending:
+            future.cancel()
+        if first_ready is not None and not first_ready.done():
+            first_ready.set_exception(e)
+        raise
+
+
+def _finish_story(chunks, language_code, voice_name, key, output_filename, first_ready, audio_format):
+    """Runs on the background pool: synthesizes every chunk, joins them and queues the full file."""
+    started = time.perf_counter()
+    # A single request is encoded natively; chunks are MP3 (joinable as is) or LINEAR16.
+    encoding = audio_format if len(chunks) == 1 or audio_format == "MP3" else "LINEAR16"
+    parts = _synthesize_chunks(chunks, language_code, voice_name, first_ready, encoding)
+    audio = parts[0] if len(chunks) == 1 else _encode_parts(parts, audio_format)
+    public_url = ARTIFACT_UPLOADS.submit(
+        AUDIO_BUCKET_NAME, output_filename, audio, AUDIO_FORMATS[audio_format]["content_type"],
+        on_success=lambda url: TTS_AUDIO_CACHE.put(key, {"object_name": output_filename, "public_url": url}),
+    )
+    print(f"Synthesized {len(chunks)} chunks in {time.perf_counter() - started:.2f}s; full audio queued at {public_url}")
+    return public_url
+
+
+def _synthesize_fast(text, language_code, voice_name, key, output_filename, audio_format):
+    """Synchronous-API synthesis: one request for short texts, parallel sentence chunks otherwise."""
+    # The single-flight entry is released once the first chunk is back, while the rest of
+    # the story is still synthesizing; a repeat request in that window joins the upload.
+    full_url = CLIENTS.get("artifact_store").public_url(AUDIO_BUCKET_NAME, output_filename)
+    state = ARTIFACT_UPLOADS.status(full_url)
+    if state == "uploaded":
+        return _audio_message(full_url)
+    if state == "pending":
+        return _audio_pending_message(full_url)
+    # Registered before the link is handed out, so after_model holds an answer that names it.
+    ARTIFACT_UPLOADS.expect(AUDIO_BUCKET_NAME, output_filename)
+    chunks = chunk_for_tts(text) if len(text.encode("utf-8")) > TTS_SHORT_TEXT_BYTES else [text]
+    first_ready = Future()
+    story = get_background_pool().submit(_finish_story, chunks, language_code, voice_name, key, output_filename, first_ready, audio_format)
+
+    def record_failure(future):
+        error = CancelledError() if future.cancelled() else future.exception()
+        if error is not None:
+            ARTIFACT_UPLOADS.fail(full_url, error)
+
+    story.add_done_callback(record_failure)
+    if len(chunks) == 1 or not TTS_EARLY_FIRST_CHUNK:
+        story.result()
+        return _audio_message(full_url)
+
+    try:
+        first_audio = _encode_parts([first_ready.result(timeout=TTS_FIRST_CHUNK_TIMEOUT_SECONDS)], audio_format)
+    except FutureTimeoutError:
+        # Slow, not failed: the story still finishes and uploads in the background.
+        print(f"First audio chunk took over {TTS_FIRST_CHUNK_TIMEOUT_SECONDS}s; returning the full-audio link.")
+        return _audio_pending_message(full_url)
+    extension = AUDIO_FORMATS[audio_format]["extension"]
+    first_url = ARTIFACT_UPLOADS.submit(
+        AUDIO_BUCKET_NAME, output_filename.replace(f".{extension}", f"-part1.{extension}"), first_audio,
+        AUDIO_FORMATS[audio_format]["content_type"],
+    )
+    print(f"First of {len(chunks)} audio chunks ready: {first_url}")
+    return (
+        f"The beginning of the audio is ready. You can listen to it here: {first_url} "
+        f"The complete audio will be ready in a few seconds here: {full_url}"
+    )
+
+
+def _transcode_long_audio(wav_filename, output_filename, audio_format, key):
+    """
+    Streams a long-audio WAV from the bucket through ffmpeg and queues the encoded file;
+    returns its URL. The WAV is kept: it is the LINEAR16 result for the same text, and
+    `_start_long_audio` finds it and skips the synthesis when another format is asked for.
+    """
+    started = time.perf_counter()
+    with CLIENTS.get("storage").bucket(AUDIO_BUCKET_NAME).blob(wav_filename).open("rb") as reader:
+        audio, cpu_seconds = AUDIO_TRANSCODER.transcode(reader, audio_format)
+    print(f"Transcoded '{wav_filename}' to {audio_format} ({len(audio)} bytes) in "
+          f"{time.perf_counter() - started:.2f}s, {cpu_seconds * 1000:.0f} ms CPU.")
+    return ARTIFACT_UPLOADS.submit(
+        AUDIO_BUCKET_NAME, output_filename, audio, AUDIO_FORMATS[audio_format]["content_type"],
+        on_success=lambda url: TTS_AUDIO_CACHE.put(key, {"object_name": output_filename, "public_url": url}),
+    )
+
+
+def _use_long_audio(text):
+    return TTS_MODE == "long_audio" or len(text.encode("utf-8")) > TTS_CHUNKED_MAX_BYTES
+
+
+def _tts_object(text, language_code, voice_name, audio_format="LINEAR16"):
+    """(cache key, object name, public URL) of the synthesized audio for these settings."""
+    # WAV keys are unchanged from before output formats existed, so old entries still hit.
+    encoded = () if audio_format == "LINEAR16" else (audio_format, AUDIO_FORMATS[audio_format]["ffmpeg_args"])
+    key = cache_key(text, language_code, voice_name, TTS_AUDIO_CONFIG, *encoded)
+    # The extension matches the encoding (.wav for LINEAR16)
+    output_filename = f"tts-{key}.{AUDIO_FORMATS[audio_format]['extension']}"
+    # Manually construct the public URL for the file
+    # This is for buckets with uniform public access (no need for make_public())
+    public_url = f"https://storage.googleapis.com/{AUDIO_BUCKET_NAME}/{output_filename}"
+    return key, output_filename, public_url
+
+
+def _start_long_audio(text, language_code, voice_name, output_filename):
+    """Starts a long-audio synthesis into AUDIO_BUCKET_NAME/output_filename; None if it is already there."""
+    bucket = CLIENTS.get("storage").bucket(AUDIO_BUCKET_NAME)
+    if bucket.blob(output_filename).exists():
+        print(f"Audio already present in GCS as '{output_filename}', skipping synthesis.")
+        return None
+
+    # Use the correct client for long audio synthesis
+    texttospeech = _lazy_import("google.cloud.texttospeech")
+    tts_client = CLIENTS.get("tts_long")
+
+    synthesis_input = texttospeech.SynthesisInput(text=text)
+    voice = texttospeech.VoiceSelectionParams(
+        language_code=language_code, name=voice_name
+    )
+
+    request = texttospeech.SynthesizeLongAudioRequest(
+        parent=f"projects/{PROJECT_ID}/locations/{LOCATION}",
+        input=synthesis_input,
+        audio_config=_tts_audio_config(),
+        voice=voice,
+        output_gcs_uri=f"gs://{AUDIO_BUCKET_NAME}/{output_filename}",
+    )
+
+    return tts_client.synthesize_long_audio(request=request)
+
+
+def _synthesize_long_audio(text, language_code, voice_name, output_filename):
+    """Runs one long-audio synthesis into AUDIO_BUCKET_NAME/output_filename unless it is already there."""
+    operation = _start_long_audio(text, language_code, voice_name, output_filename)
+    if operation is not None:
+        print("Waiting for audio synthesis operation to complete...")
+        operation.result(timeout=300)
+        print("Synthesis complete.")
+
+
+async def _synthesize_long_audio_async(text, language_code, voice_name, output_filename):
+    operation = await run_in_tool_pool(_start_long_audio, text, language_code, voice_name, output_filename)
+    if operation is not None:
+        print("Waiting for audio synthesis operation to complete...")
+        await await_operation(operation, timeout=300)
+        print("Synthesis complete.")
+
+
+def _resolve_audio_format(audio_format):
+    audio_format = (audio_format or TTS_AUDIO_FORMAT).strip().upper()
+    audio_format = AUDIO_FORMAT_ALIASES.get(audio_format, audio_format)
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format '{audio_format}'. Use one of: {', '.join(AUDIO_FORMATS)}.")
+    return audio_format
+
+
+def generate_audio_from_text(text: str, language_code: str, voice_name: str, audio_format: str = "") -> str:
     """
-    Generates an audio file from the provided text and returns its public URL. This tool
-    creates a .wav file with LINEAR16 encoding and returns a public GCS URL.
+    Generates an audio file from the provided text and returns its public URL. The file
+    is WAV (LINEAR16) unless the deployment or `audio_format` asks for MP3 or Ogg Opus,
+    which are 10-20x smaller. For a long text it may return a link to the beginning of the audio first, plus the link
+    where the complete audio will appear a few seconds later.
 
     Args:
         text: The text to be converted into speech.
         language_code: The BCP-47 language code for the text (e.g., 'mr-IN' for Marathi).
         voice_name: The specific voice to use for synthesis (e.g., 'mr-IN-Wavenet-A').
+        audio_format: Optional. 'MP3', 'OGG_OPUS' or 'LINEAR16' (WAV); empty uses the deployment default.
 
     Returns:
-        A string containing the success message and the public URL of the generated .wav audio file.
+        A string containing the success message and the public URL(s) of the generated audio.
     """
     print(f"Tool called: Generating audio for language '{language_code}'.")
     try:
-        # Use the correct client for long audio synthesis
-        tts_client = texttospeech.TextToSpeechLongAudioSynthesizeClient()
-        # Explicitly set the project to avoid authentication context issues
-        storage_client = storage.Client(project=PROJECT_ID)
-
-        # Use .wav extension to match the LINEAR16 encoding
-        output_filename = f"{uuid.uuid4()}.wav"
-        gcs_output_uri = f"gs://{AUDIO_BUCKET_NAME}/{output_filename}"
-
-        synthesis_input = texttospeech.SynthesisInput(text=text)
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=language_code, name=voice_name
-        )
-        
-        # Long Audio Synthesis requires LINEAR16 encoding
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.LINEAR16
-        )
-        
-        request = texttospeech.SynthesizeLongAudioRequest(
-            parent=f"projects/{PROJECT_ID}/locations/{LOCATION}",
-            input=synthesis_input,
-            audio_config=audio_config,
-            voice=voice,
-            output_gcs_uri=gcs_output_uri,
-        )
+        audio_format = _resolve_audio_format(audio_format)
+    except ValueError as e:
+        return str(e)
+    try:
+        key, output_filename, public_url = _tts_object(text, language_code, voice_name, audio_format)
+        cached_url = _cached_audio_url(key) or _stored_audio_url(key, output_filename)
+        if cached_url is not None:
+            return _audio_message(cached_url)
+        if not _use_long_audio(text):
+            # Identical requests arriving together share a single synthesis.
+            return _TTS_IN_FLIGHT.do(key, lambda: _synthesize_fast(text, language_code, voice_name, key, output_filename, audio_format))
 
-        operation = tts_client.synthesize_long_audio(request=request)
-        
-        print("Waiting for audio synthesis operation to complete...")
-        operation.result(timeout=300) 
-        print("Synthesis complete.")
+        # Long Audio Synthesis only writes WAV; other formats are transcoded from it.
+        wav_key, wav_filename, _ = _tts_object(text, language_code, voice_name)
+        _TTS_IN_FLIGHT.do(wav_key, lambda: _synthesize_long_audio(text, language_code, voice_name, wav_filename))
+        return _audio_message(_finish_long_audio(wav_filename, output_filename, public_url, audio_format, key))
+    except Exception:
+        return _audio_failure()
 
-        # Manually construct the public URL for the file
-        # This is for buckets with uniform public access (no need for make_public())
-        public_url = f"https://storage.googleapis.com/{AUDIO_BUCKET_NAME}/{output_filename}"
-        print(f"Audio file is public at: {public_url}")
-        
-        return f"The audio has been successfully created. You can listen to it here: {public_url}"
 
-    except Exception as e:
-        # Log the detailed error to the server console for future debugging
-        print("\n--- ERROR IN generate_audio_from_text ---")
-       
-        print("--- END OF ERROR ---\n")
-        return "I'm sorry, I encountered an error while trying to create the audio file."
+async def _generate_audio_from_text_async(text, language_code, voice_name, audio_format=""):
+    """Async body of generate_audio_from_text: the long-audio operation is polled, never blocked on."""
+    if not _use_long_audio(text):
+        # Synchronous synthesis takes seconds; it runs on the tool pool like any blocking tool.
+        return await run_in_tool_pool(generate_audio_from_text, text, language_code, voice_name, audio_format)
+    print(f"Tool called: Generating audio for language '{language_code}'.")
+    try:
+        audio_format = _resolve_audio_format(audio_format)
+    except ValueError as e:
+        return str(e)
+    try:
+        key, output_filename, public_url = _tts_object(text, language_code, voice_name, audio_format)
+        cached_url = _cached_audio_url(key) or await run_in_tool_pool(_stored_audio_url, key, output_filename)
+        if cached_url is not None:
+            return _audio_message(cached_url)
+
+        wav_key, wav_filename, _ = _tts_object(text, language_code, voice_name)
+        await _TTS_IN_FLIGHT_ASYNC.do(wav_key, lambda: _synthesize_long_audio_async(text, language_code, voice_name, wav_filename))
+        return _audio_message(await run_in_tool_pool(_finish_long_audio, wav_filename, output_filename, public_url, audio_format, key))
+    except Exception:
+        return _audio_failure()
+
+
+# Shared by the sync and async bodies of generate_audio_from_text, so the two only differ
+# in how they wait for the long-audio operation.
+
+def _cached_audio_url(key):
+    cached = TTS_AUDIO_CACHE.get(key)
+    if cached is None:
+        return None
+    print(f"Audio cache hit: {cached['public_url']}")
+    return cached["public_url"]
+
+
+def _stored_audio_url(key, output_filename):
+    """URL of the audio if an earlier run, on any instance, left it in the bucket; fills the cache on a hit."""
+    store = CLIENTS.get("artifact_store")
+    if not store.exists(AUDIO_BUCKET_NAME, output_filename):
+        return None
+    public_url = store.public_url(AUDIO_BUCKET_NAME, output_filename)
+    TTS_AUDIO_CACHE.put(key, {"object_name": output_filename, "public_url": public_url})
+    print(f"Audio already present in the bucket: {public_url}")
+    return public_url
+
+
+def _finish_long_audio(wav_filename, output_filename, public_url, audio_format, key):
+    """Once the long-audio WAV is in the bucket: caches it, or transcodes it to `audio_format`. Returns the URL."""
+    if audio_format == "LINEAR16":
+        TTS_AUDIO_CACHE.put(key, {"object_name": output_filename, "public_url": public_url})
+    else:
+        public_url = _TTS_IN_FLIGHT.do(key, lambda: _transcode_long_audio(wav_filename, output_filename, audio_format, key))
+    print(f"Audio file is public at: {public_url}")
+    return public_url
+
+
+def _audio_message(public_url):
+    return f"The audio has been successfully created. You can listen to it here: {public_url}"
+
+
+def _audio_pending_message(public_url):
+    return f"The audio is still being created. It will be ready in a few seconds here: {public_url}"
+
 
+def _audio_failure():
+    # Log the detailed error to the server console for future debugging
+    print("\n--- ERROR IN generate_audio_from_text ---")
+    traceback.print_exc()
+    print("--- END OF ERROR ---\n")
+    return "I'm sorry, I encountered an error while trying to create the audio file."
 
-TextToSpeechTool = FunctionTool(func=generate_audio_from_text)
+
+TextToSpeechTool = FunctionTool(func=async_tool(generate_audio_from_text, _generate_audio_from_text_async))
 
 
 
@@ -588,10 +3788,12 @@ HyperLocalContentAgent = Agent(
         - You MUST use the `generate_audio_from_text` tool.
         - You must find the correct `language_code` and `voice_name` from the **Voice Selection Rules** below.
         - Pass the full text of the story you just generated to the tool.
+        - Leave out `audio_format` unless the teacher asks for a specific format: 'MP3', 'OGG_OPUS' (smallest file) or 'LINEAR16' (uncompressed WAV).
         - When the tool returns a file path, format your response like this example:'I've converted your text to speech. The audio file is saved at `/path/to/file.mp3`
         - Make sure to put ONLY the file path inside backticks (`), not any additional text
         - Never modify or abbreviate the path
         - This exact format is critical for proper processing.
+        - For a long story the tool may return two links: the beginning of the audio (ready now) and the complete audio (ready a few seconds later). Show both, each in its own backticks, and say which is which.
     6.  **If a requested language is NOT in the rules below**, you must state that you cannot create audio for that language yet and ask if they would like the story in a different supported language.
 
     **VOICE SELECTION RULES:**
@@ -609,9 +3811,10 @@ HyperLocalContentAgent = Agent(
 
     """,
     description="A specialist agent that generates culturally relevant content in local languages and can create audio versions of it.",
+    after_model_callback=ARTIFACT_UPLOADS.after_model,
 )
 
-HyperLocalContentAgentRouter = SequentialAgent(
+HyperLocalContentAgentRouter = AgentRoute(
     name="HyperLocalContentAgentRouter",
     description="Routes requests for creating stories, examples, or analogies in local languages.",
     sub_agents=[
@@ -619,68 +3822,339 @@ HyperLocalContentAgentRouter = SequentialAgent(
     ],
 )
 
-# NCERTKnowledgeBaseAgent
+# --- Local NCERT retrieval ---
+# Textbook text is chunked into overlapping passages and indexed per book on local disk
+# as BM25 postings: a small term dictionary plus memory-mapped NumPy arrays of
+# (passage id, precomputed BM25 term weight). A query gathers its terms' postings and
+# scores them with one bincount, so a search is a few milliseconds and needs no network.
+# Multi-book queries fan out over the I/O pool and their ranked passages are merged.
+# Build indexes with scripts/build_ncert_index.py; Vertex AI Search remains available
+# as the remote backend (NCERT_SEARCH_BACKEND).
 
-class_1_hindi_id = "projects/###################/locations/global/collections/default_collection/dataStores/class-1-subject-hindi"
-class_1_english_id = "projects/###################/locations/global/collections/default_collection/dataStores/class-1-subject-english"
-class_1_maths_id = "projects/###################/locations/global/collections/default_collection/dataStores/class-1-subject-maths"
-class_2_hindi_id = "projects/###################/locations/global/collections/default_collection/dataStores/class-2-subject-hindi"
-class_2_english_id = "projects/###################/locations/global/collections/default_collection/dataStores/class-2-subject-english"
-class_2_maths_id = "projects/###################/locations/global/collections/default_collection/dataStores/class-2-subject-maths"
+NCERT_INDEX_DIR = os.getenv("SAHAYAK_NCERT_INDEX_DIR", "/tmp/sahayak-data/ncert-index")
+# "auto" (a book's local index when built, Vertex AI Search otherwise), "local", "vertex",
+# or "grounding" (the legacy list of one VertexAiSearchTool per book).
+NCERT_SEARCH_BACKEND = os.getenv("NCERT_SEARCH_BACKEND", "auto")
+NCERT_DATASTORE_MANIFEST = os.getenv("NCERT_DATASTORE_MANIFEST", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ncert_datastores.json"))
 
 
-# Tool Instantiation
-vertex_search_tool_class_1_hindi = VertexAiSearchTool(
-    data_store_id=class_1_hindi_id,
-)
-vertex_search_tool_class_1_english = VertexAiSearchTool(
-    data_store_id=class_1_english_id,    
-)
-vertex_search_tool_class_1_maths = VertexAiSearchTool(
-    data_store_id=class_1_maths_id,    
-)
-vertex_search_tool_class_2_hindi = VertexAiSearchTool(
-    data_store_id=class_2_hindi_id,
-)
-vertex_search_tool_class_2_english = VertexAiSearchTool(
-    data_store_id=class_2_english_id,    
-)
-vertex_search_tool_class_2_maths = VertexAiSearchTool(
-    data_store_id=class_2_maths_id,    
-)
+def ncert_book_id(class_number, subject):
+    """Book ids follow the data store naming, e.g. 'class-1-subject-hindi'."""
+    return f"class-{int(class_number)}-subject-{subject.strip().lower()}"
+
+
+class NcertBookIndex:
+    """
+    On-disk BM25 index of one textbook.
+
+    Layout of the book directory: meta.json, terms.json ({term: [offset, length, idf]}),
+    postings.npy (int32 passage ids) and weights.npy (float32 BM25 term weights), both
+    grouped by term and opened with mmap, plus passages.jsonl with passage_offsets.npy
+    for reading only the passages that are returned.
+    """
+
+    K1 = 1.2
+    B = 0.75
+    CHUNK_WORDS = 120
+    CHUNK_OVERLAP = 30
+
+    def __init__(self, directory):
+        np = _lazy_import("numpy")
+        self.directory = directory
+        with open(os.path.join(directory, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        with open(os.path.join(directory, "terms.json"), encoding="utf-8") as f:
+            self.terms = json.load(f)
+        self.postings = np.load(os.path.join(directory, "postings.npy"), mmap_mode="r")
+        self.weights = np.load(os.path.join(directory, "weights.npy"), mmap_mode="r")
+        self.passage_offsets = np.load(os.path.join(directory, "passage_offsets.npy"), mmap_mode="r")
+        self.book_id = self.meta["book_id"]
+        self._lock = threading.Lock()
+        self._passages = open(os.path.join(directory, "passages.jsonl"), "rb")
+
+    @classmethod
+    def build(cls, book_id, chapters, directory):
+        """
+        Chunks `chapters` ([(chapter title, text)]) and writes the index to `directory`.
+        Returns the number of passages.
+        """
+        np = _lazy_import("numpy")
+        os.makedirs(directory, exist_ok=True)
+        passages = []
+        step = cls.CHUNK_WORDS - cls.CHUNK_OVERLAP
+        for title, text in chapters:
+            words = text.split()
+            for start in range(0, max(len(words) - cls.CHUNK_OVERLAP, 1), step):
+                passages.append({"chapter": title, "text": " ".join(words[start:start + cls.CHUNK_WORDS])})
+
+        postings = {}
+        lengths = np.zeros(len(passages), dtype=np.float32)
+        for pid, passage in enumerate(passages):
+            counts = Counter(normalize_words(f"{passage['chapter']} {passage['text']}"))
+            lengths[pid] = sum(counts.values())
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((pid, tf))
+
+        avg_length = float(lengths.mean()) if len(passages) else 0.0
+        terms, ids, weights, offset = {}, [], [], 0
+        for term in sorted(postings):
+            entries = postings[term]
+            pids = np.array([p for p, _ in entries], dtype=np.int32)
+            tf = np.array([t for _, t in entries], dtype=np.float32)
+            norm = cls.K1 * (1 - cls.B + cls.B * lengths[pids] / avg_length)
+            idf = float(np.log(1 + (len(passages) - len(entries) + 0.5) / (len(entries) + 0.5)))
+            terms[term] = [offset, len(entries), idf]
+            ids.append(pids)
+            weights.append((tf * (cls.K1 + 1) / (tf + norm)).astype(np.float32))
+            offset += len(entries)
+
+        np.save(os.path.join(directory, "postings.npy"), np.concatenate(ids) if ids else np.zeros(0, np.int32))
+        np.save(os.path.join(directory, "weights.npy"), np.concatenate(weights) if weights else np.zeros(0, np.float32))
+        offsets = []
+        with open(os.path.join(directory, "passages.jsonl"), "wb") as f:
+            for passage in passages:
+                offsets.append(f.tell())
+                f.write(json.dumps(passage, ensure_ascii=False).encode("utf-8") + b"\n")
+        np.save(os.path.join(directory, "passage_offsets.npy"), np.array(offsets, dtype=np.int64))
+        with open(os.path.join(directory, "terms.json"), "w", encoding="utf-8") as f:
+            json.dump(terms, f, ensure_ascii=False)
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"book_id": book_id, "passages": len(passages), "avg_length": avg_length, "k1": cls.K1, "b": cls.B}, f)
+        return len(passages)
+
+    def search(self, query, k=5):
+        """Top-`k` passages for `query` as [{book_id, chapter, text, score}]."""
+        np = _lazy_import("numpy")
+        scores = np.zeros(self.meta["passages"], dtype=np.float32)
+        for term in set(normalize_words(query)):
+            entry = self.terms.get(term)
+            if entry is None:
+                continue
+            offset, length, idf = entry
+            scores += np.bincount(
+                self.postings[offset:offset + length], weights=self.weights[offset:offset + length] * idf,
+                minlength=len(scores),
+            ).astype(np.float32)
+        hits = np.flatnonzero(scores)
+        if not hits.size:
+            return []
+        if hits.size > k:
+            hits = hits[np.argpartition(-scores[hits], k - 1)[:k]]
+        hits = hits[np.argsort(-scores[hits], kind="stable")]
+        return [{"book_id": self.book_id, **self._passage(int(pid)), "score": round(float(scores[pid]), 3)} for pid in hits]
+
+    def close(self):
+        """Closes passages.jsonl; the index cannot be searched afterwards."""
+        with self._lock:
+            if self._passages is not None:
+                self._passages.close()
+                self._passages = None
+
+    def __del__(self):
+        if getattr(self, "_passages", None) is not None:
+            self._passages.close()
+
+    def _passage(self, pid):
+        with self._lock:
+            self._passages.seek(int(self.passage_offsets[pid]))
+            return json.loads(self._passages.readline())
+
+
+class NcertLibrary:
+    """
+    The set of locally indexed books under NCERT_INDEX_DIR, each opened on first use.
+    After rebuilding a book in a running process, `reload(book_id)` closes the old index
+    and the next search opens the new one.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._books = {}
+        self._lock = threading.Lock()
+
+    def available(self):
+        """Book ids with a built index."""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if os.path.exists(os.path.join(self.root, d, "meta.json")))
+
+    def book(self, book_id):
+        with self._lock:
+            if book_id not in self._books:
+                directory = os.path.join(self.root, book_id)
+                self._books[book_id] = NcertBookIndex(directory) if os.path.exists(os.path.join(directory, "meta.json")) else None
+            return self._books[book_id]
+
+    def reload(self, book_id=None):
+        """Closes and forgets one opened index (or all of them) so it is reopened from disk."""
+        with self._lock:
+            closing = [self._books.pop(book_id, None)] if book_id else list(self._books.values())
+            if not book_id:
+                self._books = {}
+        for index in closing:
+            if index is not None:
+                index.close()
+
 
+NCERT_LIBRARY = NcertLibrary(NCERT_INDEX_DIR)
+
+
+class NcertDataStoreRegistry:
+    """
+    The NCERT books available for search, loaded from a JSON manifest (NCERT_DATASTORE_MANIFEST).
+
+    Nothing is instantiated up front: a book's backend (its local index, or the Vertex AI
+    Search serving config queried through the Discovery Engine client) is resolved the
+    first time the book is searched, and the model only ever sees the single
+    search_ncert_textbooks declaration plus a one-line list of books.
+    """
+
+    def __init__(self, manifest_path, library):
+        self.library = library
+        with open(manifest_path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        parent = f"projects/{manifest['project']}/locations/{manifest['location']}/collections/{manifest['collection']}"
+        self.books = {
+            ncert_book_id(book["class"], book["subject"]): f"{parent}/dataStores/{book['data_store']}"
+            for book in manifest["books"]
+        }
+        self._backends = {}
+        self._lock = threading.Lock()
+
+    def describe(self):
+        """'class 1: hindi, english, maths; class 2: ...' for the agent instruction."""
+        by_class = {}
+        for book_id in self.books:
+            _, number, _, subject = book_id.split("-", 3)
+            by_class.setdefault(int(number), []).append(subject)
+        return "; ".join(f"class {n}: {', '.join(subjects)}" for n, subjects in sorted(by_class.items()))
+
+    def search(self, book_ids, query, k=5, backend=NCERT_SEARCH_BACKEND):
+        """
+        Searches the books concurrently on their backends and merges the ranked passages
+        (each book's best passage first). Returns (passages, unknown book ids).
+        """
+        known = [b for b in dict.fromkeys(book_ids) if b in self.books]
+        unknown = [b for b in dict.fromkeys(book_ids) if b not in self.books]
+        per_book = list(get_io_pool().map(lambda book_id: self._backend(book_id, backend)(query, k), known))
+        leaders = [hits[0] for hits in per_book if hits]
+        rest = sorted((h for hits in per_book for h in hits[1:]), key=lambda h: -h["score"])
+        return leaders + rest[:max(k - len(leaders), 0)], unknown
+
+    def grounding_tools(self):
+        """One VertexAiSearchTool per book (the legacy per-book tool list), built on request."""
+        return [VertexAiSearchTool(data_store_id=data_store) for data_store in self.books.values()]
+
+    def _backend(self, book_id, backend):
+        with self._lock:
+            key = (book_id, backend)
+            if key not in self._backends:
+                index = self.library.book(book_id) if backend in ("auto", "local") else None
+                if index is not None:
+                    # Resolved through the library on every call, so a reloaded index is picked up.
+                    self._backends[key] = functools.partial(self._local_search, book_id)
+                elif backend == "local":
+                    self._backends[key] = lambda query, k: []
+                else:
+                    self._backends[key] = self._vertex_searcher(book_id)
+            return self._backends[key]
+
+    def _local_search(self, book_id, query, k):
+        index = self.library.book(book_id)
+        return index.search(query, k) if index is not None else []
+
+    def _vertex_searcher(self, book_id):
+        serving_config = f"{self.books[book_id]}/servingConfigs/default_search"
+
+        def search(query, k):
+            discoveryengine = _lazy_import("google.cloud.discoveryengine_v1")
+            request = discoveryengine.SearchRequest(
+                serving_config=serving_config,
+                query=query,
+                page_size=k,
+                content_search_spec=discoveryengine.SearchRequest.ContentSearchSpec(
+                    snippet_spec=discoveryengine.SearchRequest.ContentSearchSpec.SnippetSpec(return_snippet=True),
+                ),
+            )
+            response = CLIENTS.get("discoveryengine").search(request=request)
+            passages = []
+            for rank, result in enumerate(response.results):
+                data = discoveryengine.Document.to_dict(result.document).get("derived_struct_data") or {}
+                text = " ".join(s.get("snippet", "") for s in data.get("snippets", []))
+                # Vertex returns a ranked list without scores; keep the order comparable across books.
+                passages.append({"book_id": book_id, "chapter": data.get("title", ""), "text": text, "score": round(1.0 / (rank + 1), 3)})
+            return passages
+
+        return search
+
+
+NCERT_REGISTRY = NcertDataStoreRegistry(NCERT_DATASTORE_MANIFEST, NCERT_LIBRARY)
+
+
+def search_ncert_textbooks(class_numbers: list[int], subjects: list[str], query: str) -> str:
+    """
+    Searches one or more NCERT textbooks at once and returns the most relevant passages.
+    For comparisons, pass every book in a single call; they are searched in parallel.
+
+    Args:
+        class_numbers: The class of each book to search (e.g., [1, 2]).
+        subjects: The subject of each book, in the same order as class_numbers (e.g., ['hindi', 'hindi']).
+        query: What to look for, in the language of the books (e.g., 'फल और सब्ज़ियाँ', 'shapes').
+
+    Returns:
+        A JSON string with the ranked passages (book, chapter, text) and any requested books that do not exist.
+    """
+    print(f"Tool called: search_ncert_textbooks for {list(zip(class_numbers, subjects))}: '{query}'")
+    try:
+        if len(class_numbers) != len(subjects):
+            return json.dumps({"error": "Please give exactly one subject for each class number."})
+        started = time.perf_counter()
+        book_ids = [ncert_book_id(c, s) for c, s in zip(class_numbers, subjects)]
+        passages, missing = NCERT_REGISTRY.search(book_ids, query, k=max(5, 2 * len(book_ids)))
+        print(f"NCERT search over {len(book_ids)} books took {(time.perf_counter() - started) * 1000:.1f} ms.")
+        result = {"passages": passages}
+        if missing:
+            result["books_not_available"] = missing
+        return json.dumps(result, ensure_ascii=False)
+    except Exception as e:
+        print(f"\n--- ERROR IN search_ncert_textbooks ---")
+        traceback.print_exc()
+        return json.dumps({"error": f"The textbook search failed: {str(e)}"})
+
+
+# NCERTKnowledgeBaseAgent
+# The books and their data stores come from the manifest (see NcertDataStoreRegistry).
+
+NcertSearchTool = FunctionTool(func=async_tool(search_ncert_textbooks))
+
+
+def ncert_search_tools(backend=NCERT_SEARCH_BACKEND):
+    """The NCERT agent's tools: the single dispatch tool, or one grounding tool per book for "grounding"."""
+    print(f"NCERT search backend: {backend} ({len(NCERT_REGISTRY.books)} books)")
+    return NCERT_REGISTRY.grounding_tools() if backend == "grounding" else [NcertSearchTool]
 
 
 NCERTKnowledgeBaseAgent = Agent(
     name="NCERTKnowledgeBaseAgent",
     model=GEMINI_2_FLASH,
-    tools=[
-        vertex_search_tool_class_1_hindi,
-        vertex_search_tool_class_1_english,
-        vertex_search_tool_class_1_maths,
-        vertex_search_tool_class_2_hindi,
-        vertex_search_tool_class_2_english,
-        vertex_search_tool_class_2_maths,
-        # ... a very long list of tools
-    ],
+    tools=ncert_search_tools(),
     instruction="""
     **YOUR ROLE:**
     You are an expert researcher specializing in NCERT textbooks. You can find, compare, and synthesize information from multiple books to answer complex questions.
 
     **YOUR PROCESS:**
     1.  Carefully analyze the user's query to understand exactly what information is needed.
-    2.  Identify ALL the textbooks (class number and subject) required to answer the question.
-    3.  Analyze the user's query to determine the precise class and subject.
-        Then, select the ONE specific tool that matches that class and subject to perform the search.
-    4.  **If the query requires information from multiple books (e.g., a comparison), you MUST call the appropriate tool multiple times, once for each book.**  
+    2.  Identify ALL the textbooks (class number and subject) required to answer the question. The available books are: {ncert_books}.
+    3.  Analyze the user's query to determine the precise class and subject of each book.
+    4.  Call `search_ncert_textbooks` ONCE, listing every class and subject you need (for a comparison, include all the books being compared); the books are searched in parallel and each book's best passage is returned. If you instead have one search tool per book, call the matching tool once for each book.
     5.  Wait until you have gathered ALL the necessary information from ALL your tool calls.
     6.  Finally, synthesize the collected information into a single, comprehensive answer that directly addresses the user's original question.
     7.  If any piece of information cannot be found, state that clearly in your final answer.
-    """,
+    """.replace("{ncert_books}", NCERT_REGISTRY.describe()),
     description="A specialist agent that can find, compare, and synthesize information from any NCERT textbook across all classes and subjects.",
 )
 
-NCERTKnowledgeBaseAgentRouter = SequentialAgent(
+NCERTKnowledgeBaseAgentRouter = AgentRoute(
     name="NCERTKnowledgeBaseAgentRouter",
     description="Routs the user to the appropriate NCERTKnowledgeBaseAgent",
     sub_agents=[
@@ -691,6 +4165,208 @@ NCERTKnowledgeBaseAgentRouter = SequentialAgent(
 
 # Root Agent
 
+# --- Fast-path routing ---
+# Most first turns name their task plainly ("make a worksheet...", "draw the water
+# cycle", an attached recording), so the root agent's LLM hop only picks the obvious
+# router. FastPathRouter classifies the message locally with weighted regex rules (and,
+# optionally, a small hashed naive Bayes model) and, when confident, answers the root
+# agent's model call itself with a transfer_to_agent function call. Unsure cases fall
+# through to the LLM, and its choice is compared with the local guess so the threshold
+# can be tuned from the logged agreement rate.
+
+FAST_ROUTER_MODE = os.getenv("SAHAYAK_FAST_ROUTER", "on")  # "on", "shadow" (log only) or "off"
+FAST_ROUTER_MIN_CONFIDENCE = float(os.getenv("SAHAYAK_FAST_ROUTER_MIN_CONFIDENCE", 0.7))
+FAST_ROUTER_CLASSIFIER = os.getenv("SAHAYAK_FAST_ROUTER_CLASSIFIER", "") == "1"
+
+# (target agent, weight, pattern). Hindi patterns avoid \b: matras are not \w in `re`.
+FAST_ROUTER_RULES = [
+    (WorksheetGeneratorAgentRouter.name, 4, r"\bwork\s?sheets?\b|वर्कशीट|कार्यपत्रक|अभ्यास\s?पत्र"),
+    (WorksheetGeneratorAgentRouter.name, 2, r"\b(question papers?|quiz|practice questions|fill in the blanks|mcqs?)\b|प्रश्न\s?पत्र"),
+    (LessonPlannerAgentRouter.name, 4, r"\blesson\s?plans?\b|\b(weekly|week|daily|\d+[- ]day)\s+plans?\b|\bcurriculum\b|पाठ\s?योजना|शिक्षण\s?योजना"),
+    (GameGeneratorAgentRouter.name, 4, r"\bgames?\b|खेल"),
+    (GameGeneratorAgentRouter.name, 2, r"\b(fun activity|activities|puzzles?|riddles?|role[- ]play|interactive exercise)\b|पहेली|गतिविधि"),
+    (VisualAidAgentRouter.name, 4, r"\b(draw|drawings?|sketch(?:es)?|diagrams?|charts?|visual aids?|illustrations?|pictures? of|images? of)\b|चित्र|आरेख|ड्राइंग"),
+    (VisualAidAgentRouter.name, 1, r"\bblackboard\b|ब्लैकबोर्ड"),
+    (HyperLocalContentAgentRouter.name, 4, r"\b(story|stories|poem|song|folk\s?tale)\b|कहानी|कविता|गीत|कथा"),
+    (HyperLocalContentAgentRouter.name, 1, r"\b(analogy|local language)\b"),
+    (NCERTKnowledgeBaseAgentRouter.name, 4, r"\bncert\b|एनसीईआरटी"),
+    (NCERTKnowledgeBaseAgentRouter.name, 2, r"\btext\s?books?\b|\bfact[- ]check\b|पाठ्यपुस्तक"),
+    (ReadingAssessorAgentRouter.name, 4, r"\breading (fluency|assessment|test|progress|history|level)\b|\bfluency\b|\bread(ing)? aloud\b|\bcheck (my )?(student'?s?|child'?s?) reading\b|पठन|धाराप्रवाह"),
+    (ReadingAssessorAgentRouter.name, 2, r"\b(wcpm|words per minute|recording)\b"),
+    (InstantKnowledgeAgentRouter.name, 3, r"^\W*(why|how (do|does|is|are|can)|what (is|are|makes))\b|क्यों|कैसे"),
+    (InstantKnowledgeAgentRouter.name, 1, r"\b(explain|simple explanation)\b|समझाओ|समझाइए"),
+]
+
+# Seed sentences for the optional classifier (SAHAYAK_FAST_ROUTER_CLASSIFIER=1).
+FAST_ROUTER_EXAMPLES = {
+    HyperLocalContentAgentRouter.name: ["Create a story in Marathi about farmers to explain soil types", "write a poem in Tamil about the monsoon", "give a local example about the village market for fractions"],
+    NCERTKnowledgeBaseAgentRouter.name: ["what does the class 7 textbook say about the Mughal empire", "find the NCERT chapter on photosynthesis", "fact-check this line from the science book"],
+    WorksheetGeneratorAgentRouter.name: ["make a worksheet from this textbook page for three levels", "create practice questions for class 4 on multiplication", "prepare a question paper on nouns"],
+    ReadingAssessorAgentRouter.name: ["check my student's reading", "assess this reading recording", "how has Priya's reading improved this month"],
+    InstantKnowledgeAgentRouter.name: ["why is the sky blue", "how do magnets work", "explain why we have seasons in Hindi"],
+    GameGeneratorAgentRouter.name: ["make a game about fractions", "a fun classroom activity for learning verbs", "an interactive exercise on the solar system"],
+    LessonPlannerAgentRouter.name: ["create a 5-day lesson plan for class 3 on the water cycle", "weekly plan for teaching plants", "plan my lessons for next week on maps"],
+    VisualAidAgentRouter.name: ["draw me the water cycle", "create a simple chart of the plant cell", "a diagram of the human heart for the blackboard"],
+}
+
+
+class FastPathRouter:
+    """
+    Local classifier in front of the root agent's routing LLM call.
+
+    `before_model` (an ADK before_model_callback) scores the teacher's first message of a
+    session; follow-ups depend on the conversation so far and always go to the LLM.
+    Confidence is the winning score over the winning plus runner-up scores plus a prior;
+    at or above `min_confidence` the callback returns a transfer_to_agent call so the
+    model is never invoked. Otherwise the guess is kept per invocation and `after_model`
+    records whether the LLM agreed. `stats()` reports agreement by confidence bucket.
+    """
+
+    PRIOR = 0.5
+    ATTACHMENT_WEIGHTS = {"audio": (ReadingAssessorAgentRouter.name, 6), "image": (WorksheetGeneratorAgentRouter.name, 2)}
+    CLASSIFIER_WEIGHT = 2.0
+    HASH_BUCKETS = 4096
+
+    def __init__(self, rules, examples=None, mode="on", min_confidence=0.7):
+        self.mode = mode
+        self.min_confidence = min_confidence
+        self.rules = [(target, weight, re.compile(pattern, re.IGNORECASE)) for target, weight, pattern in rules]
+        self.examples = examples
+        self._model = None
+        self._lock = threading.Lock()
+        self._pending = InvocationMap()
+        self._buckets = {}
+        self._counters = {"fast_path": 0, "deferred": 0, "compared": 0, "agreed": 0}
+
+    def classify(self, text, attachments=()):
+        """Returns (best agent name or None, confidence, {agent: score})."""
+        scores = Counter()
+        for target, weight, pattern in self.rules:
+            if pattern.search(text):
+                scores[target] += weight
+        for kind in attachments:
+            if kind in self.ATTACHMENT_WEIGHTS:
+                target, weight = self.ATTACHMENT_WEIGHTS[kind]
+                scores[target] += weight
+        if self.examples and text.strip():
+            for target, probability in self._classifier_probabilities(text).items():
+                scores[target] += self.CLASSIFIER_WEIGHT * probability
+        if not scores:
+            return None, 0.0, {}
+        ranked = scores.most_common(2)
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        confidence = ranked[0][1] / (ranked[0][1] + runner_up + self.PRIOR)
+        return ranked[0][0], round(confidence, 3), dict(scores)
+
+    def before_model(self, callback_context, llm_request):
+        if self.mode == "off" or user_turn_count(callback_context) != 1:
+            return None
+        message = self._latest_user_message(llm_request)
+        if message is None:
+            return None
+        text, attachments = message
+        target, confidence, scores = self.classify(text, attachments)
+        if target is None:
+            return None
+        if self.mode == "on" and confidence >= self.min_confidence:
+            with self._lock:
+                self._counters["fast_path"] += 1
+            self._log("fast_path", target, confidence, scores)
+            llm_response = _lazy_import("google.adk.models.llm_response")
+            return llm_response.LlmResponse(content=types.Content(
+                role="model",
+                parts=[types.Part.from_function_call(name="transfer_to_agent", args={"agent_name": target})],
+            ))
+        with self._lock:
+            self._counters["deferred"] += 1
+        self._pending.put(callback_context.invocation_id, (target, confidence))
+        self._log("deferred", target, confidence, scores)
+        return None
+
+    def after_model(self, callback_context, llm_response):
+        guess = self._pending.pop(callback_context.invocation_id)
+        if guess is None or llm_response.content is None:
+            return None
+        chosen = next(
+            (p.function_call.args.get("agent_name") for p in llm_response.content.parts or []
+             if p.function_call and p.function_call.name == "transfer_to_agent"),
+            None,
+        )
+        if chosen is None:
+            return None
+        target, confidence = guess
+        bucket = f"{min(int(confidence * 10), 9) / 10:.1f}"
+        with self._lock:
+            self._counters["compared"] += 1
+            self._counters["agreed"] += chosen == target
+            agreed, compared = self._buckets.get(bucket, (0, 0))
+            self._buckets[bucket] = (agreed + (chosen == target), compared + 1)
+        print(f"FastPathRouter: LLM chose {chosen}, local guess {target} ({confidence:.2f}); agreement {self.stats()['agreement_rate']}")
+        return None
+
+    def stats(self):
+        """Counters, overall agreement with the LLM, and agreement per 0.1 confidence bucket."""
+        with self._lock:
+            counters = dict(self._counters)
+            buckets = {b: {"agreed": a, "compared": c, "rate": round(a / c, 3)} for b, (a, c) in sorted(self._buckets.items())}
+        counters["agreement_rate"] = round(counters["agreed"] / counters["compared"], 3) if counters["compared"] else None
+        counters["by_confidence"] = buckets
+        return counters
+
+    @staticmethod
+    def _latest_user_message(llm_request):
+        """(text, attachment kinds) of the newest content if it is a fresh user turn, else None."""
+        if not llm_request.contents:
+            return None
+        content = llm_request.contents[-1]
+        if content.role != "user" or any(p.function_response for p in content.parts or []):
+            return None
+        texts, attachments = [], []
+        for part in content.parts or []:
+            if part.text:
+                texts.append(part.text)
+            blob = part.file_data or part.inline_data
+            mime_type = getattr(blob, "mime_type", None) or ""
+            if mime_type:
+                attachments.append(mime_type.split("/")[0])
+        return " ".join(texts), attachments
+
+    def _classifier_probabilities(self, text):
+        """Multinomial naive Bayes over hashed word unigrams and bigrams, trained lazily on `examples`."""
+        np = _lazy_import("numpy")
+        if self._model is None:
+            labels = list(self.examples)
+            counts = np.ones((len(labels), self.HASH_BUCKETS))
+            for row, label in enumerate(labels):
+                for sentence in self.examples[label]:
+                    np.add.at(counts[row], self._features(sentence), 1.0)
+            self._model = (labels, np.log(counts / counts.sum(axis=1, keepdims=True)))
+        labels, log_probs = self._model
+        features = self._features(text)
+        if not features:
+            return {}
+        log_posterior = log_probs[:, features].sum(axis=1)
+        posterior = np.exp(log_posterior - log_posterior.max())
+        posterior /= posterior.sum()
+        return dict(zip(labels, posterior.tolist()))
+
+    def _features(self, text):
+        words = normalize_words(text)
+        grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+        return [int.from_bytes(hashlib.md5(g.encode("utf-8")).digest()[:4], "little") % self.HASH_BUCKETS for g in grams]
+
+    def _log(self, decision, target, confidence, scores):
+        print(f"FastPathRouter: {decision} -> {target} (confidence {confidence:.2f}, scores {json.dumps({k: round(v, 2) for k, v in scores.items()})})")
+
+
+FAST_PATH_ROUTER = FastPathRouter(
+    FAST_ROUTER_RULES,
+    examples=FAST_ROUTER_EXAMPLES if FAST_ROUTER_CLASSIFIER else None,
+    mode=FAST_ROUTER_MODE,
+    min_confidence=FAST_ROUTER_MIN_CONFIDENCE,
+)
+
+
 root_agent = Agent(
     name="Sahayak",
     model=GEMINI_2_FLASH,
@@ -727,12 +4403,22 @@ root_agent = Agent(
     ),
     
     # Add the new router to the list of sub-agents
-    sub_agents=[NCERTKnowledgeBaseAgentRouter, HyperLocalContentAgentRouter, WorksheetGeneratorAgentRouter, ReadingAssessorAgentRouter, InstantKnowledgeAgentRouter, GameGeneratorAgentRouter , LessonPlannerAgentRouter , VisualAidAgentRouter],
+    sub_agents=build_agent_graph([NCERTKnowledgeBaseAgentRouter, HyperLocalContentAgentRouter, WorksheetGeneratorAgentRouter, ReadingAssessorAgentRouter, InstantKnowledgeAgentRouter, GameGeneratorAgentRouter , LessonPlannerAgentRouter , VisualAidAgentRouter]),
+    # Obvious first turns are routed locally without a model call (see FastPathRouter).
+    before_model_callback=FAST_PATH_ROUTER.before_model,
+    after_model_callback=FAST_PATH_ROUTER.after_model,
 )
 
 
+_STARTUP_TIMINGS["agent_module_total"] = time.perf_counter() - _MODULE_LOAD_STARTED
+if os.getenv("SAHAYAK_STARTUP_TIMING"):
+    print(f"Startup timing: {json.dumps(startup_report())}")
+
+
 # For Deploy-----------------------------------------------------
 if __name__ == "__main__":
+    from vertexai import agent_engines
+    ensure_vertexai_initialized()
 
     print(f"Starting deployment of agent '{APP_NAME}'...")
    
@@ -741,13 +4427,29 @@ if __name__ == "__main__":
         "python-dotenv",
         "google-cloud-texttospeech>=2.27.0",
         "google-cloud-storage",
-        "reportlab>=4.4.2",
+        "reportlab[accel]>=4.4.2",
+        "pypdf",
+        "numpy",
+        "pillow",
+        "imageio-ffmpeg",
+        "google-cloud-discoveryengine",
         "google-cloud-speech>=2.33.0"
     ]
 
+    class SahayakApp(agent_engines.AdkApp):
+        """AdkApp that stops a session's running tools (and their operations) when the session is deleted."""
+
+        def delete_session(self, *, user_id, session_id, **kwargs):
+            cancel_session_tools(session_id)
+            return super().delete_session(user_id=user_id, session_id=session_id, **kwargs)
+
+        async def async_delete_session(self, *, user_id, session_id, **kwargs):
+            cancel_session_tools(session_id)
+            return await super().async_delete_session(user_id=user_id, session_id=session_id, **kwargs)
+
     remote_app = agent_engines.create(
         display_name=APP_NAME,
-        agent_engine=root_agent,
+        agent_engine=SahayakApp(agent=root_agent),
         requirements=updated_requirements,
     )
 
@@ -0,0 +1,107 @@
+# Orchestration overhead of the agent graph, wrapped vs. flattened, with a mock model.
+#
+#   python benchmarks/bench_agent_graph.py [--requests 200] [--turns 1]
+#
+# The root and every specialist use a mock LLM that answers instantly (the root always
+# transfers to the route picked by the local rules, specialists reply with one line), so
+# the figures are pure ADK orchestration: events, agents and model calls per request.
+# With --turns > 1 each session gets follow-up messages too, which is where the wrapper
+# costs most: ADK only resumes an LLM agent whose ancestors are all LLM agents, so behind
+# a SequentialAgent every follow-up goes back through the root's routing call.
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.agents import Agent  # noqa: E402
+from google.adk.models.base_llm import BaseLlm  # noqa: E402
+from google.adk.models.llm_response import LlmResponse  # noqa: E402
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import agent  # noqa: E402
+
+REQUESTS = [
+    "Make a worksheet on fractions for class 4",
+    "Create a 5-day lesson plan for Class 3 on the water cycle",
+    "draw me the water cycle",
+    "Make a game about fractions",
+    "Why is the sky blue?",
+    "Create a story in Marathi about farmers",
+    "what does the NCERT class 7 textbook say about the Mughal empire?",
+    "check my student's reading fluency",
+]
+
+
+class MockLlm(BaseLlm):
+    """Root: transfers to the locally classified route. Specialists: one text reply."""
+
+    model: str = "mock"
+    route: bool = False
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        if self.route:
+            text = llm_request.contents[-1].parts[0].text
+            target = agent.FAST_PATH_ROUTER.classify(text)[0]
+            part = types.Part.from_function_call(name="transfer_to_agent", args={"agent_name": target})
+        else:
+            part = types.Part(text="Here you go.")
+        yield LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def build_root(flatten, llm):
+    routes = []
+    for name in ("NCERTKnowledgeBaseAgentRouter", "HyperLocalContentAgentRouter", "WorksheetGeneratorAgentRouter",
+                 "ReadingAssessorAgentRouter", "InstantKnowledgeAgentRouter", "GameGeneratorAgentRouter",
+                 "LessonPlannerAgentRouter", "VisualAidAgentRouter"):
+        route = getattr(agent, name)
+        specialist = route.sub_agents[0].model_copy(update={"model": llm, "tools": []})
+        routes.append(agent.AgentRoute(name=route.name, description=route.description, sub_agents=[specialist]))
+    return Agent(name="Sahayak", model=MockLlm(route=True), instruction="Route the request.",
+                 sub_agents=agent.build_agent_graph(routes, flatten=flatten))
+
+
+async def run(flatten, requests, turns):
+    specialist_llm = MockLlm()
+    root = build_root(flatten, specialist_llm)
+    runner = InMemoryRunner(agent=root, app_name="bench")
+    events = authors = 0
+    started = time.perf_counter()
+    for n in range(requests):
+        session = await runner.session_service.create_session(app_name="bench", user_id="u")
+        message = types.Content(role="user", parts=[types.Part(text=REQUESTS[n % len(REQUESTS)])])
+        for _ in range(turns):
+            seen = set()
+            async for event in runner.run_async(user_id="u", session_id=session.id, new_message=message):
+                events += 1
+                seen.add(event.author)
+            authors += len(seen)
+    elapsed = time.perf_counter() - started
+    return {
+        "ms_per_request": elapsed / requests * 1000,
+        "events_per_request": events / requests,
+        "agents_per_request": authors / requests,
+        "llm_calls_per_request": (root.model.calls + specialist_llm.calls) / requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--turns", type=int, default=1)
+    args = parser.parse_args()
+
+    results = {label: asyncio.run(run(flatten, args.requests, args.turns)) for label, flatten in (("wrapped", False), ("flattened", True))}
+    print(f"{'':<24}{'wrapped':>12}{'flattened':>12}")
+    for metric in results["wrapped"]:
+        print(f"{metric:<24}{results['wrapped'][metric]:>12.2f}{results['flattened'][metric]:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
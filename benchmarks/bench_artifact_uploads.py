@@ -0,0 +1,93 @@
+# Tool latency with inline uploads vs. the write-behind ArtifactUploadQueue.
+#
+#   python benchmarks/bench_artifact_uploads.py [--docs 20] [--mbps 4] [--failure-rate 0.2]
+#
+# generate_pdf_from_text runs against the local filesystem store wrapped to upload at
+# --mbps with a --failure-rate chance of a transient error per attempt. The same
+# worksheets (made unique per run) go through the inline path and the write-behind
+# queue; for the queue we report how long the tool took to return, how long until the
+# link was readable, and the queue's counters.
+
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("SAHAYAK_CACHE_DIR", tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import (  # noqa: E402
+    ARTIFACT_UPLOADS, CLIENTS, URL_PATTERN, ArtifactUploadQueue, LocalArtifactStore, generate_pdf_from_text,
+)
+import agent  # noqa: E402
+from bench_pdf_render import SAMPLE_WORKSHEET  # noqa: E402
+
+
+class ThrottledStore(LocalArtifactStore):
+    """LocalArtifactStore with a per-upload bandwidth limit and random transient failures."""
+
+    def __init__(self, root, mbps, failure_rate):
+        super().__init__(root)
+        self.mbps = mbps
+        self.failure_rate = failure_rate
+        self._random = random.Random(7)
+        self._lock = threading.Lock()
+
+    def upload_bytes(self, bucket_name, object_name, data, content_type):
+        time.sleep(0.05 + len(data) * 8 / (self.mbps * 1e6))  # request latency + transfer
+        with self._lock:
+            fail = self._random.random() < self.failure_rate
+        if fail:
+            raise ConnectionError("503 Service Unavailable (injected)")
+        return super().upload_bytes(bucket_name, object_name, data, content_type)
+
+
+def run(docs, run_id):
+    returned = []
+    urls = []
+    for i in range(docs):
+        started = time.perf_counter()
+        reply = generate_pdf_from_text(f"{SAMPLE_WORKSHEET}\n{run_id}-{i}. Extra question ____________________")
+        returned.append(time.perf_counter() - started)
+        urls.extend(URL_PATTERN.findall(reply))
+    return returned, urls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--mbps", type=float, default=4.0)
+    parser.add_argument("--failure-rate", type=float, default=0.2)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp()
+    CLIENTS.override("artifact_store", ThrottledStore(root, args.mbps, args.failure_rate))
+    generate_pdf_from_text(SAMPLE_WORKSHEET)  # warm up the stylesheet and fonts
+    ARTIFACT_UPLOADS.drain()
+
+    agent.ARTIFACT_UPLOADS = ArtifactUploadQueue(write_behind=False, max_attempts=10, retry_base_seconds=0.05)
+    started = time.perf_counter()
+    inline, _ = run(args.docs, "inline")
+    inline_total = time.perf_counter() - started
+
+    agent.ARTIFACT_UPLOADS = queue = ArtifactUploadQueue(max_attempts=10, retry_base_seconds=0.05)
+    started = time.perf_counter()
+    behind, urls = run(args.docs, "behind")
+    tools_done = time.perf_counter() - started
+    states = queue.wait(urls, timeout=120)
+    all_ready = time.perf_counter() - started
+    missing = [url for url in urls if not os.path.exists(url[len("file://"):])]
+
+    print(f"{args.docs} worksheets, {args.mbps:g} Mbit/s uploads, {args.failure_rate:.0%} transient failures")
+    print(f"  inline upload : tool median {statistics.median(inline) * 1000:7.1f} ms, p95 {sorted(inline)[int(len(inline) * 0.95) - 1] * 1000:7.1f} ms, all done {inline_total:.2f}s")
+    print(f"  write-behind  : tool median {statistics.median(behind) * 1000:7.1f} ms, p95 {sorted(behind)[int(len(behind) * 0.95) - 1] * 1000:7.1f} ms, tools done {tools_done:.2f}s, all readable {all_ready:.2f}s")
+    print(f"  states: {sorted(set(states.values()))}, missing files after wait: {len(missing)}")
+    print(f"  queue stats: {queue.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+# Concurrency check for the async tool layer: many ADK sessions in one process while
+# slow long-running tools are in flight.
+#
+#   python benchmarks/bench_async_tools.py [--slow-sessions 10] [--fast-sessions 40] [--tts-seconds 3]
+#
+# Speech synthesis is faked with an operation that finishes after --tts-seconds, and the
+# agents use a mock model that calls generate_audio_from_text once (slow sessions) or
+# just replies (fast sessions). The same workload runs with the blocking sync tool and
+# with the async tool; then one slow session is cancelled to show the operation is
+# cancelled with it.
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("SAHAYAK_CACHE_DIR", tempfile.mkdtemp())
+# The fakes model the long-audio operation; short texts would otherwise use synthesize_speech.
+os.environ.setdefault("SAHAYAK_TTS_MODE", "long_audio")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.agents import Agent  # noqa: E402
+from google.adk.models.base_llm import BaseLlm  # noqa: E402
+from google.adk.models.llm_response import LlmResponse  # noqa: E402
+from google.adk.runners import InMemoryRunner  # noqa: E402
+from google.adk.tools import FunctionTool  # noqa: E402
+from google.genai import types  # noqa: E402
+
+import agent  # noqa: E402
+
+
+class FakeOperation:
+    cancelled = 0
+
+    def __init__(self, seconds):
+        self.finishes_at = time.monotonic() + seconds
+
+    def done(self):
+        time.sleep(0.005)  # one status RPC
+        return time.monotonic() >= self.finishes_at
+
+    def result(self, timeout=None):
+        time.sleep(max(0.0, self.finishes_at - time.monotonic()))
+
+    def cancel(self):
+        FakeOperation.cancelled += 1
+
+
+class MockLlm(BaseLlm):
+    """Calls generate_audio_from_text once for 'audio:' messages, then replies with text."""
+
+    model: str = "mock"
+
+    async def generate_content_async(self, llm_request, stream=False):
+        last = llm_request.contents[-1].parts[0]
+        if last.text and last.text.startswith("audio:"):
+            part = types.Part.from_function_call(name="generate_audio_from_text", args={
+                "text": last.text, "language_code": "hi-IN", "voice_name": "hi-IN-Chirp3-HD-Callirrhoe",
+                "audio_format": "LINEAR16"})
+        else:
+            part = types.Part(text="Done.")
+        yield LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def install_fakes(tts_seconds):
+    blob = SimpleNamespace(exists=lambda: False)
+    agent.CLIENTS.override("storage", SimpleNamespace(bucket=lambda name: SimpleNamespace(blob=lambda n: blob)))
+    agent.CLIENTS.override("tts_long", SimpleNamespace(synthesize_long_audio=lambda request: FakeOperation(tts_seconds)))
+
+
+async def session(runner, text):
+    s = await runner.session_service.create_session(app_name="bench", user_id="u")
+    started = time.perf_counter()
+    message = types.Content(role="user", parts=[types.Part(text=text)])
+    async for _ in runner.run_async(user_id="u", session_id=s.id, new_message=message):
+        pass
+    return time.perf_counter() - started
+
+
+async def workload(tool, slow, fast, run_id):
+    runner = InMemoryRunner(agent=Agent(name="Teacher", model=MockLlm(), instruction="x", tools=[tool]), app_name="bench")
+    started = time.perf_counter()
+    slow_tasks = [asyncio.create_task(session(runner, f"audio: story {run_id} {n}")) for n in range(slow)]
+    await asyncio.sleep(0.2)  # let the slow tools start
+    fast_times = await asyncio.gather(*(session(runner, "hello") for _ in range(fast)))
+    fast_done = time.perf_counter() - started
+    await asyncio.gather(*slow_tasks)
+    return fast_times, fast_done, time.perf_counter() - started
+
+
+async def cancellation_check(tool):
+    runner = InMemoryRunner(agent=Agent(name="Teacher", model=MockLlm(), instruction="x", tools=[tool]), app_name="bench")
+    s = await runner.session_service.create_session(app_name="bench", user_id="u")
+    message = types.Content(role="user", parts=[types.Part(text="audio: cancel me")])
+
+    async def consume():
+        async for _ in runner.run_async(user_id="u", session_id=s.id, new_message=message):
+            pass
+
+    task = asyncio.create_task(consume())
+    await asyncio.sleep(0.5)
+    print(f"running tools before cancel: {agent.SESSION_TASKS.running()}")
+    agent.cancel_session_tools(s.id)
+    try:
+        await task
+    except asyncio.CancelledError:
+        pass
+    await asyncio.sleep(0.1)
+    print(f"operations cancelled: {FakeOperation.cancelled}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--slow-sessions", type=int, default=10)
+    parser.add_argument("--fast-sessions", type=int, default=40)
+    parser.add_argument("--tts-seconds", type=float, default=3.0)
+    args = parser.parse_args()
+    install_fakes(args.tts_seconds)
+
+    tools = {
+        "sync tool": FunctionTool(func=agent.generate_audio_from_text),
+        "async tool": agent.TextToSpeechTool,
+    }
+    print(f"{args.slow_sessions} sessions synthesizing {args.tts_seconds:.0f}s audio + {args.fast_sessions} quick sessions")
+    for run_id, (label, tool) in enumerate(tools.items()):
+        fast_times, fast_done, total = asyncio.run(workload(tool, args.slow_sessions, args.fast_sessions, run_id))
+        print(f"{label:<11} quick sessions: median {statistics.median(fast_times) * 1000:8.1f} ms, "
+              f"max {max(fast_times) * 1000:8.1f} ms, all done at {fast_done:5.2f}s; everything done at {total:5.2f}s")
+
+    asyncio.run(cancellation_check(agent.TextToSpeechTool))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# Write / query benchmark for FluencyStore at district scale.
+#
+#   python benchmarks/bench_fluency_store.py [--assessments 300000] [--classes 400]
+#
+# Fills a fresh SQLite file with synthetic assessments spread over a school year and
+# times the three queries behind the reading-history tools.
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import FluencyStore  # noqa: E402
+
+VOCAB = (
+    "the a and of to in is was he she it they water plant sun rain cloud river tree farmer soil "
+    "seed grows every morning village school children read book story पानी पेड़ बादल बारिश नदी किसान"
+).split()
+
+
+def synthetic_report(rng):
+    total = rng.randint(40, 120)
+    skipped = rng.sample(VOCAB, rng.randint(0, 4))
+    mispronounced = [{"expected": w, "heard": w[:-1]} for w in rng.sample(VOCAB, rng.randint(0, 4))]
+    correct = total - len(skipped) - len(mispronounced)
+    return {
+        "objective_metrics": {
+            "accuracy_percent": round(correct / total * 100, 1), "words_per_minute": rng.randint(30, 140),
+            "correct_words": correct, "total_words": total, "audio_duration_seconds": rng.uniform(20, 120),
+        },
+        "error_analysis": {"mispronounced": mispronounced, "skipped": skipped, "added": []},
+        "prosody": {"words_correct_per_minute": rng.randint(20, 130)},
+    }
+
+
+def timed(label, fn, repeat=20):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    print(f"{label:<36} {(time.perf_counter() - started) / repeat * 1000:8.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--assessments", type=int, default=300_000)
+    parser.add_argument("--classes", type=int, default=400)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    path = os.path.join(tempfile.mkdtemp(), "fluency.sqlite3")
+    store = FluencyStore(path)
+    passages = [" ".join(rng.choices(VOCAB, k=60)) for _ in range(50)]
+    year_start = time.time() - 300 * 24 * 3600
+
+    started = time.perf_counter()
+    for n in range(args.assessments):
+        class_id = f"class-{n % args.classes}"
+        student_id = f"{class_id}-student-{rng.randrange(35)}"
+        store.record(synthetic_report(rng), student_id, class_id, rng.choice(passages), "en-IN",
+                     assessed_at=year_start + n * 300 * 24 * 3600 / args.assessments)
+    elapsed = time.perf_counter() - started
+    print(f"inserted {args.assessments} assessments in {elapsed:.1f}s ({args.assessments / elapsed:,.0f}/s), "
+          f"{os.path.getsize(path) / 1e6:.1f} MB on disk")
+
+    term_start = time.time() - 90 * 24 * 3600
+    timed("progress (one student, full year)", lambda: store.progress("class-7-student-3"))
+    timed("class percentiles (one term)", lambda: store.class_percentiles("class-7", since=term_start))
+    timed("most missed words (class, term)", lambda: store.most_missed_words(class_id="class-7", since=term_start))
+    timed("most missed words (district, term)", lambda: store.most_missed_words(since=term_start), repeat=3)
+
+
+if __name__ == "__main__":
+    main()
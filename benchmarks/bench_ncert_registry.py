@@ -0,0 +1,96 @@
+# Prompt-size / setup-latency comparison for NCERT search tools as the catalogue grows:
+# one tool per book (the old layout, as grounding tools or as function declarations)
+# versus the manifest registry's single search_ncert_textbooks declaration.
+#
+#   python benchmarks/bench_ncert_registry.py [--books 6 24 96]
+#
+# Token counts are estimated as serialized characters / 4; per-turn cost is the time to
+# serialize the tool list, which the client does on every model call.
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.adk.tools import FunctionTool, VertexAiSearchTool  # noqa: E402
+from google.genai import types  # noqa: E402
+
+from agent import NcertDataStoreRegistry, NcertLibrary, NcertSearchTool  # noqa: E402
+
+SUBJECTS = ["hindi", "english", "maths", "evs", "science", "social-science", "sanskrit", "urdu"]
+
+
+def manifest_for(count):
+    books = [{"class": n // len(SUBJECTS) + 1, "subject": SUBJECTS[n % len(SUBJECTS)],
+              "data_store": f"class-{n // len(SUBJECTS) + 1}-subject-{SUBJECTS[n % len(SUBJECTS)]}"} for n in range(count)]
+    path = os.path.join(tempfile.mkdtemp(), "manifest.json")
+    with open(path, "w") as f:
+        json.dump({"project": "123456789012", "location": "global", "collection": "default_collection", "books": books}, f)
+    return path
+
+
+def per_book_function(book):
+    def search(query: str) -> str:
+        return ""
+    search.__name__ = f"search_{book['data_store'].replace('-', '_')}"
+    search.__doc__ = f"""
+    Searches the NCERT class {book['class']} {book['subject']} textbook.
+
+    Args:
+        query: What to look for in the book.
+
+    Returns:
+        The most relevant passages.
+    """
+    return search
+
+
+def tools_payload(tools):
+    return types.GenerateContentConfig(tools=tools).model_dump_json(exclude_none=True)
+
+
+def measure(label, build, extra_instruction=""):
+    started = time.perf_counter()
+    tools = build()
+    setup_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    for _ in range(50):
+        payload = tools_payload(tools)
+    turn_ms = (time.perf_counter() - started) / 50 * 1000
+    tokens = (len(payload) + len(extra_instruction)) // 4
+    print(f"  {label:<32}{tokens:>10,}{setup_ms:>12.2f}{turn_ms:>12.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, nargs="+", default=[6, 24, 96])
+    args = parser.parse_args()
+
+    for count in args.books:
+        manifest = manifest_for(count)
+        with open(manifest) as f:
+            books = json.load(f)["books"]
+        print(f"{count} books{'':<27}{'~tokens':>10}{'setup ms':>12}{'turn ms':>12}")
+        registry = NcertDataStoreRegistry(manifest, NcertLibrary(tempfile.mkdtemp()))
+        measure(
+            "per-book grounding tools",
+            lambda: [types.Tool(retrieval=types.Retrieval(vertex_ai_search=types.VertexAISearch(datastore=t.data_store_id)))
+                     for t in [VertexAiSearchTool(data_store_id=d) for d in registry.books.values()]],
+        )
+        measure(
+            "per-book function declarations",
+            lambda: [types.Tool(function_declarations=[FunctionTool(func=per_book_function(b))._get_declaration() for b in books])],
+        )
+        measure(
+            "registry dispatch tool",
+            lambda: [types.Tool(function_declarations=[NcertSearchTool._get_declaration()])],
+            extra_instruction=NcertDataStoreRegistry(manifest, NcertLibrary(tempfile.mkdtemp())).describe(),
+        )
+
+
+if __name__ == "__main__":
+    main()
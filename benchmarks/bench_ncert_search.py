@@ -0,0 +1,72 @@
+# Latency benchmark for the local NCERT index: single-book search and a parallel
+# fan-out over several books, on synthetic textbooks built in a temporary directory.
+#
+#   python benchmarks/bench_ncert_search.py [--books 6] [--words 60000] [--queries 200]
+
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import NcertBookIndex, NcertDataStoreRegistry, NcertLibrary  # noqa: E402
+
+VOCAB = (
+    "पानी पेड़ बादल बारिश नदी किसान मिट्टी बीज सूरज गाँव स्कूल बच्चे किताब कहानी फल सब्ज़ी "
+    "water plant sun rain cloud river tree farmer soil seed shape circle square triangle number "
+    "add subtract count money time clock animal bird fish family friend festival market"
+).split()
+
+
+def synthetic_book(rng, words):
+    # Zipf-like word frequencies, like real text.
+    weights = [1 / (rank + 1) for rank in range(len(VOCAB))]
+    order = VOCAB[:]
+    rng.shuffle(order)
+    chapter_words = words // 10
+    return [(f"Chapter {n + 1}", " ".join(rng.choices(order, weights, k=chapter_words))) for n in range(10)]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--books", type=int, default=6)
+    parser.add_argument("--words", type=int, default=60_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    root = tempfile.mkdtemp()
+    book_ids = [f"class-{n // 3 + 1}-subject-{('hindi', 'english', 'maths')[n % 3]}" for n in range(args.books)]
+    started = time.perf_counter()
+    passages = sum(NcertBookIndex.build(b, synthetic_book(rng, args.words), os.path.join(root, b)) for b in book_ids)
+    print(f"built {args.books} books ({passages} passages) in {time.perf_counter() - started:.1f}s")
+
+    manifest = os.path.join(root, "manifest.json")
+    with open(manifest, "w") as f:
+        json.dump({"project": "bench", "location": "global", "collection": "default_collection", "books": [
+            {"class": int(b.split("-")[1]), "subject": b.split("-")[3], "data_store": b} for b in book_ids]}, f)
+    registry = NcertDataStoreRegistry(manifest, NcertLibrary(root))
+    queries = [" ".join(rng.sample(VOCAB, 3)) for _ in range(args.queries)]
+    registry.search(book_ids, queries[0], backend="local")  # open the indexes
+
+    for label, books in (("single book", book_ids[:1]), (f"fan-out x{len(book_ids)}", book_ids)):
+        timings = []
+        for query in queries:
+            t = time.perf_counter()
+            registry.search(books, query, backend="local")
+            timings.append((time.perf_counter() - t) * 1000)
+        print(f"{label:<14} p50 {statistics.median(timings):6.2f} ms   p95 {percentile(timings, 0.95):6.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
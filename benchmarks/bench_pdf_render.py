@@ -0,0 +1,124 @@
+# Throughput benchmark: WorksheetRenderer vs. the original per-call PDF builder.
+#
+#   python benchmarks/bench_pdf_render.py [--docs 50]
+#
+# Both paths render the same worksheet into memory; uploads are not included.
+
+import argparse
+import io
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import WORKSHEET_RENDERER  # noqa: E402
+
+SAMPLE_WORKSHEET = """**Worksheet: The Water Cycle**
+Name: _________________________
+Date: __________________________
+
+**Activity 1: Fill in the Blanks**
+*Use the words from the word box.*
++------------------------------------------+
+| evaporation  condensation  precipitation |
++------------------------------------------+
+1. Water turns into vapour by ____________________.
+2. Vapour cools and forms clouds by ____________________.
+3. Rain, snow and hail are kinds of ____________________.
+
+**Activity 2: Draw**
+*Draw the water cycle and label each step.*
+Draw it in the box below!
+
+**Activity 3: Short Answers**
+*Answer in one or two sentences.*
+""" + "\n".join(f"{i}. Why is **step {i}** important for plants and animals? ____________________" for i in range(1, 41))
+
+
+def legacy_render(worksheet_text):
+    """The pre-WorksheetRenderer implementation of generate_pdf_from_text, minus the upload."""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, HRFlowable
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+
+    pdf_buffer = io.BytesIO()
+    doc = SimpleDocTemplate(pdf_buffer, pagesize=letter,
+                            rightMargin=0.75*inch, leftMargin=0.75*inch,
+                            topMargin=0.75*inch, bottomMargin=0.75*inch)
+    styles = getSampleStyleSheet()
+    styles.add(ParagraphStyle(name='TitleStyle', fontName='Helvetica-Bold', fontSize=18, leading=22, spaceAfter=14, textColor=colors.HexColor("#4A90E2"), alignment=1))
+    styles.add(ParagraphStyle(name='ActivityTitle', fontName='Helvetica-Bold', fontSize=14, leading=18, spaceBefore=12, spaceAfter=6, textColor=colors.HexColor("#333333")))
+    styles.add(ParagraphStyle(name='InstructionStyle', fontName='Helvetica-Oblique', fontSize=10, leading=12, spaceAfter=6, textColor=colors.darkgray))
+    styles.add(ParagraphStyle(name='BodyStyle', fontName='Helvetica', fontSize=11, leading=14, spaceAfter=6, wordWrap='CJK'))
+    styles.add(ParagraphStyle(name='HeaderStyle', fontName='Helvetica', fontSize=11, leading=14, spaceAfter=0))
+    styles.add(ParagraphStyle(name='MonospaceStyle', fontName='Courier', fontSize=10, leading=12, spaceAfter=6, textColor=colors.darkgrey))
+
+    story = []
+
+    def format_bold(text):
+        parts = text.split('**')
+        result = []
+        for i, part in enumerate(parts):
+            result.append(f"<b>{part}</b>" if i % 2 == 1 else part)
+        return "".join(result)
+
+    for line in worksheet_text.strip().split('\n'):
+        line_content = format_bold(line)
+        if line.strip().startswith('+--'):
+            story.append(Paragraph(line_content, styles['MonospaceStyle']))
+        elif line.strip().startswith('**Activity'):
+            story.append(HRFlowable(width="100%", thickness=1, color=colors.lightgrey, spaceAfter=5))
+            story.append(Paragraph(line_content, styles['ActivityTitle']))
+        elif line.strip().startswith('**'):
+            story.append(Paragraph(line_content, styles['TitleStyle']))
+        elif "Name:" in line or "Date:" in line:
+            story.append(Paragraph(line_content, styles['HeaderStyle']))
+            if "Date:" in line: story.append(Spacer(1, 0.25*inch))
+        elif line.strip().startswith('*'):
+            story.append(Paragraph(line_content.replace('*','<i>',1).replace('*','</i>',1), styles['InstructionStyle']))
+        elif "Draw it in the box below!" in line:
+            story.append(Paragraph(line_content, styles['InstructionStyle']))
+            story.append(Spacer(1, 0.2*inch))
+            story.append(HRFlowable(width="80%", thickness=1, color=colors.black, hAlign='CENTER'))
+            story.append(Spacer(1, 2.5*inch))
+            story.append(HRFlowable(width="80%", thickness=1, color=colors.black, hAlign='CENTER'))
+        elif not line.strip():
+            story.append(Spacer(1, 0.1*inch))
+        else:
+            story.append(Paragraph(line_content, styles['BodyStyle']))
+
+    doc.build(story)
+    return pdf_buffer.getvalue()
+
+
+def count_pages(pdf_bytes):
+    return len(re.findall(rb"/Type\s*/Page\b", pdf_bytes))
+
+
+def measure(label, render, docs):
+    render(SAMPLE_WORKSHEET)  # warm-up: imports and font metrics
+    pages = 0
+    started = time.perf_counter()
+    for _ in range(docs):
+        pages += count_pages(render(SAMPLE_WORKSHEET))
+    elapsed = time.perf_counter() - started
+    print(f"{label:<20} {docs} docs, {pages} pages in {elapsed:.2f}s -> {pages / elapsed:.1f} pages/s, {elapsed / docs * 1000:.1f} ms/doc")
+    return pages / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--docs", type=int, default=50)
+    args = parser.parse_args()
+
+    legacy = measure("legacy", legacy_render, args.docs)
+    renderer = measure("WorksheetRenderer", WORKSHEET_RENDERER.render, args.docs)
+    print(f"speed-up: {renderer / legacy:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
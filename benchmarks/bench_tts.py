@@ -0,0 +1,98 @@
+# Time-to-first-audio for generate_audio_from_text: one synthesize_speech call per story
+# vs. sentence chunks synthesized in parallel with the first chunk published early.
+#
+#   python benchmarks/bench_tts.py [--sentences 40] [--seconds-per-kb 1.5]
+#
+# The synchronous TTS client is faked: each request takes 0.25 s plus --seconds-per-kb
+# per KB of UTF-8 text and returns a LINEAR16 WAV whose length is proportional to the
+# text. Artifacts go to the local filesystem store. The joined WAV is checked against
+# the chunks (duration and PCM bytes) to show nothing was re-encoded.
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import wave
+from types import SimpleNamespace
+
+os.environ.setdefault("SAHAYAK_CACHE_DIR", tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import agent  # noqa: E402
+
+HINDI_SENTENCES = [
+    "एक छोटे से गाँव में रामू नाम का एक किसान रहता था।",
+    "उसके खेत की मिट्टी काली और उपजाऊ थी, इसलिए उसमें कपास अच्छी उगती थी।",
+    "डॉ. शर्मा ने बच्चों को बताया कि बलुई मिट्टी में पानी जल्दी बह जाता है!",
+    "क्या तुम जानते हो कि चिकनी मिट्टी पानी को देर तक रोक कर रखती है?",
+    "Ramu smiled and said, \"Every soil has its own story.\"",
+]
+
+
+class FakeTextToSpeech:
+    """synthesize_speech stand-in: latency and audio length grow with the text."""
+
+    def __init__(self, seconds_per_kb):
+        self.seconds_per_kb = seconds_per_kb
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def synthesize_speech(self, input, voice, audio_config):
+        size = len(input.text.encode("utf-8"))
+        with self._lock:
+            self.requests += 1
+        time.sleep(0.25 + size / 1024 * self.seconds_per_kb)
+        frames = int(audio_config.sample_rate_hertz * size / 40)  # ~40 bytes of text per second of speech
+        pcm = bytes(range(256)) * (frames * 2 // 256) + bytes(frames * 2 % 256)
+        return SimpleNamespace(audio_content=agent.wav_header(audio_config.sample_rate_hertz, 1, 16, len(pcm)) + pcm)
+
+
+def timed_call(text):
+    started = time.perf_counter()
+    reply = agent.generate_audio_from_text(text, "hi-IN", "hi-IN-Chirp3-HD-Callirrhoe", "LINEAR16")
+    first_audio = time.perf_counter() - started
+    urls = agent.URL_PATTERN.findall(reply)
+    full_path = urls[-1][len("file://"):]
+    while not os.path.exists(full_path):
+        time.sleep(0.01)
+    return first_audio, time.perf_counter() - started, urls, full_path
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=40)
+    parser.add_argument("--seconds-per-kb", type=float, default=1.5)
+    args = parser.parse_args()
+
+    story = " ".join((HINDI_SENTENCES * args.sentences)[:args.sentences])
+    chunks = agent.chunk_for_tts(story)
+    print(f"Story: {args.sentences} sentences, {len(story.encode('utf-8'))} bytes -> {len(chunks)} chunks "
+          f"(first {len(chunks[0].encode('utf-8'))} B, largest {max(len(c.encode('utf-8')) for c in chunks)} B)")
+    print(f"  sentence split sample: {agent.split_sentences(' '.join(HINDI_SENTENCES))[:3]}")
+
+    tts = FakeTextToSpeech(args.seconds_per_kb)
+    agent.CLIENTS.override("tts", tts)
+    agent.CLIENTS.override("artifact_store", agent.LocalArtifactStore(tempfile.mkdtemp()))
+
+    # Baseline: the whole story as sequential synthesize_speech requests, no early chunk.
+    agent.TTS_MAX_IN_FLIGHT, agent.TTS_EARLY_FIRST_CHUNK = 1, False
+    _, serial_total, _, _ = timed_call(story + " (serial)")
+    agent.TTS_MAX_IN_FLIGHT, agent.TTS_EARLY_FIRST_CHUNK = 8, True
+    first, total, urls, full_path = timed_call(story)
+
+    short = HINDI_SENTENCES[0] + " " + HINDI_SENTENCES[1]
+    short_first, _, _, _ = timed_call(short)
+
+    with wave.open(full_path, "rb") as joined:
+        joined_seconds = joined.getnframes() / joined.getframerate()
+    expected = sum(int(24000 * len(c.encode("utf-8")) / 40) for c in chunks) / 24000 + (len(chunks) - 1) * agent.TTS_CHUNK_GAP_MS / 1000
+    print(f"  sequential chunks      : first audio {serial_total:6.2f}s, complete {serial_total:6.2f}s")
+    print(f"  parallel + early chunk : first audio {first:6.2f}s, complete {total:6.2f}s ({len(urls)} links)")
+    print(f"  short text (1 request) : {short_first:6.2f}s")
+    print(f"  joined WAV: {joined_seconds:.2f}s of audio, expected {expected:.2f}s; fake TTS requests: {tts.requests}")
+
+
+if __name__ == "__main__":
+    main()
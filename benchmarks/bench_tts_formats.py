@@ -0,0 +1,120 @@
+# File size, transcoding CPU and end-to-end latency of generate_audio_from_text for each
+# output format (LINEAR16 WAV, MP3, OGG_OPUS) on both synthesis paths.
+#
+#   python benchmarks/bench_tts_formats.py [--sentences 40] [--long-minutes 5]
+#
+# Needs ffmpeg (on PATH, SAHAYAK_FFMPEG, or `pip install imageio-ffmpeg`). Google TTS is
+# faked with a speech-like synthetic signal (a gliding harmonic "voice" with syllable
+# envelopes and pauses):
+# - sync path: synthesize_speech returns audio in the requested encoding (the fake server
+#   encodes with its own ffmpeg instance, so that CPU is not counted as ours), for a
+#   sentence-chunked Hindi story;
+# - long path: the long-audio operation writes a --long-minutes WAV into a local stand-in
+#   bucket, which the tool then streams through ffmpeg.
+
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("SAHAYAK_CACHE_DIR", tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+import agent  # noqa: E402
+from bench_tts import HINDI_SENTENCES  # noqa: E402
+
+RATE = agent.TTS_SAMPLE_RATE_HERTZ
+SERVER_ENCODER = agent.AudioTranscoder()
+
+
+def speech_like_wav(seconds, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * RATE)) / RATE
+    pitch = 170 + 40 * np.sin(2 * np.pi * 0.7 * t) + 15 * np.sin(2 * np.pi * 3.1 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / RATE
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    syllables = np.clip(np.sin(2 * np.pi * 4 * t), 0, None) ** 0.5 * (np.sin(2 * np.pi * 0.25 * t) > -0.7)
+    signal = voice * syllables + 0.02 * rng.standard_normal(t.size)
+    pcm = (signal / np.abs(signal).max() * 12000).astype("<i2").tobytes()
+    return agent.wav_header(RATE, 1, 16, len(pcm)) + pcm
+
+
+class FakeTextToSpeech:
+    def synthesize_speech(self, input, voice, audio_config):
+        time.sleep(0.25)
+        wav = speech_like_wav(len(input.text.encode("utf-8")) / 40)  # ~40 bytes of text per second
+        encoding = agent._lazy_import("google.cloud.texttospeech").AudioEncoding(audio_config.audio_encoding).name
+        if encoding == "LINEAR16":
+            return SimpleNamespace(audio_content=wav)
+        return SimpleNamespace(audio_content=SERVER_ENCODER.transcode(io.BytesIO(wav), encoding)[0])
+
+
+class LocalBucket:
+    def __init__(self, root):
+        self.root = root
+
+    def blob(self, name):
+        path = os.path.join(self.root, name)
+        return SimpleNamespace(exists=lambda: os.path.exists(path), open=lambda mode: open(path, mode))
+
+
+class FakeLongAudio:
+    def __init__(self, root, seconds):
+        self.root, self.seconds = root, seconds
+
+    def synthesize_long_audio(self, request):
+        path = os.path.join(self.root, request.output_gcs_uri.rsplit("/", 1)[1])
+        with open(path, "wb") as f:
+            f.write(speech_like_wav(self.seconds))
+        return SimpleNamespace(result=lambda timeout=None: None, done=lambda: True)
+
+
+def run(text, audio_format):
+    cpu_before = agent.AUDIO_TRANSCODER.cpu_seconds
+    started = time.perf_counter()
+    reply = agent.generate_audio_from_text(text, "mr-IN", "mr-IN-Chirp3-HD-Callirrhoe", audio_format)
+    url = agent.URL_PATTERN.findall(reply)[-1]
+    agent.ARTIFACT_UPLOADS.wait([url])
+    elapsed = time.perf_counter() - started
+    path = url[len("file://"):] if url.startswith("file://") else os.path.join(BUCKET_DIR, url.rsplit("/", 1)[1])
+    return os.path.getsize(path), agent.AUDIO_TRANSCODER.cpu_seconds - cpu_before, elapsed
+
+
+def main():
+    global BUCKET_DIR
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=40)
+    parser.add_argument("--long-minutes", type=float, default=5)
+    args = parser.parse_args()
+
+    BUCKET_DIR = tempfile.mkdtemp()
+    agent.CLIENTS.override("artifact_store", agent.LocalArtifactStore(tempfile.mkdtemp()))
+    agent.CLIENTS.override("tts", FakeTextToSpeech())
+    agent.CLIENTS.override("tts_long", FakeLongAudio(BUCKET_DIR, args.long_minutes * 60))
+    agent.CLIENTS.override("storage", SimpleNamespace(bucket=lambda name: LocalBucket(BUCKET_DIR)))
+    agent.TTS_EARLY_FIRST_CHUNK = False  # measure until the complete file is readable
+    print(f"ffmpeg: {agent.AUDIO_TRANSCODER.binary()}")
+
+    story = " ".join((HINDI_SENTENCES * args.sentences)[:args.sentences])
+    print(f"sync path: {args.sentences}-sentence story ({len(story.encode('utf-8'))} bytes, "
+          f"{len(agent.chunk_for_tts(story))} chunks, ~{len(story.encode('utf-8')) / 40:.0f}s of audio)")
+    for audio_format in agent.AUDIO_FORMATS:
+        size, cpu, elapsed = run(f"{story} [{audio_format}]", audio_format)
+        print(f"  {audio_format:<9} {size / 1024:8.1f} KiB  transcode CPU {cpu * 1000:6.0f} ms  end-to-end {elapsed:5.2f}s")
+
+    agent.TTS_MODE = "long_audio"
+    print(f"long-audio path: {args.long_minutes:g}-minute story")
+    long_story = f"{story} (long)"
+    for audio_format in agent.AUDIO_FORMATS:
+        size, cpu, elapsed = run(long_story, audio_format)
+        print(f"  {audio_format:<9} {size / 1024:8.1f} KiB  transcode CPU {cpu * 1000:6.0f} ms  end-to-end {elapsed:5.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# Bytes saved and CPU cost of the visual-aid post-processing (1-bit PNG, preview, SVG).
+#
+#   python benchmarks/bench_visual_aid.py [--images 16] [--size 1024] [--image drawing.png ...]
+#
+# Without --image, synthetic stand-ins for Imagen output are drawn: an antialiased black
+# line drawing on a slightly noisy off-white RGB background, saved as PNG with the kind
+# of generation-parameter text chunk the model embeds. Pass real Imagen PNGs with --image
+# for representative numbers.
+
+import argparse
+import functools
+import io
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from PIL import Image, ImageDraw, PngImagePlugin  # noqa: E402
+
+from agent import VISUAL_AID_PREVIEW_PX, VISUAL_AID_PROCESSOR, get_cpu_pool  # noqa: E402
+from renderers import process_visual_aid  # noqa: E402
+
+
+def synthetic_drawing(size, seed):
+    rng = random.Random(seed)
+    image = Image.new("RGB", (size, size), (248, 246, 240))
+    draw = ImageDraw.Draw(image)
+    width = max(2, size // 200)
+    for _ in range(rng.randint(6, 12)):
+        x, y, r = rng.randrange(size), rng.randrange(size), rng.randrange(size // 20, size // 5)
+        draw.ellipse((x - r, y - r, x + r, y + r), outline=(20, 20, 24), width=width)
+    for _ in range(rng.randint(10, 20)):
+        draw.line([(rng.randrange(size), rng.randrange(size)) for _ in range(3)], fill=(15, 15, 15), width=width, joint="curve")
+    for _ in range(4):
+        draw.text((rng.randrange(size - 120), rng.randrange(size - 20)), "Evaporation", fill=(0, 0, 0))
+    # Render at 2x and downsample for antialiased edges, then add sensor-like noise.
+    pixels = np.asarray(image.resize((size * 2, size * 2)).resize((size, size), Image.Resampling.LANCZOS)).astype(np.int16)
+    pixels += np.random.default_rng(seed).integers(-3, 4, pixels.shape, dtype=np.int16)
+    image = Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+    info = PngImagePlugin.PngInfo()
+    info.add_text("parameters", f"model=imagen; seed={seed}; guidance=7.5; " + "x" * 600)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", pnginfo=info)
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--image", action="append", default=[])
+    args = parser.parse_args()
+
+    if args.image:
+        originals = [open(path, "rb").read() for path in args.image]
+    else:
+        originals = [synthetic_drawing(args.size, seed) for seed in range(args.images)]
+
+    results = [VISUAL_AID_PROCESSOR.process(data, svg=True)["stats"] for data in originals]
+    total = lambda field: sum(r.get(field, 0) for r in results)  # noqa: E731
+    print(f"{len(originals)} images ({results[0]['size'][0]}x{results[0]['size'][1]})")
+    print(f"  original PNG  : {total('original_bytes') / len(results) / 1024:8.1f} KiB/image")
+    for field in ("full", "preview", "svg"):
+        saved = 1 - total(f"{field}_bytes") / total("original_bytes")
+        print(f"  {field:<13} : {total(f'{field}_bytes') / len(results) / 1024:8.1f} KiB/image ({saved:.1%} smaller than the original)")
+    print(f"  CPU per image : median {statistics.median(r['cpu_ms'] for r in results):.0f} ms (1-bit + preview + SVG)")
+    bitonal_only = [VISUAL_AID_PROCESSOR.process(data)["stats"]["cpu_ms"] for data in originals]
+    print(f"                  median {statistics.median(bitonal_only):.0f} ms (1-bit + preview only)")
+
+    pool = get_cpu_pool()
+    worker = functools.partial(process_visual_aid, preview_px=VISUAL_AID_PREVIEW_PX)
+    list(pool.map(worker, originals[:1]))  # start the workers
+    started = time.perf_counter()
+    list(pool.map(worker, originals))
+    elapsed = time.perf_counter() - started
+    print(f"  CPU pool      : {len(originals)} images in {elapsed:.2f}s ({len(originals) / elapsed:.1f} images/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# Latency of a week's worth of diagrams: serial generate_visual_aid calls vs. one
+# generate_visual_aid_batch call.
+#
+#   python benchmarks/bench_visual_aid_batch.py [--prompts 6] [--variants 2] [--imagen-seconds 3-6]
+#
+# Imagen is faked with a model that sleeps a random time in --imagen-seconds per request
+# and returns synthetic drawings; artifacts go to the local filesystem store. A second
+# run with a low per-minute quota and an injected 429 shows the limiter and retry.
+
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("SAHAYAK_CACHE_DIR", tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google.genai import errors  # noqa: E402
+
+import agent  # noqa: E402
+from bench_visual_aid import synthetic_drawing  # noqa: E402
+
+TOPICS = ["the water cycle", "parts of a plant", "the solar system", "the human heart", "states of matter",
+          "a food chain in a pond", "the layers of the earth", "a simple electric circuit"]
+
+
+class FakeImagen:
+    def __init__(self, low, high, fail_first=0):
+        self.low, self.high = low, high
+        self.fail_first = fail_first
+        self.calls = 0
+        self.peak = self._active = 0
+        self._lock = threading.Lock()
+        self._images = [synthetic_drawing(512, seed) for seed in range(8)]
+        self.models = self  # stands in for genai.Client(...).models
+
+    def generate_images(self, model, prompt, config):
+        number_of_images = config.number_of_images
+        with self._lock:
+            self.calls += 1
+            if self.fail_first:
+                self.fail_first -= 1
+                raise errors.ClientError(429, {"error": {"code": 429, "message": "Quota exceeded (injected)", "status": "RESOURCE_EXHAUSTED"}})
+            self._active += 1
+            self.peak = max(self.peak, self._active)
+            rng = random.Random(prompt)
+        time.sleep(rng.uniform(self.low, self.high))
+        with self._lock:
+            self._active -= 1
+        # Trailing bytes after IEND make every prompt/variant a distinct object.
+        return SimpleNamespace(generated_images=[
+            SimpleNamespace(image=SimpleNamespace(image_bytes=self._images[(hash(prompt) + i) % 8] + f"{prompt}{i}".encode()))
+            for i in range(number_of_images)
+        ])
+
+
+def fresh_state(per_minute, max_in_flight):
+    agent.VISUAL_AID_CACHE = agent.ResultCache("bench_visual_aids", ttl_seconds=3600, max_entries=256, persist_dir="")
+    agent.IMAGEN_LIMITER = agent.RateLimiter(per_minute, max_in_flight)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prompts", type=int, default=6)
+    parser.add_argument("--variants", type=int, default=2)
+    parser.add_argument("--imagen-seconds", default="3-6")
+    args = parser.parse_args()
+    low, high = (float(x) for x in args.imagen_seconds.split("-"))
+    prompts = [f"a diagram of {topic}" for topic in (TOPICS * 4)[:args.prompts]]
+
+    agent.CLIENTS.override("artifact_store", agent.LocalArtifactStore(tempfile.mkdtemp()))
+    agent.get_cpu_pool().submit(agent.process_visual_aid, synthetic_drawing(256, 0), agent.VISUAL_AID_PREVIEW_PX).result()
+
+    fresh_state(600, 6)
+    agent.CLIENTS.override("imagen", FakeImagen(low, high))
+    started = time.perf_counter()
+    for prompt in prompts:
+        for variant in range(args.variants):
+            agent.generate_visual_aid(f"{prompt} (option {variant + 1})")
+    serial = time.perf_counter() - started
+
+    fresh_state(600, 6)
+    imagen = FakeImagen(low, high)
+    agent.CLIENTS.override("imagen", imagen)
+    started = time.perf_counter()
+    manifest = json.loads(agent.generate_visual_aid_batch(prompts, args.variants))
+    batch = time.perf_counter() - started
+    states = agent.ARTIFACT_UPLOADS.wait([u for item in manifest["gallery"] for urls in item["images"] for u in urls.values()])
+    readable = time.perf_counter() - started
+    images = sum(len(item["images"]) for item in manifest["gallery"])
+
+    print(f"{len(prompts)} prompts x {args.variants} variants, Imagen {low:g}-{high:g} s per request")
+    print(f"  serial single-image calls : {serial:6.2f}s")
+    print(f"  batch tool                : {batch:6.2f}s ({images} images, {imagen.calls} Imagen requests, peak {imagen.peak} in flight), "
+          f"all readable {readable:.2f}s, upload states {sorted(set(states.values()))}")
+    print(f"  gallery page              : {manifest['gallery_url']}")
+
+    fresh_state(6, 2)
+    imagen = FakeImagen(low / 3, high / 3, fail_first=1)
+    agent.CLIENTS.override("imagen", imagen)
+    started = time.perf_counter()
+    manifest = json.loads(agent.generate_visual_aid_batch(prompts[:4], 1))
+    errors = [item["error"] for item in manifest["gallery"] if item["error"]]
+    print(f"  quota 6/min, 2 in flight, first call 429: 4 prompts in {time.perf_counter() - started:.2f}s, "
+          f"peak {imagen.peak} in flight, errors {errors}, limiter {agent.IMAGEN_LIMITER.stats()}")
+
+
+if __name__ == "__main__":
+    main()
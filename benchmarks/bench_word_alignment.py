@@ -0,0 +1,123 @@
+# Accuracy / runtime benchmark: WordAligner vs. the previous difflib.SequenceMatcher path
+# used by assess_reading_fluency, on long synthetic Hindi and English reading passages.
+#
+#   python benchmarks/bench_word_alignment.py [--words 3000] [--error-rate 0.08]
+#
+# Each passage is "read" with known skips, insertions and near-miss mispronunciations,
+# so both aligners can be scored against the ground truth.
+
+import argparse
+import os
+import random
+import sys
+import time
+from difflib import SequenceMatcher
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import WordAligner, normalize_words  # noqa: E402
+
+ENGLISH_VOCAB = (
+    "the a and of to in is was he she it they water plant sun rain cloud river tree "
+    "farmer soil seed grows every morning village school children read book story the the"
+).split()
+HINDI_VOCAB = (
+    "और का की के में है था वह यह पानी पेड़ बादल बारिश नदी किसान मिट्टी बीज सूरज "
+    "गाँव स्कूल बच्चे किताब कहानी पढ़ते हैं और और का"
+).split()
+
+
+def mispronounce(word, rng):
+    """A near-miss: swap, drop or duplicate one character."""
+    if len(word) < 2:
+        return word + word
+    k = rng.randrange(len(word) - 1)
+    choice = rng.random()
+    if choice < 0.4:
+        return word[:k] + word[k + 1] + word[k] + word[k + 2:]
+    if choice < 0.7:
+        return word[:k] + word[k + 1:]
+    return word[:k + 1] + word[k] + word[k + 1:]
+
+
+def simulate_reading(vocab, length, error_rate, rng):
+    reference = [rng.choice(vocab) for _ in range(length)]
+    hypothesis = []
+    truth = {"correct": 0, "skipped": 0, "mispronounced": 0, "added": 0}
+    for word in reference:
+        roll = rng.random()
+        if roll < error_rate / 3:
+            truth["skipped"] += 1
+            continue
+        if roll < 2 * error_rate / 3:
+            variant = mispronounce(word, rng)
+            if variant != word:
+                hypothesis.append(variant)
+                truth["mispronounced"] += 1
+                continue
+        if roll < error_rate:
+            hypothesis.append(rng.choice(vocab))
+            truth["added"] += 1
+        hypothesis.append(word)
+        truth["correct"] += 1
+    return reference, hypothesis, truth
+
+
+def summarize(opcodes):
+    counts = {"correct": 0, "skipped": 0, "mispronounced": 0, "added": 0}
+    for tag, i1, i2, j1, j2 in opcodes:
+        if tag == "equal":
+            counts["correct"] += i2 - i1
+        elif tag == "replace":
+            counts["mispronounced"] += i2 - i1
+        elif tag == "delete":
+            counts["skipped"] += i2 - i1
+        elif tag == "insert":
+            counts["added"] += j2 - j1
+    return counts
+
+
+def sequence_matcher_opcodes(reference, hypothesis):
+    # What assess_reading_fluency used before WordAligner (autojunk on by default).
+    return SequenceMatcher(None, reference, hypothesis).get_opcodes()
+
+
+def sequence_matcher_no_junk_opcodes(reference, hypothesis):
+    return SequenceMatcher(None, reference, hypothesis, autojunk=False).get_opcodes()
+
+
+def run(label, vocab, args, rng):
+    reference, hypothesis, truth = simulate_reading(vocab, args.words, args.error_rate, rng)
+    reference = normalize_words(" ".join(reference))
+    hypothesis = normalize_words(" ".join(hypothesis))
+    print(f"\n{label}: {len(reference)} reference words, truth={truth}")
+    aligners = (
+        ("SequenceMatcher", sequence_matcher_opcodes),
+        ("SM autojunk=False", sequence_matcher_no_junk_opcodes),
+        ("WordAligner", WordAligner().align),
+    )
+    for name, align in aligners:
+        started = time.perf_counter()
+        counts = summarize(align(reference, hypothesis))
+        elapsed = time.perf_counter() - started
+        accuracy_error = abs(counts["correct"] - truth["correct"]) / len(reference) * 100
+        print(
+            f"  {name:<18} {elapsed * 1000:8.1f} ms  correct={counts['correct']:<5} "
+            f"accuracy error={accuracy_error:5.2f} pts  mispronounced={counts['mispronounced']:<4} "
+            f"skipped={counts['skipped']:<4} added={counts['added']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--words", type=int, default=3000)
+    parser.add_argument("--error-rate", type=float, default=0.08)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    rng = random.Random(args.seed)
+    run("English", ENGLISH_VOCAB, args, rng)
+    run("Hindi", HINDI_VOCAB, args, rng)
+
+
+if __name__ == "__main__":
+    main()
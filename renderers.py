@@ -0,0 +1,276 @@
+# Pure rendering for the CPU process pool: worksheet/plan PDFs and visual-aid images.
+#
+# Pool workers (forkserver/spawn) import the module that defines the function they run.
+# This one has no side effects on import (no clients, caches, agents or atexit hooks) and
+# imports reportlab, numpy and Pillow only inside the functions that use them, so a
+# worker starts quickly and agent.py can import it without slowing its own startup.
+
+import io
+import re
+import threading
+import time
+
+
+class VisualAidProcessor:
+    """
+    Post-processes generated line drawings for low-bandwidth delivery.
+
+    The image is converted to grayscale and thresholded at its Otsu level to a 1-bit
+    bitmap (ink vs. paper), which is saved as an optimized 1-bit PNG with no metadata.
+    The preview is the bitmap downscaled with antialiasing to 4 gray levels. The SVG
+    trace merges each row's ink runs with identical runs on the rows below into
+    rectangles and writes them as one path.
+    """
+
+    def __init__(self, preview_px=320):
+        self.preview_px = preview_px
+
+    def process(self, image_bytes, svg=False):
+        """Returns {"full", "preview", "svg" (or None), "stats"} for one encoded image."""
+        import numpy as np
+        from PIL import Image
+
+        started = time.process_time()
+        with Image.open(io.BytesIO(image_bytes)) as source:
+            gray = np.asarray(source.convert("L"))
+        ink = gray < self.otsu_threshold(gray)
+        paper = Image.fromarray(~ink)
+
+        preview = paper.convert("L")
+        preview.thumbnail((self.preview_px, self.preview_px), Image.Resampling.LANCZOS)
+        preview = preview.quantize(colors=4)
+        result = {
+            "full": self._png(paper),
+            "preview": self._png(preview),
+            "svg": self.to_svg(ink) if svg else None,
+        }
+        result["stats"] = {
+            "size": list(paper.size),
+            "original_bytes": len(image_bytes),
+            **{f"{name}_bytes": len(data) for name, data in result.items() if data is not None},
+            "cpu_ms": round((time.process_time() - started) * 1000, 1),
+        }
+        return result
+
+    @staticmethod
+    def otsu_threshold(gray):
+        """Gray level that best separates ink from paper (maximum between-class variance)."""
+        import numpy as np
+
+        hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+        levels = np.arange(256)
+        weight = np.cumsum(hist)
+        total = weight[-1]
+        mean = np.cumsum(hist * levels)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            variance = (mean[-1] * weight / total - mean) ** 2 / (weight * (total - weight))
+        variance = np.nan_to_num(variance[:-1])
+        # A blank or single-tone image has no split; fall back to mid-gray.
+        return int(np.argmax(variance)) + 1 if variance.any() else 128
+
+    @staticmethod
+    def to_svg(ink):
+        """Traces a boolean ink mask to an SVG of merged run rectangles."""
+        import numpy as np
+
+        height, width = ink.shape
+        padded = np.zeros((height, width + 2), dtype=np.int8)
+        padded[:, 1:-1] = ink
+        edges = np.diff(padded, axis=1)
+        starts_y, starts_x = np.nonzero(edges == 1)
+        ends_x = np.nonzero(edges == -1)[1]
+        rows = np.searchsorted(starts_y, np.arange(height + 1))
+        commands = []
+        open_runs = {}  # (x0, x1) -> first row
+        for y in range(height + 1):
+            runs = set(zip(starts_x[rows[y]:rows[y + 1]].tolist(), ends_x[rows[y]:rows[y + 1]].tolist())) if y < height else set()
+            for run in [run for run in open_runs if run not in runs]:
+                x0, x1 = run
+                top = open_runs.pop(run)
+                commands.append(f"M{x0} {top}h{x1 - x0}v{y - top}h{x0 - x1}z")
+            for run in runs:
+                open_runs.setdefault(run, y)
+        return (
+            f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" shape-rendering="crispEdges">'
+            f'<rect width="100%" height="100%" fill="#fff"/><path d="{"".join(commands)}"/></svg>'
+        ).encode("ascii")
+
+    @staticmethod
+    def _png(image):
+        # Saving a fresh image writes no text/EXIF/ICC chunks; optimize picks the best filter.
+        buffer = io.BytesIO()
+        image.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+
+
+class WorksheetRenderer:
+    """
+    Turns our internal worksheet markdown into a styled PDF. The stylesheet is built once
+    per process; each line is classified by a single precompiled grammar and mapped to
+    flowables. Lesson plans and game plans (`generate_plan_pdf`) use the same engine with
+    `kind=...`, adding headings and bullets and their own accent colour.
+    """
+
+    # Worksheets: the first alternative that matches the stripped line wins, in the same
+    # order as the original if/elif chain.
+    WORKSHEET_GRAMMAR = re.compile(
+        r"""
+          (?P<blank>$)
+        | (?P<word_box>\+--.*)
+        | (?P<activity>\*\*Activity.*)
+        | (?P<title>\*\*.*)
+        | (?P<name_date>(?=.*(?:Name|Date):).*)
+        | (?P<instruction>\*.*)
+        | (?P<drawing_box>(?=.*Draw\ it\ in\ the\ box\ below!).*)
+        | (?P<body>.*)
+        """,
+        re.VERBOSE,
+    )
+    # Lesson and game plans are model-written markdown, so they also get '#' headings
+    # and '* ' / '- ' bullets (which the worksheet chain would render as instructions).
+    PLAN_GRAMMAR = re.compile(
+        r"""
+          (?P<blank>$)
+        | (?P<word_box>\+--.*)
+        | (?P<activity>\*\*Activity.*)
+        | (?P<heading>\#{1,6}\s+.*)
+        | (?P<title>\*\*.*)
+        | (?P<name_date>(?=.*(?:Name|Date):).*)
+        | (?P<bullet>[*-]\s+.*)
+        | (?P<instruction>\*.*)
+        | (?P<drawing_box>(?=.*Draw\ it\ in\ the\ box\ below!).*)
+        | (?P<body>.*)
+        """,
+        re.VERBOSE,
+    )
+    BOLD = re.compile(r"\*\*(.*?)(?:\*\*|$)")
+    LONG_RUN = re.compile(r"\S{40,}")
+    ITALIC = re.compile(r"\*(.*?)(?:\*|$)")
+    KINDS = ("worksheet", "lesson_plan", "game_plan")
+    # Title and section colour per plan kind; worksheets keep the original styles.
+    PLAN_ACCENTS = {"lesson_plan": "#2E7D32", "game_plan": "#C0392B"}
+
+    def __init__(self):
+        self._styles = None
+        self._lock = threading.Lock()
+
+    def styles(self):
+        """Builds the sample stylesheet plus our custom styles on first use."""
+        if self._styles is None:
+            with self._lock:
+                if self._styles is None:
+                    from reportlab.lib import colors
+                    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+                    styles = getSampleStyleSheet()
+                    styles.add(ParagraphStyle(name='TitleStyle', fontName='Helvetica-Bold', fontSize=18, leading=22, spaceAfter=14, textColor=colors.HexColor("#4A90E2"), alignment=1))
+                    styles.add(ParagraphStyle(name='ActivityTitle', fontName='Helvetica-Bold', fontSize=14, leading=18, spaceBefore=12, spaceAfter=6, textColor=colors.HexColor("#333333")))
+                    styles.add(ParagraphStyle(name='InstructionStyle', fontName='Helvetica-Oblique', fontSize=10, leading=12, spaceAfter=6, textColor=colors.darkgray))
+                    styles.add(ParagraphStyle(name='BodyStyle', fontName='Helvetica', fontSize=11, leading=14, spaceAfter=6, wordWrap='CJK'))
+                    styles.add(ParagraphStyle(name='HeaderStyle', fontName='Helvetica', fontSize=11, leading=14, spaceAfter=0))
+                    styles.add(ParagraphStyle(name='MonospaceStyle', fontName='Courier', fontSize=10, leading=12, spaceAfter=6, textColor=colors.darkgrey))
+                    # Word-level wrapping for ordinary lines; CJK (any-character) wrapping is
+                    # several times slower and is only needed for very long unbroken runs.
+                    styles.add(ParagraphStyle(name='BodyWordWrapStyle', parent=styles['BodyStyle'], wordWrap=None))
+                    styles.add(ParagraphStyle(name='BulletStyle', parent=styles['BodyWordWrapStyle'], leftIndent=18, bulletIndent=6))
+                    for kind, accent in self.PLAN_ACCENTS.items():
+                        styles.add(ParagraphStyle(name=f'{kind}.TitleStyle', parent=styles['TitleStyle'], textColor=colors.HexColor(accent)))
+                        styles.add(ParagraphStyle(name=f'{kind}.ActivityTitle', parent=styles['ActivityTitle'], textColor=colors.HexColor(accent)))
+                    self._styles = styles
+        return self._styles
+
+    def tokenize(self, text, kind="worksheet"):
+        """Returns a list of (token, line) pairs, one per input line."""
+        grammar = self.WORKSHEET_GRAMMAR if kind == "worksheet" else self.PLAN_GRAMMAR
+        tokens = []
+        seen_title = False
+        for line in text.strip().split("\n"):
+            token = grammar.match(line.strip()).lastgroup
+            if token in ("title", "heading"):
+                # Plans have one document title; later bold lines are section headings.
+                if kind != "worksheet" and seen_title:
+                    token = "section"
+                seen_title = True
+            tokens.append((token, line))
+        return tokens
+
+    def flowables(self, text, kind="worksheet"):
+        """Converts document text into ReportLab flowables."""
+        from reportlab.lib import colors
+        from reportlab.lib.units import inch
+        from reportlab.platypus import Paragraph, Spacer, HRFlowable
+
+        if kind not in self.KINDS:
+            raise ValueError(f"Unknown document kind '{kind}'. Expected one of {self.KINDS}.")
+        styles = self.styles()
+        prefix = f"{kind}." if kind in self.PLAN_ACCENTS else ""
+        rule_color = colors.HexColor(self.PLAN_ACCENTS[kind]) if prefix else colors.lightgrey
+        story = []
+        for token, line in self.tokenize(text, kind):
+            if token == "blank":
+                story.append(Spacer(1, 0.1*inch))
+                continue
+            content = self.BOLD.sub(r"<b>\1</b>", self._escape(line))
+            if token == "word_box":
+                story.append(Paragraph(content, styles['MonospaceStyle']))
+            elif token in ("activity", "section"):
+                story.append(HRFlowable(width="100%", thickness=1, color=rule_color, spaceAfter=5))
+                story.append(Paragraph(self._strip_heading(content), styles[prefix + 'ActivityTitle']))
+            elif token in ("title", "heading"):
+                story.append(Paragraph(self._strip_heading(content), styles[prefix + 'TitleStyle']))
+            elif token == "name_date":
+                story.append(Paragraph(content, styles['HeaderStyle']))
+                if "Date:" in line: story.append(Spacer(1, 0.25*inch))
+            elif token == "bullet":
+                item = content.strip()[1:].strip()
+                story.append(Paragraph(self.ITALIC.sub(r"<i>\1</i>", item), styles['BulletStyle'], bulletText="\u2022"))
+            elif token == "instruction":
+                story.append(Paragraph(self.ITALIC.sub(r"<i>\1</i>", content, count=1), styles['InstructionStyle']))
+            elif token == "drawing_box":
+                story.append(Paragraph(content, styles['InstructionStyle']))
+                story.append(Spacer(1, 0.2*inch))
+                story.append(HRFlowable(width="80%", thickness=1, color=colors.black, hAlign='CENTER'))
+                story.append(Spacer(1, 2.5*inch))
+                story.append(HRFlowable(width="80%", thickness=1, color=colors.black, hAlign='CENTER'))
+            elif self.LONG_RUN.search(line):
+                story.append(Paragraph(content, styles['BodyStyle']))
+            else:
+                story.append(Paragraph(content, styles['BodyWordWrapStyle']))
+        return story
+
+    def render(self, text, kind="worksheet"):
+        """Renders one document and returns the PDF bytes."""
+        from reportlab.lib.pagesizes import letter
+        from reportlab.lib.units import inch
+        from reportlab.platypus import SimpleDocTemplate
+
+        story = self.flowables(text, kind)
+        # Render into memory; the container's tmpfs is small and a crash would leak files.
+        pdf_buffer = io.BytesIO()
+        doc = SimpleDocTemplate(pdf_buffer, pagesize=letter,
+                                rightMargin=0.75*inch, leftMargin=0.75*inch,
+                                topMargin=0.75*inch, bottomMargin=0.75*inch)
+        doc.build(story)
+        return pdf_buffer.getvalue()
+
+    @staticmethod
+    def _escape(line):
+        # Paragraph text is XML-ish markup; a stray "<" (e.g. "5 < 7") would break the build.
+        return line.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+    @staticmethod
+    def _strip_heading(content):
+        return content.strip().lstrip("#").strip()
+
+
+def process_visual_aid(image_bytes, preview_px, svg=False):
+    """CPU-pool entry point for VisualAidProcessor.process."""
+    return VisualAidProcessor(preview_px).process(image_bytes, svg)
+
+
+_WORKER_RENDERER = WorksheetRenderer()
+
+
+def render_pdf(text, kind="worksheet"):
+    """CPU-pool entry point for WorksheetRenderer.render; each worker keeps its own cached stylesheet."""
+    return _WORKER_RENDERER.render(text, kind)
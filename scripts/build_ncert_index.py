@@ -0,0 +1,55 @@
+# Builds the local NCERT search index for one textbook.
+#
+#   python scripts/build_ncert_index.py --class 1 --subject hindi path/to/chapters/
+#
+# The input is a directory of UTF-8 .txt files, one per chapter (the file name, minus
+# its numeric prefix, becomes the chapter title), or a list of such files. The index is
+# written to $SAHAYAK_NCERT_INDEX_DIR/class-<n>-subject-<subject>/.
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import NCERT_INDEX_DIR, NcertBookIndex, ncert_book_id  # noqa: E402
+
+
+def chapter_files(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            yield from sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".txt"))
+        else:
+            yield path
+
+
+def chapter_title(path):
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return re.sub(r"^\d+[\s._-]*", "", stem).replace("_", " ").strip() or stem
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--class", dest="class_number", type=int, required=True)
+    parser.add_argument("--subject", required=True)
+    parser.add_argument("--index-dir", default=NCERT_INDEX_DIR)
+    parser.add_argument("paths", nargs="+")
+    args = parser.parse_args()
+
+    chapters = []
+    for path in chapter_files(args.paths):
+        with open(path, encoding="utf-8") as f:
+            chapters.append((chapter_title(path), f.read()))
+    if not chapters:
+        sys.exit("No .txt chapters found.")
+
+    book_id = ncert_book_id(args.class_number, args.subject)
+    started = time.perf_counter()
+    passages = NcertBookIndex.build(book_id, chapters, os.path.join(args.index_dir, book_id))
+    print(f"{book_id}: {len(chapters)} chapters, {passages} passages indexed in {time.perf_counter() - started:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+import os
+import sys
+import tempfile
+
+# Tests import agent.py the same way the benchmarks do, with caches in a scratch directory.
+os.environ.setdefault("SAHAYAK_CACHE_DIR", tempfile.mkdtemp())
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
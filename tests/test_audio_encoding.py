@@ -0,0 +1,53 @@
+import io
+import math
+import struct
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import agent
+
+RATE = agent.TTS_SAMPLE_RATE_HERTZ
+
+
+@pytest.fixture(scope="module")
+def ffmpeg():
+    try:
+        return agent.AUDIO_TRANSCODER.binary()
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+
+def tone_wav(seconds, hertz):
+    pcm = b"".join(struct.pack("<h", int(8000 * math.sin(2 * math.pi * hertz * i / RATE))) for i in range(int(seconds * RATE)))
+    return agent.wav_header(RATE, 1, 16, len(pcm)) + pcm
+
+
+def decoded_samples(ffmpeg, mp3):
+    command = [ffmpeg, "-loglevel", "error", "-i", "pipe:0", "-f", "s16le", "-ac", "1", "pipe:1"]
+    pcm = subprocess.run(command, input=mp3, capture_output=True, check=True).stdout
+    return struct.unpack(f"<{len(pcm) // 2}h", pcm)
+
+
+def test_joined_mp3_has_a_silent_gap_between_chunks(ffmpeg):
+    parts = [agent.AUDIO_TRANSCODER.transcode(io.BytesIO(tone_wav(0.5, hertz)), "MP3")[0] for hertz in (220, 330)]
+
+    plain = decoded_samples(ffmpeg, agent.join_mp3(parts))
+    gapped = decoded_samples(ffmpeg, agent.join_mp3(parts, 150))
+
+    # 24 kHz MPEG-2 frames hold 576 samples; 150 ms rounds to 6 of them.
+    assert len(gapped) - len(plain) == 6 * 576
+    first_part = len(decoded_samples(ffmpeg, parts[0]))
+    assert max(abs(sample) for sample in gapped[first_part:first_part + 6 * 576]) < 50
+
+
+def test_concurrent_transcodes_report_their_own_cpu_time(ffmpeg):
+    before = agent.AUDIO_TRANSCODER.cpu_seconds
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        results = list(pool.map(lambda hertz: agent.AUDIO_TRANSCODER.transcode(io.BytesIO(tone_wav(5, hertz)), "OGG_OPUS"), (200, 300, 400)))
+
+    cpu = [cpu_seconds for _, cpu_seconds in results]
+    assert all(seconds > 0 for seconds in cpu)
+    assert agent.AUDIO_TRANSCODER.cpu_seconds - before == pytest.approx(sum(cpu))
+    assert max(cpu) < 3 * min(cpu)
@@ -0,0 +1,56 @@
+import asyncio
+import datetime
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import agent
+
+PASSAGE = "the cat sat on the mat"
+
+
+class FakeOperation:
+    """A long_running_recognize operation that finishes `seconds` after it starts."""
+
+    def __init__(self, seconds):
+        self._done_at = time.monotonic() + seconds
+
+    def done(self):
+        return time.monotonic() >= self._done_at
+
+    def result(self, timeout=None):
+        words = [SimpleNamespace(word=w, start_time=datetime.timedelta(seconds=i * 0.5), end_time=datetime.timedelta(seconds=i * 0.5 + 0.4))
+                 for i, w in enumerate(PASSAGE.split())]
+        return SimpleNamespace(results=[SimpleNamespace(alternatives=[SimpleNamespace(transcript=PASSAGE, words=words)])])
+
+    def cancel(self):
+        pass
+
+
+def test_class_assessment_does_not_hold_a_tool_pool_thread(monkeypatch):
+    monkeypatch.setattr(agent, "_tool_pool", ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(agent, "_start_recognition", lambda uri, language_code: agent.RecognitionJob(uri, operation=FakeOperation(1.5)))
+    uris = [f"gs://recordings/class-assessment-{time.time_ns()}-{i}.wav" for i in range(4)]
+
+    async def assess_while_another_tool_runs():
+        assessment = asyncio.ensure_future(agent.ClassReadingFluencyTool.func(PASSAGE, ["a", "b", "c", "d"], uris, "en-IN", ""))
+        await asyncio.sleep(0.2)
+        other = await asyncio.wait_for(agent.run_in_tool_pool(lambda: "other tool"), timeout=1)
+        return other, assessment.done(), await assessment
+
+    other, assessment_done, reply = asyncio.run(assess_while_another_tool_runs())
+
+    assert other == "other tool" and not assessment_done
+    result = json.loads(reply)
+    assert result["class_summary"]["students_assessed"] == 4
+    assert result["class_summary"]["mean_accuracy_percent"] == 100.0
+
+
+def test_class_assessment_reports_recordings_that_time_out(monkeypatch):
+    monkeypatch.setattr(agent, "_start_recognition", lambda uri, language_code: agent.RecognitionJob(uri, operation=FakeOperation(60)))
+
+    outcomes = asyncio.run(agent._recognize_all_async(["gs://recordings/slow.wav"], "en-IN", timeout=0.3))
+
+    [(result, error)] = outcomes
+    assert result is None and isinstance(error, TimeoutError)
@@ -0,0 +1,104 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+from google.adk.agents import Agent
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+import agent
+
+ROUTES = ("NCERTKnowledgeBaseAgentRouter", "HyperLocalContentAgentRouter", "WorksheetGeneratorAgentRouter",
+          "ReadingAssessorAgentRouter", "InstantKnowledgeAgentRouter", "GameGeneratorAgentRouter",
+          "LessonPlannerAgentRouter", "VisualAidAgentRouter")
+
+
+class MockLlm(BaseLlm):
+    """Root: always transfers to `route_to`. Specialists: one text reply."""
+
+    model: str = "mock"
+    route_to: str = ""
+    calls: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False):
+        self.calls += 1
+        if self.route_to:
+            part = types.Part.from_function_call(name="transfer_to_agent", args={"agent_name": self.route_to})
+        else:
+            part = types.Part(text="Here you go.")
+        yield LlmResponse(content=types.Content(role="model", parts=[part]))
+
+
+def build_root(router, root_llm):
+    specialist_llm = MockLlm()
+    routes = []
+    for name in ROUTES:
+        route = getattr(agent, name)
+        specialist = route.sub_agents[0].model_copy(update={
+            "model": specialist_llm, "tools": [], "before_model_callback": None, "after_model_callback": None})
+        routes.append(agent.AgentRoute(name=route.name, description=route.description, sub_agents=[specialist]))
+    # Unflattened, every turn goes back through the root's routing call.
+    return Agent(name="Sahayak", model=root_llm, instruction="Route the request.",
+                 sub_agents=agent.build_agent_graph(routes, flatten=False),
+                 before_model_callback=router.before_model, after_model_callback=router.after_model)
+
+
+async def converse(messages):
+    router = agent.FastPathRouter(agent.FAST_ROUTER_RULES, mode="on", min_confidence=0.7)
+    root_llm = MockLlm(route_to="InstantKnowledgeAgentRouter")
+    runner = InMemoryRunner(agent=build_root(router, root_llm), app_name="test")
+    session = await runner.session_service.create_session(app_name="test", user_id="teacher")
+    turns = []
+    for text in messages:
+        calls_before = root_llm.calls
+        routed_to = None
+        message = types.Content(role="user", parts=[types.Part(text=text)])
+        async for event in runner.run_async(user_id="teacher", session_id=session.id, new_message=message):
+            if event.actions and event.actions.transfer_to_agent and routed_to is None:
+                routed_to = event.actions.transfer_to_agent
+        turns.append({"root_llm_calls": root_llm.calls - calls_before, "routed_to": routed_to})
+    return turns, router.stats()
+
+
+def test_obvious_first_turn_skips_the_root_llm():
+    turns, stats = asyncio.run(converse(["Make a game about fractions for class 4"]))
+
+    assert turns == [{"root_llm_calls": 0, "routed_to": "GameGeneratorAgentRouter"}]
+    assert stats["fast_path"] == 1
+
+
+def test_follow_up_turn_goes_to_the_root_llm():
+    # Pasted text that the keyword rules alone would confidently send to the game agent.
+    follow_up = "Can you shorten it? Here is the part I mean: 'Let us play a fun game: students form teams and race.'"
+    target, confidence, _ = agent.FastPathRouter(agent.FAST_ROUTER_RULES).classify(follow_up)
+    assert target == "GameGeneratorAgentRouter" and confidence >= 0.7
+
+    turns, stats = asyncio.run(converse(["Make a game about fractions for class 4", follow_up]))
+
+    assert turns[0] == {"root_llm_calls": 0, "routed_to": "GameGeneratorAgentRouter"}
+    assert turns[1] == {"root_llm_calls": 1, "routed_to": "InstantKnowledgeAgentRouter"}
+    assert stats["fast_path"] == 1
+    assert stats["deferred"] == 0
+
+
+def first_turn(invocation_id, text="Make a game about fractions for class 4"):
+    content = types.Content(role="user", parts=[types.Part(text=text)])
+    session = SimpleNamespace(events=[SimpleNamespace(author="user", content=content)])
+    return SimpleNamespace(session=session, invocation_id=invocation_id), LlmRequest(contents=[content])
+
+
+def test_guesses_for_model_calls_that_never_finish_do_not_accumulate(monkeypatch):
+    router = agent.FastPathRouter(agent.FAST_ROUTER_RULES, mode="shadow")
+    router._pending = agent.InvocationMap(max_entries=8, ttl_seconds=60)
+    for i in range(20):  # the model call raised or was cancelled, so after_model never ran
+        router.before_model(*first_turn(f"invocation-{i}"))
+
+    assert len(router._pending) == 8
+    assert router._pending.pop("invocation-0") is None
+
+    clock = time.monotonic() + 61
+    monkeypatch.setattr(agent.time, "monotonic", lambda: clock)
+    assert router._pending.pop("invocation-19") is None
@@ -0,0 +1,68 @@
+import time
+import wave
+
+import agent
+
+PASSAGE = "The little seed slept under the warm brown soil until the rain came and woke it up"
+SAMPLE_RATE = 16000
+
+
+def write_silent_wav(path, seconds):
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(bytes(2 * int(SAMPLE_RATE * seconds)))
+
+
+def reading_script(words, seconds_per_word=0.4, start=0.3):
+    return [(word, start + i * seconds_per_word, start + (i + 1) * seconds_per_word - 0.05) for i, word in enumerate(words)]
+
+
+def replay(tmp_path, spoken_words, realtime=False):
+    script = reading_script(spoken_words)
+    wav_path = tmp_path / "reading.wav"
+    write_silent_wav(wav_path, script[-1][2] + 0.5)
+    session = agent.LiveReadingSession(PASSAGE, "en-IN", SAMPLE_RATE, recognizer=agent.FakeStreamingRecognizer(script))
+    stopped = {}
+
+    def microphone():
+        yield from agent.iter_wav_chunks(str(wav_path), chunk_ms=100, realtime=realtime)
+        stopped["at"] = time.perf_counter()
+
+    snapshots = list(session.stream(microphone()))
+    return snapshots, time.perf_counter() - stopped["at"]
+
+
+def test_partial_metrics_advance_while_the_student_reads(tmp_path):
+    snapshots, _ = replay(tmp_path, PASSAGE.lower().split())
+
+    partial = snapshots[:-1]
+    assert len(partial) > 5
+    positions = [s["position"] for s in partial]
+    assert positions == sorted(positions)
+    assert 0 < positions[len(positions) // 2] < len(PASSAGE.split())
+    assert all("final_report" not in s for s in partial)
+    assert any(s["live_words_per_minute"] > 0 for s in partial)
+
+
+def test_final_report_is_ready_within_a_second_of_stopping(tmp_path):
+    snapshots, after_stop = replay(tmp_path, PASSAGE.lower().split(), realtime=True)
+
+    final = snapshots[-1]
+    assert after_stop < 1.0
+    assert final["position"] == len(PASSAGE.split())
+    assert final["running_accuracy_percent"] == 100.0
+    assert final["final_report"]["objective_metrics"]["accuracy_percent"] == 100.0
+
+
+def test_skipped_and_misread_words_are_counted(tmp_path):
+    spoken = PASSAGE.lower().split()
+    spoken[2] = "sead"  # misread
+    del spoken[6]  # skips "warm"
+    snapshots, _ = replay(tmp_path, spoken)
+
+    final = snapshots[-1]
+    assert final["errors_so_far"]["mispronounced"] == 1
+    assert final["errors_so_far"]["skipped"] == 1
+    assert final["final_report"]["objective_metrics"]["accuracy_percent"] < 100.0
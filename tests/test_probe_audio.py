@@ -0,0 +1,23 @@
+from types import SimpleNamespace
+
+import pytest
+
+import agent
+
+
+class FakeStorage:
+    def __init__(self, blob):
+        self._blob = blob
+
+    def bucket(self, name):
+        return SimpleNamespace(get_blob=lambda object_name: self._blob)
+
+
+def test_empty_recording_is_reported_without_a_download():
+    blob = SimpleNamespace(size=0, download_as_bytes=lambda **kwargs: pytest.fail("downloaded an empty object"))
+    agent.CLIENTS.override("storage", FakeStorage(blob))
+    try:
+        with pytest.raises(agent.AssessmentError, match="empty"):
+            agent.probe_audio("gs://recordings/silent.wav")
+    finally:
+        agent.CLIENTS.reset("storage")
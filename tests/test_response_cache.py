@@ -0,0 +1,78 @@
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models.llm_request import LlmRequest
+
+import agent
+
+
+@pytest.fixture
+def cache():
+    cache = agent.ResponseCache(["InstantKnowledgeAgent"], ttl_seconds=3600, min_similarity=agent.RESPONSE_CACHE_MIN_SIMILARITY)
+    cache.entries = agent.ResultCache("test_responses", ttl_seconds=3600, max_entries=64, persist_dir="")
+    return cache
+
+
+def remember(cache, text, answer):
+    cache._store(*cache.request_key("InstantKnowledgeAgent", "gemini", "instruction", text), answer)
+
+
+def lookup(cache, text):
+    return cache._lookup(*cache.request_key("InstantKnowledgeAgent", "gemini", "instruction", text))
+
+
+@pytest.mark.parametrize("cached, asked", [
+    ("convert celsius to fahrenheit", "convert fahrenheit to celsius"),
+    ("why does the moon go around the earth", "why does the earth go around the moon"),
+    ("5-day lesson plan on the water cycle", "3-day lesson plan on the water cycle"),
+    ("a quiz with ten questions on fractions", "a quiz with five questions on fractions"),
+    ("make a game about adding fractions", "make a game about subtracting fractions"),
+])
+def test_requests_that_differ_in_meaning_do_not_hit(cache, cached, asked):
+    remember(cache, cached, "cached answer")
+
+    assert lookup(cache, cached) == ("cached answer", "exact")
+    assert lookup(cache, asked) == (None, None)
+
+
+@pytest.mark.parametrize("cached, asked, kind", [
+    ("Explain why the sky is blue", "explain why is the sky blue?", "exact"),
+    ("Why do magnets attract iron?", "why does a magnet attract iron", "exact"),
+    ("Explain how plants make food", "Explain how do plants make their food", "exact"),
+    ("5-day lesson plan on the water cycle", "a 5 day lesson plan on the water cycle", "exact"),
+    ("make a game about multiplication tables", "make a game about multiplicaton tables", "semantic"),
+])
+def test_rephrasings_of_the_same_request(cache, cached, asked, kind):
+    remember(cache, cached, "cached answer")
+
+    answer, hit = lookup(cache, asked)
+    assert hit == kind
+    assert answer == ("cached answer" if kind else None)
+
+
+def first_turn(text):
+    content = agent.types.Content(role="user", parts=[agent.types.Part(text=text)])
+    session = SimpleNamespace(events=[SimpleNamespace(author="user", content=content)])
+    return SimpleNamespace(session=session, user_content=content, invocation_id="invocation")
+
+
+def test_requests_for_a_printable_copy_reach_the_model(cache):
+    remember(cache, "5-day lesson plan on the water cycle", "cached answer")
+    request = LlmRequest(model="gemini", config=agent.types.GenerateContentConfig(system_instruction="instruction"))
+
+    hit = cache._before_model("InstantKnowledgeAgent", first_turn("5-day lesson plan on the water cycle"), request)
+    assert hit.content.parts[0].text == "cached answer"
+    assert cache._before_model("InstantKnowledgeAgent", first_turn("5-day lesson plan on the water cycle as a PDF"), request) is None
+
+
+def test_misses_whose_model_call_never_finishes_do_not_accumulate(cache):
+    cache._pending = agent.InvocationMap(max_entries=8)
+    request = LlmRequest(model="gemini", config=agent.types.GenerateContentConfig(system_instruction="instruction"))
+    for i in range(20):  # the model call raised or was cancelled, so _after_model never ran
+        context = first_turn(f"why is the sky blue, question {i}")
+        context.invocation_id = f"invocation-{i}"
+        assert cache._before_model("InstantKnowledgeAgent", context, request) is None
+
+    assert len(cache._pending) == 8
+    assert cache._pending.pop("invocation-0") is None
+    assert cache._pending.pop("invocation-19") is not None
@@ -0,0 +1,128 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+
+import pytest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+import agent
+
+SENTENCE = "The little seed slept under the warm brown soil until the rain came and woke it up. "
+FAILING_SENTENCE = "This last sentence never comes back."
+SLOW_SENTENCE = "This sentence takes its time."
+
+
+class FakeTextToSpeech:
+    """
+    synthesize_speech stand-in. Chunks holding SLOW_SENTENCE or FAILING_SENTENCE wait for
+    `release`; the FAILING_SENTENCE chunk then fails.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def synthesize_speech(self, input, voice, audio_config):
+        if FAILING_SENTENCE in input.text or SLOW_SENTENCE in input.text:
+            self.release.wait(10)
+        if FAILING_SENTENCE in input.text:
+            raise RuntimeError("synthesis failed")
+        pcm = bytes(2 * audio_config.sample_rate_hertz // 10)
+        return SimpleNamespace(audio_content=agent.wav_header(audio_config.sample_rate_hertz, 1, 16, len(pcm)) + pcm)
+
+
+@pytest.fixture
+def tts(tmp_path, monkeypatch):
+    fake = FakeTextToSpeech()
+    agent.CLIENTS.override("tts", fake)
+    agent.CLIENTS.override("artifact_store", agent.LocalArtifactStore(str(tmp_path)))
+    monkeypatch.setattr(agent, "TTS_MODE", "auto")
+    yield fake
+    fake.release.set()
+    agent.CLIENTS.reset("tts")
+    agent.CLIENTS.reset("artifact_store")
+
+
+def story(label, sentences=30):
+    return f"{label}. " + SENTENCE * sentences
+
+
+def test_concurrent_stories_do_not_exhaust_a_small_tool_pool(tts, monkeypatch):
+    monkeypatch.setattr(agent, "_tool_pool", ThreadPoolExecutor(max_workers=2))
+    monkeypatch.setattr(agent, "TTS_EARLY_FIRST_CHUNK", False)
+
+    async def two_calls():
+        return await asyncio.gather(*(
+            agent.run_in_tool_pool(agent.generate_audio_from_text, story(f"Story {i}"), "en-IN", "en-IN-Wavenet-A", "LINEAR16")
+            for i in range(2)
+        ))
+
+    replies = asyncio.run(asyncio.wait_for(two_calls(), timeout=20))
+    for reply in replies:
+        assert agent.ARTIFACT_UPLOADS.wait(agent.URL_PATTERN.findall(reply)) == {url: "uploaded" for url in agent.URL_PATTERN.findall(reply)}
+
+
+def test_full_audio_link_is_pending_until_the_story_fails(tts, monkeypatch):
+    monkeypatch.setattr(agent, "TTS_EARLY_FIRST_CHUNK", True)
+    reply = agent.generate_audio_from_text(story("Failing story") + FAILING_SENTENCE, "en-IN", "en-IN-Wavenet-A", "LINEAR16")
+    first_url, full_url = agent.URL_PATTERN.findall(reply)
+
+    assert agent.ARTIFACT_UPLOADS.status(full_url) == "pending"
+    tts.release.set()
+    assert agent.ARTIFACT_UPLOADS.wait([full_url]) == {full_url: "failed"}
+
+    answer = LlmResponse(content=types.Content(role="model", parts=[types.Part(text=f"Listen here: {first_url} and later {full_url}")]))
+    held = asyncio.run(agent.ARTIFACT_UPLOADS.after_model(None, answer))
+    assert "could not be saved: " + full_url in held.content.parts[-1].text
+    assert first_url not in held.content.parts[-1].text
+
+
+def test_repeat_request_joins_the_story_still_synthesizing(tts, monkeypatch):
+    monkeypatch.setattr(agent, "TTS_EARLY_FIRST_CHUNK", True)
+    stories = []
+    finish_story = agent._finish_story
+    monkeypatch.setattr(agent, "_finish_story", lambda *args: stories.append(args) or finish_story(*args))
+    text = story("Repeated story") + FAILING_SENTENCE
+    first_reply = agent.generate_audio_from_text(text, "en-IN", "en-IN-Wavenet-A", "LINEAR16")
+    full_url = agent.URL_PATTERN.findall(first_reply)[-1]
+
+    repeat_reply = agent.generate_audio_from_text(text, "en-IN", "en-IN-Wavenet-A", "LINEAR16")
+
+    assert agent.URL_PATTERN.findall(repeat_reply) == [full_url]
+    assert "still being created" in repeat_reply
+    assert len(stories) == 1
+    tts.release.set()
+    assert agent.ARTIFACT_UPLOADS.wait([full_url]) == {full_url: "failed"}
+
+
+def test_slow_first_chunk_returns_the_full_audio_link(tts, monkeypatch):
+    monkeypatch.setattr(agent, "TTS_EARLY_FIRST_CHUNK", True)
+    monkeypatch.setattr(agent, "TTS_FIRST_CHUNK_TIMEOUT_SECONDS", 0.2)
+    reply = agent.generate_audio_from_text(f"{SLOW_SENTENCE} " + story("Slow story"), "en-IN", "en-IN-Wavenet-A", "LINEAR16")
+
+    [full_url] = agent.URL_PATTERN.findall(reply)
+    assert "still being created" in reply
+    tts.release.set()
+    assert agent.ARTIFACT_UPLOADS.wait([full_url]) == {full_url: "uploaded"}
+
+
+def test_audio_already_in_the_bucket_is_not_synthesized_again(tts, monkeypatch):
+    text = story("Stored story")
+    key, output_filename, _ = agent._tts_object(text, "en-IN", "en-IN-Wavenet-A", "LINEAR16")
+    store = agent.CLIENTS.get("artifact_store")
+    stored_url = store.upload_bytes(agent.AUDIO_BUCKET_NAME, output_filename, b"RIFF", "audio/wav")
+    monkeypatch.setattr(agent, "_synthesize_fast", lambda *args: pytest.fail("synthesized an object that already exists"))
+
+    reply = agent.generate_audio_from_text(text, "en-IN", "en-IN-Wavenet-A", "LINEAR16")
+
+    assert agent.URL_PATTERN.findall(reply) == [stored_url]
+    assert agent.TTS_AUDIO_CACHE.get(key)["public_url"] == stored_url
+
+
+def test_three_argument_callers_still_get_wav(tts):
+    reply = agent.generate_audio_from_text("A short story about a kite.", "en-IN", "en-IN-Wavenet-A")
+
+    [url] = agent.URL_PATTERN.findall(reply)
+    assert url.endswith(".wav")
+    assert agent.ARTIFACT_UPLOADS.wait([url]) == {url: "uploaded"}
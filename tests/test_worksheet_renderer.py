@@ -0,0 +1,47 @@
+import pytest
+
+import agent
+
+LESSON_PLAN = """**Weekly Lesson Plan: Science - The Water Cycle**
+
+**Day 1: Introduction to Evaporation**
+*   **Objective:** Students can explain what happens to water when it is heated.
+*   **Main Activity (20-25 mins):** Leave a wet cloth in the sun and observe it.
+
+**Day 2: Clouds and Condensation**
+- **Objective:** Students can describe how clouds form.
+"""
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = agent.LocalArtifactStore(str(tmp_path))
+    agent.CLIENTS.override("artifact_store", store)
+    yield store
+    agent.CLIENTS.reset("artifact_store")
+
+
+def test_plans_get_a_title_sections_and_bullets():
+    tokens = [token for token, _ in agent.WORKSHEET_RENDERER.tokenize(LESSON_PLAN, kind="lesson_plan")]
+
+    assert tokens == ["title", "blank", "section", "bullet", "bullet", "blank", "section", "bullet"]
+
+
+def test_plan_kinds_use_their_own_accent():
+    renderer = agent.WORKSHEET_RENDERER
+    titles = {kind: renderer.flowables(LESSON_PLAN, kind)[0].style for kind in renderer.KINDS}
+
+    assert titles["worksheet"].name == "TitleStyle"
+    assert titles["lesson_plan"].name == "lesson_plan.TitleStyle"
+    assert titles["game_plan"].name == "game_plan.TitleStyle"
+    assert len({style.textColor.hexval() for style in titles.values()}) == 3
+
+
+def test_generate_plan_pdf_uploads_a_pdf(store):
+    reply = agent.generate_plan_pdf(LESSON_PLAN, "lesson_plan")
+
+    [url] = agent.URL_PATTERN.findall(reply)
+    assert agent.ARTIFACT_UPLOADS.wait([url]) == {url: "uploaded"}
+    with open(url[len("file://"):], "rb") as f:
+        assert f.read(5) == b"%PDF-"
+    assert "Unsupported plan kind" in agent.generate_plan_pdf(LESSON_PLAN, "worksheet")